@@ -1,12 +1,12 @@
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 import streamlit as st 
 import streamlit_authenticator as stauth
 import funcoes
-from funcoes import ocr_space_api, formatar_mes_em_portugues
-import os, re, base64, yaml, pickle, unicodedata
+from funcoes import formatar_mes_em_portugues
+import os, re, base64, yaml, pickle, time
 from datetime import datetime
-import fitz # PyMuPDF
 from collections import defaultdict
 from googleapiclient.discovery import build
 from collections import defaultdict
@@ -75,8 +75,16 @@ DETAILED_VARIABLE_EXPENSE_CATEGORIES = ['Água (venc. Dia 10)', 'Luz  (venc. Dia
 ORIGINAL_EXTRA_EXPENSE_CATEGORIES = ['Obras', 'Consertos', 'Outros']
 UPDATED_EXTRA_EXPENSE_CATEGORIES = ['Obras', 'Consertos e Outros']
 
+# Aba usada para as cotas quando nenhuma outra é escolhida
+ABA_COTAS_PADRAO = 'Fluxo de caixa 2026'
+
 
 # --- Carregamento de Dados Iniciais ---
+def _extract_month_number(value):
+    """Extrai o número do mês de valores como 'Janeiro/2024', 'Março/2024' ou datas (ver funcoes.numero_do_mes)."""
+    return funcoes.numero_do_mes(value)
+
+
 @st.cache_data
 def load_moradores_mapping(path):
     """Carrega o mapeamento de nomes de moradores para apartamentos de um arquivo YAML."""
@@ -87,6 +95,29 @@ def load_moradores_mapping(path):
         st.error(f"Não foi possível carregar o arquivo de mapeamento de moradores: {e}")
         return {}
 
+def condominio_atual():
+    """Configuração do condomínio selecionado na barra lateral (planilha, moradores, pasta do Drive, livro-caixa)."""
+    registro = funcoes.load_registro_condominios()
+    condominio_id = st.session_state.get('condominio')
+    if condominio_id not in registro:
+        condominio_id = next(iter(registro))
+    return dict(registro[condominio_id])
+
+
+def pasta_drive_configurada():
+    """
+    Verifica se o condomínio selecionado tem pasta própria no Google Drive. Sem ela, mostra um erro:
+    os comprovantes não podem ir para (nem ser lidos da) pasta de outro condomínio.
+    """
+    condominio = condominio_atual()
+    if condominio['drive_folder_id']:
+        return True
+    st.error(
+        f"O condomínio '{condominio['nome']}' não tem pasta do Google Drive configurada "
+        "('drive_folder_id' em condominios.yaml). O envio e a visualização de comprovantes estão desativados."
+    )
+    return False
+
 # --- Configuração da Autenticação ---
 
 # Tenta carregar as credenciais do Streamlit Secrets (para deploy na nuvem)
@@ -111,88 +142,18 @@ authenticator = stauth.Authenticate(
 )
 
 
-def _extract_month_number(value):
-    """Extrai o número do mês de valores como 'Janeiro/2024', 'Março/2024' ou datas."""
-    if pd.isna(value):
-        return None
-
-    if isinstance(value, datetime):
-        return value.month
-
-    text = str(value).strip()
-    if not text:
-        return None
-
-    normalized_text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
-
-    month_aliases = {
-        'janeiro': 1, 'jan': 1,
-        'fevereiro': 2, 'fev': 2,
-        'marco': 3, 'mar': 3,
-        'abril': 4, 'abr': 4,
-        'maio': 5, 'mai': 5,
-        'junho': 6, 'jun': 6,
-        'julho': 7, 'jul': 7,
-        'agosto': 8, 'ago': 8,
-        'setembro': 9, 'set': 9,
-        'outubro': 10, 'out': 10,
-        'novembro': 11, 'nov': 11,
-        'dezembro': 12, 'dez': 12,
-    }
-
-    for alias, month_number in month_aliases.items():
-        if alias in normalized_text:
-            return month_number
-
-    try:
-        parsed_date = pd.to_datetime(text, errors='coerce')
-        if pd.notna(parsed_date):
-            return parsed_date.month
-    except Exception:
-        return None
-
-    return None
-
-
 @st.cache_data
-def load_cotas_condominio_data(excel_master_path='planilhas/Contabilidade Condominio.xlsx', sheet_name_cotas='Fluxo de caixa 2026'):
-    """Carrega e prepara os dados da aba de cotas para o gráfico por apartamento."""
-    if sheet_name_cotas == 'Fluxo de caixa 2026':
-        df_sheet = pd.read_excel(excel_master_path, sheet_name=sheet_name_cotas, header=None)
-        title_row = df_sheet.index[df_sheet.iloc[:, 0].astype(str).str.contains('Creditos / Debitos AP', case=False, na=False)].tolist()
-
-        if title_row:
-            title_idx = title_row[0]
-            month_row_idx = df_sheet.index[df_sheet.iloc[:, 0].astype(str).str.strip().eq('Mês')].tolist()
-            month_row_idx = month_row_idx[0] if month_row_idx else title_idx
-            month_labels = [str(value) for value in df_sheet.iloc[month_row_idx, 1:] if pd.notna(value)]
-
-            if not month_labels:
-                month_labels = [f'Mês {i + 1}' for i in range(6)]
-
-            data_rows = []
-            for row_idx in range(title_idx + 1, len(df_sheet)):
-                apartment = df_sheet.iloc[row_idx, 0]
-                if pd.isna(apartment):
-                    continue
-
-                apartment_name = str(apartment).strip()
-                if not apartment_name or apartment_name.startswith('SALDO') or apartment_name.startswith('RECEITAS'):
-                    continue
-
-                values = df_sheet.iloc[row_idx, 1:1 + len(month_labels)].tolist()
-                for month_label, value in zip(month_labels, values):
-                    if pd.notna(value):
-                        data_rows.append({'Apartamento': apartment_name, 'Mês Referência': month_label, 'Valor Pago': value})
-
-            if data_rows:
-                df_cotas = pd.DataFrame(data_rows)
-                df_cotas['Valor Pago'] = pd.to_numeric(df_cotas['Valor Pago'], errors='coerce').fillna(0)
-                df_cotas['month_num'] = df_cotas['Mês Referência'].apply(_extract_month_number)
-
-                df_cotas_raw = df_cotas.pivot(index='Apartamento', columns='Mês Referência', values='Valor Pago').fillna(0)
-                df_cotas_raw.index.name = 'Apartamento'
-                return df_cotas_raw, df_cotas
+def load_cotas_condominio_data(excel_master_path='planilhas/Contabilidade Condominio.xlsx', sheet_name_cotas=ABA_COTAS_PADRAO, impressao=None):
+    """
+    Carrega e prepara os dados da aba de cotas para o gráfico por apartamento.
+    'impressao' (impressão digital da aba) faz parte da chave do cache: a aba só é relida se mudou.
+    """
+    # Abas de fluxo de caixa trazem o bloco 'Creditos / Debitos AP'
+    df_cotas = funcoes.ler_bloco_cotas(excel_master_path, sheet_name_cotas)
+    if not df_cotas.empty:
+        df_cotas_raw = df_cotas.pivot(index='Apartamento', columns='Mês Referência', values='Valor Pago').fillna(0)
+        df_cotas_raw.index.name = 'Apartamento'
+        return df_cotas_raw, df_cotas
 
     df_cotas_raw = pd.read_excel(excel_master_path, sheet_name=sheet_name_cotas, skiprows=3, index_col=0, header=0)
     df_cotas_raw = df_cotas_raw.dropna(how='all').dropna(axis=1, how='all')
@@ -265,28 +226,22 @@ def render_fluxo_caixa_page():
     Renderiza uma página para visualizar as tabelas de dados do Fluxo de Caixa.
     """
     st.title("Visualização de Dados: Fluxo de Caixa")
-    excel_master_path = 'planilhas/Contabilidade Condominio.xlsx'
+    excel_master_path = condominio_atual()['planilha']
 
     try:
-        xls = pd.ExcelFile(excel_master_path)
-        sheet_names = xls.sheet_names
-        year_pattern = re.compile(r'(\d{4})')
-
-        for sheet in sheet_names:
-            match = year_pattern.search(sheet)
-            if match and "fluxo de caixa" in sheet.lower():
-                with st.expander(f"Dados da Planilha: {sheet}"):
-                    # Carrega a planilha pulando as linhas de cabeçalho
-                    df_full_raw = pd.read_excel(excel_master_path, sheet_name=sheet, skiprows=4, index_col=0)
-                    
-                    # Cria um grupo para cada bloco de linhas separado por uma linha nula
-                    # Uma linha nula no índice indica a separação
-                    group_ids = (df_full_raw.index.isna()).cumsum()
-                    
-                    # Agrupa por esses IDs e exibe cada grupo como uma tabela separada
-                    for _, group_df in df_full_raw.groupby(group_ids):
-                        # Remove a linha nula (se houver) e aplica o estilo
-                        st.dataframe(style_dataframe(group_df.dropna(how='all').fillna(0)))
+        # Abre a planilha uma vez só e lê a faixa usada de todas as abas de fluxo de caixa
+        for sheet, _, meses, categorias, valores in funcoes.ler_faixas_planilha(excel_master_path):
+            with st.expander(f"Dados da Planilha: {sheet}"):
+                df_full_raw = pd.DataFrame(valores, index=pd.Index(categorias, name='Mês'), columns=meses)
+                
+                # Cria um grupo para cada bloco de linhas separado por uma linha nula
+                # Uma linha nula no índice indica a separação
+                group_ids = (df_full_raw.index.isna()).cumsum()
+                
+                # Agrupa por esses IDs e exibe cada grupo como uma tabela separada
+                for _, group_df in df_full_raw.groupby(group_ids):
+                    # Remove a linha nula (se houver) e aplica o estilo
+                    st.dataframe(style_dataframe(group_df.dropna(how='all').fillna(0)))
 
     except FileNotFoundError:
         st.error(f"Arquivo mestre não encontrado em: '{excel_master_path}'")
@@ -343,6 +298,18 @@ def render_fluxo_caixa_page():
 
 def render_visualizar_comprovantes_google_drive():
     st.title("Visualizar Comprovantes")
+    if not pasta_drive_configurada():
+        return
+
+    # Busca no índice local (texto extraído dos comprovantes): não lista o Drive nem refaz o OCR
+    termos = st.text_input(
+        "🔎 Buscar comprovantes",
+        placeholder="Nome do pagador, valor (150,00) ou data (05/02/2026)",
+        key="busca_comprovantes"
+    )
+    if termos.strip():
+        render_resultados_busca(termos, condominio_atual()['indice'])
+        return
 
     # Reconstrói credenciais
     token_bytes = base64.b64decode(st.secrets["google_drive"]["token_b64"])
@@ -350,17 +317,18 @@ def render_visualizar_comprovantes_google_drive():
     service = build('drive', 'v3', credentials=creds)
 
     # ID da pasta onde estão os comprovantes
-    folder_id = "1yAIs75wbsUrP8RqwLR_xqko11IpSHZEQ"
+    folder_id = condominio_atual()['drive_folder_id']
 
-    # Busca arquivos na pasta
-    query = f"'{folder_id}' in parents and trashed = false"
-    results = service.files().list(q=query, fields="files(id, name, mimeType, webViewLink)").execute()
-    arquivos = results.get("files", [])
+    # Busca arquivos na pasta (todas as páginas da listagem)
+    arquivos = funcoes.listar_arquivos_drive(service, folder_id)
 
     if not arquivos:
         st.info("Não há comprovantes disponíveis no Google Drive.")
         return
 
+    if usuario_e_admin():
+        render_indexacao_drive(service, arquivos)
+
     # Agrupa por mês com base no nome
     arquivos_por_mes = defaultdict(list)
     for file in arquivos:
@@ -399,9 +367,103 @@ def render_visualizar_comprovantes_google_drive():
 
 
 
+def render_resultados_busca(termos, indice_path):
+    """Resultados da busca no índice de comprovantes, dos mais relevantes aos menos."""
+    inicio = time.perf_counter()
+    resultados = funcoes.buscar_comprovantes(termos, indice_path=indice_path)
+    st.caption(f"{len(resultados)} comprovante(s) encontrado(s) em {(time.perf_counter() - inicio) * 1000:.0f} ms.")
+    if resultados.empty:
+        st.info("Nenhum comprovante encontrado. Comprovantes antigos do Drive aparecem aqui depois de indexados.")
+        return
+
+    for resultado in resultados.to_dict('records'):
+        detalhes = [
+            datetime.strptime(resultado['data_pagamento'], '%Y-%m-%d').strftime('%d/%m/%Y') if resultado['data_pagamento'] else None,
+            funcoes.format_currency_brl(resultado['valor']) if pd.notna(resultado['valor']) else None,
+            f"{resultado['morador']} (Apto: {resultado['apartamento']})" if resultado['morador'] else None,
+            resultado['categoria'],
+        ]
+        st.markdown(f"**📁 {resultado['arquivo']}** — " + " · ".join(d for d in detalhes if d))
+        if resultado['trecho']:
+            st.caption(resultado['trecho'].replace('\n', ' '))
+        if resultado['link']:
+            st.markdown(f"[🔗 Abrir no Google Drive]({resultado['link']})")
+
+
+def render_indexacao_drive(service, arquivos):
+    """Indexa para a busca os comprovantes que já estavam no Drive antes do índice existir (administradores)."""
+    indice_path = condominio_atual()['indice']
+    pendentes = len(funcoes.arquivos_drive_pendentes(arquivos, indice_path))
+    if not pendentes:
+        return
+    with st.expander(f"🗂️ Índice de busca: {pendentes} comprovante(s) do Drive ainda não indexado(s)"):
+        st.caption("Baixa cada arquivo uma vez e extrai o texto (o OCR só roda para arquivos que nunca passaram por ele).")
+        if st.button("Indexar comprovantes do Drive", key="indexar_drive"):
+            barra = st.progress(0.0)
+            indexados, erros = funcoes.indexar_arquivos_drive(
+                arquivos,
+                lambda file_id: funcoes.baixar_arquivo_drive(service, file_id),
+                load_moradores_mapping(condominio_atual()['moradores']),
+                indice_path=indice_path,
+                progresso=lambda feitos, total: barra.progress(feitos / total, text=f"{feitos}/{total}")
+            )
+            st.success(f"{indexados} comprovante(s) indexado(s).")
+            for erro in erros:
+                st.error(f"Não foi possível indexar {erro}")
+
+
 def render_upload_page():
     st.title("Upload e Análise de Comprovantes")
+    if not pasta_drive_configurada():
+        return
+
+    modo = st.radio("Modo de envio", ["Comprovante único", "Vários comprovantes (lote)"], horizontal=True)
+    if modo == "Vários comprovantes (lote)":
+        render_upload_lote()
+    else:
+        render_upload_unico()
+    render_status_uploads()
+
+
+def preparar_uploads_sessao(chave, uploaded_files, moradores_map):
+    """
+    Registros compactos (ver funcoes.registrar_upload) dos arquivos do uploader, guardados na sessão.
+    Cada arquivo é validado e extraído só na primeira vez que aparece; os registros de arquivos
+    retirados do uploader são descartados (com a cópia temporária em disco, se houver).
+    """
+    uploads = st.session_state.setdefault(chave, {})
+    ids = {f"{f.file_id}:{condominio_atual()['moradores']}": f for f in uploaded_files}
+    for id_upload in list(uploads):
+        if id_upload not in ids:
+            funcoes.descartar_upload(uploads.pop(id_upload))
+        else:
+            funcoes.manter_upload(uploads[id_upload])
+
+    novos = []
+    for id_upload, arquivo in ids.items():
+        if id_upload in uploads:
+            continue
+        try:
+            funcoes.validar_tamanho_upload(arquivo.name, arquivo.size)
+            novos.append((id_upload, arquivo.name, arquivo.getvalue()))
+        except ValueError as e:
+            uploads[id_upload] = {'nome': arquivo.name, 'erro': str(e)}
+
+    if novos:
+        with st.spinner(f"Extraindo dados de {len(novos)} comprovante(s)..."):
+            resultados = funcoes.extrair_lote(
+                [(nome, nome.split('.')[-1].lower(), file_bytes) for _, nome, file_bytes in novos], moradores_map
+            )
+        for (id_upload, nome, file_bytes), resultado in zip(novos, resultados):
+            if 'erro' in resultado:
+                uploads[id_upload] = {'nome': nome, 'erro': f"Não foi possível extrair os dados de {resultado['erro']}"}
+            else:
+                uploads[id_upload] = funcoes.registrar_upload(nome, file_bytes, resultado)
+
+    return [uploads[id_upload] for id_upload in ids]
+
 
+def render_upload_unico():
     uploaded_file = st.file_uploader(
         "Escolha um arquivo PDF ou JPG",
         type=["pdf", "jpg", "jpeg"],
@@ -409,53 +471,38 @@ def render_upload_page():
         help="Faça o upload de um comprovante de depósito ou pagamento."
     )
 
+    moradores_map = load_moradores_mapping(condominio_atual()['moradores'])
+    # Extraído uma única vez por arquivo: os reruns do formulário usam o registro da sessão
+    uploads = preparar_uploads_sessao('uploads_unico', [uploaded_file] if uploaded_file is not None else [], moradores_map)
+
     if uploaded_file is not None:
         try:
-            # Gera nome seguro e caminho de destino (mas não salva ainda)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            safe_filename = "".join(c for c in uploaded_file.name if c.isalnum() or c in ('.', '_')).rstrip()
-            new_filename = f"{timestamp}_{safe_filename}"
-            # comprovantes_dir = "comprovantes"
-            # os.makedirs(comprovantes_dir, exist_ok=True)
-            # save_path = os.path.join(comprovantes_dir, new_filename)
-            save_path = new_filename  # Salva na raiz temporariamente, será movido após confirmação
-
-            # --- Processamento do conteúdo (OCR ou PDF) ---
-            file_ext = uploaded_file.name.split('.')[-1].lower()
-            file_bytes = uploaded_file.getvalue()  # Evita múltiplas leituras
-            text = ""
-
-            if file_ext == "pdf":
-                pdf_document = fitz.open(stream=file_bytes, filetype="pdf")
-                for page_num in range(len(pdf_document)):
-                    page = pdf_document.load_page(page_num)
-                    text += page.get_text()
-            elif file_ext in ["jpg", "jpeg"]:
-                temp_path = "temp_ocr.jpg"
-                with open(temp_path, "wb") as temp_file:
-                    temp_file.write(file_bytes)
-                text = ocr_space_api(temp_path)
-                os.remove(temp_path)
+            registro = uploads[0]
+            if 'erro' in registro:
+                st.error(registro['erro'])
+                return
 
             st.subheader("Texto Extraído")
-            st.text_area("Conteúdo", text, height=300)
-
-            # --- Extração de dados via regex ---
-            padrao_valor = r'R\$\s*(\d{1,3}(?:\.\d{3})*,\d{2})'
-            padrao_data = r'\b(\d{2}/\d{2}/\d{4})\b'
-
-            valores_encontrados = re.findall(padrao_valor, text)
-            datas_encontradas = re.findall(padrao_data, text)
-
-            moradores_map = load_moradores_mapping('moradores.yaml')
-            apartamento_encontrado = None
-            nome_encontrado = None
-
-            for nome, apto in moradores_map.items():
-                if re.search(nome, text, re.IGNORECASE):
-                    apartamento_encontrado = apto
-                    nome_encontrado = nome
-                    break
+            st.text_area("Conteúdo", registro['previa'], height=300)
+            if registro['caracteres'] > len(registro['previa']):
+                st.caption(f"Prévia do texto extraído ({registro['caracteres']} caracteres no total).")
+
+            # --- Dados extraídos (candidatos já vêm ordenados pela pontuação) ---
+            campos = registro['campos']
+            valores_encontrados = campos['valores']
+            datas_encontradas = campos['datas']
+            apartamento_encontrado = campos['apartamento']
+            nome_encontrado = campos['nome']
+
+            # --- Detecção de comprovante duplicado (antes de chegar ao Drive) ---
+            upload_existente = funcoes.buscar_upload_por_hash(
+                registro['sha256'], condominio_atual()['drive_folder_id'], condominio_atual()['ledger']
+            )
+            if upload_existente:
+                st.warning(
+                    f"Este comprovante já foi enviado em {upload_existente['criado_em']} "
+                    f"como '{upload_existente['nome_arquivo']}'."
+                )
 
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -463,8 +510,7 @@ def render_upload_page():
                 st.write(valores_encontrados[0] if valores_encontrados else "Nenhum valor encontrado.")
             with col2:
                 st.write("**Datas:**")
-                unique_datas = list(set(datas_encontradas))
-                st.write(unique_datas[0] if unique_datas else "Nenhuma data encontrada.")
+                st.write(datas_encontradas[0] if datas_encontradas else "Nenhuma data encontrada.")
             with col3:
                 st.write("**Morador Identificado:**")
                 st.write(f"{nome_encontrado} (Apto: {apartamento_encontrado})" if nome_encontrado else "Nenhum morador identificado.")
@@ -477,7 +523,18 @@ def render_upload_page():
                 with st.form("lancamento_form"):
                     st.write("Por favor, confirme os dados extraídos e classifique a transação.")
                     valor_selecionado = st.selectbox("Valor da Transação (R$)", options=valores_encontrados)
-                    data_selecionada = st.selectbox("Data da Transação", options=unique_datas)
+                    data_selecionada = st.selectbox("Data da Transação", options=datas_encontradas)
+
+                    # Mais de um morador citado no comprovante: deixa o usuário escolher o pagante
+                    candidatos_moradores = campos['candidatos']['moradores']
+                    if len(candidatos_moradores) > 1:
+                        morador_selecionado = st.selectbox(
+                            "Morador (pagante)",
+                            options=candidatos_moradores,
+                            format_func=lambda c: f"{c['nome']} (Apto: {c['apartamento']})"
+                        )
+                        nome_encontrado = morador_selecionado['nome']
+                        apartamento_encontrado = morador_selecionado['apartamento']
 
                     username = st.session_state.get("username")
                     if username == 'felona117':
@@ -487,39 +544,243 @@ def render_upload_page():
                         todas_categorias = DETAILED_REVENUE_CATEGORIES + DETAILED_VARIABLE_EXPENSE_CATEGORIES + ORIGINAL_EXTRA_EXPENSE_CATEGORIES
                         categoria_selecionada = st.selectbox("Categoria", options=todas_categorias)
 
+                    enviar_duplicado = False
+                    if upload_existente:
+                        enviar_duplicado = st.checkbox("Enviar mesmo assim (comprovante duplicado)")
+
                     col_btn, col_msg = st.columns([1, 2])
                     with col_btn:
                         submitted = st.form_submit_button("Lançar no Sistema")
                     with col_msg:
                         st.info("Clique para confirmar e salvar o comprovante.")
 
-                    if submitted:
-                        with open(save_path, "wb") as f:
-                            f.write(file_bytes)
-
+                    if submitted and upload_existente and not enviar_duplicado:
+                        st.error("Comprovante duplicado não enviado. Marque a opção acima para enviar mesmo assim.")
+                    elif submitted:
+                        # Grava na outbox e no livro-caixa e devolve o controle na hora; o envio
+                        # ao Drive continua em segundo plano mesmo que a sessão seja encerrada.
                         try:
-                            link_drive = funcoes.upload_comprovante_google_drive(save_path, new_filename, folder_id="1yAIs75wbsUrP8RqwLR_xqko11IpSHZEQ")
-                            st.markdown(f"**Comprovante salvo em:** [Google Drive]({link_drive})")
-                            st.success(f"Comprovante '{uploaded_file.name}' salvo com sucesso!")
+                            job_id = funcoes.lancar_comprovante(
+                                funcoes.bytes_upload(registro),
+                                uploaded_file.name,
+                                folder_id=condominio_atual()['drive_folder_id'],
+                                ledger_path=condominio_atual()['ledger'],
+                                texto=funcoes.texto_upload(registro, moradores_map),
+                                indice_path=condominio_atual()['indice'],
+                                metadados={
+                                    'valor': valor_selecionado,
+                                    'data': data_selecionada,
+                                    'categoria': categoria_selecionada,
+                                    'morador': nome_encontrado,
+                                    'apartamento': apartamento_encontrado,
+                                    'usuario': username,
+                                }
+                            )
+                            st.session_state.setdefault('upload_jobs', []).append(job_id)
+                            st.success(f"Comprovante '{uploaded_file.name}' recebido! O envio ao Google Drive continua em segundo plano.")
                             st.info("Lançamento registrado.")
-                            os.remove(save_path)
-                        except Exception as erro_drive:
-                            st.error(f"Erro ao enviar para o Google Drive: {erro_drive}")
+                        except Exception as erro_outbox:
+                            st.error(f"Erro ao registrar o comprovante para envio: {erro_outbox}")
 
         except Exception as e:
             st.error(f"Ocorreu um erro ao processar o arquivo: {e}")
 
+
+def render_upload_lote():
+    """
+    Envio de vários comprovantes de uma vez: extrai todos em paralelo, mostra uma tabela
+    editável com os dados encontrados e agenda os envios ao Drive juntos (outbox).
+    """
+    uploaded_files = st.file_uploader(
+        "Escolha os comprovantes (PDF ou JPG)",
+        type=["pdf", "jpg", "jpeg"],
+        accept_multiple_files=True,
+        key="upload_lote",
+        help="Selecione todos os comprovantes do mês de uma vez."
+    )
+    moradores_map = load_moradores_mapping(condominio_atual()['moradores'])
+    # Só os arquivos novos no uploader são extraídos; os demais já estão na sessão
+    uploads = preparar_uploads_sessao('uploads_lote', uploaded_files or [], moradores_map)
+    if not uploads:
+        return
+
+    username = st.session_state.get("username")
+    todas_categorias = DETAILED_REVENUE_CATEGORIES + DETAILED_VARIABLE_EXPENSE_CATEGORIES + ORIGINAL_EXTRA_EXPENSE_CATEGORIES
+    categoria_padrao = 'Cotas Condominiais (Até dia 08)'
+
+    linhas, registros_validos = [], []
+    primeiro_no_lote = {}  # sha256 -> registro do primeiro arquivo do lote com esse conteúdo
+    for registro in uploads:
+        if 'erro' in registro:
+            st.error(registro['erro'])
+            continue
+        campos = registro['campos']
+        primeiro = primeiro_no_lote.setdefault(registro['sha256'], registro)
+        ja_enviado = funcoes.buscar_upload_por_hash(
+            registro['sha256'], condominio_atual()['drive_folder_id'], condominio_atual()['ledger']
+        )
+        if ja_enviado is not None:
+            situacao = "⚠️ Já enviado"
+        elif primeiro is not registro:
+            situacao = f"⚠️ Repetido no lote ({primeiro['nome']})"
+        else:
+            situacao = "Novo"
+        duplicado = situacao != "Novo"
+        linhas.append({
+            'Enviar': not duplicado,
+            'Arquivo': registro['nome'],
+            'Valor (R$)': campos['valores'][0] if campos['valores'] else '',
+            'Data': campos['datas'][0] if campos['datas'] else '',
+            'Morador': campos['nome'],
+            'Apartamento': campos['apartamento'],
+            'Categoria': categoria_padrao,
+            'Situação': situacao,
+        })
+        registros_validos.append(registro)
+
+    if not linhas:
+        return
+
+    st.subheader("Confirmar Lançamentos")
+    st.caption(
+        "Revise os dados extraídos. Comprovantes já enviados ou repetidos no lote vêm desmarcados. "
+        "O apartamento é o do morador escolhido (moradores.yaml)."
+    )
+    with st.form("lancamento_lote_form"):
+        df_editado = st.data_editor(
+            pd.DataFrame(linhas),
+            hide_index=True,
+            disabled=['Arquivo', 'Apartamento', 'Situação'] + (['Categoria'] if username == 'felona117' else []),
+            column_config={
+                'Enviar': st.column_config.CheckboxColumn("Enviar"),
+                'Morador': st.column_config.SelectboxColumn("Morador", options=list(moradores_map.keys())),
+                'Categoria': st.column_config.SelectboxColumn("Categoria", options=todas_categorias, required=True),
+            },
+            key=f"lote_editor_{'_'.join(r['sha256'][:8] for r in registros_validos)}"
+        )
+        submitted = st.form_submit_button("Lançar Todos no Sistema")
+
+    if submitted:
+        # A tabela tem uma linha por arquivo válido, na mesma ordem
+        enviados = 0
+        for registro, linha in zip(registros_validos, df_editado.to_dict('records')):
+            if not linha['Enviar']:
+                continue
+            try:
+                job_id = funcoes.lancar_comprovante(
+                    funcoes.bytes_upload(registro),
+                    linha['Arquivo'],
+                    folder_id=condominio_atual()['drive_folder_id'],
+                    ledger_path=condominio_atual()['ledger'],
+                    texto=funcoes.texto_upload(registro, moradores_map),
+                    indice_path=condominio_atual()['indice'],
+                    metadados={
+                        'valor': linha['Valor (R$)'],
+                        'data': linha['Data'],
+                        'categoria': linha['Categoria'],
+                        'morador': linha['Morador'],
+                        # O morador pode ter sido corrigido na tabela: o apartamento sai do mapeamento
+                        'apartamento': moradores_map.get(linha['Morador']),
+                        'usuario': username,
+                    }
+                )
+            except Exception as erro_outbox:
+                st.error(f"Erro ao registrar '{linha['Arquivo']}' para envio: {erro_outbox}")
+                continue
+            st.session_state.setdefault('upload_jobs', []).append(job_id)
+            enviados += 1
+        if enviados:
+            st.success(f"{enviados} lançamento(s) registrado(s)! Os envios ao Google Drive continuam em segundo plano.")
+
+
+def _jobs_upload_sessao():
+    """Registros (outbox) dos envios ao Drive feitos nesta sessão, do mais recente ao mais antigo."""
+    jobs = (funcoes.status_upload(job_id) for job_id in reversed(st.session_state.get('upload_jobs', [])))
+    return [job for job in jobs if job is not None]
+
+
+def _envio_em_andamento(jobs):
+    return any(job['status'] in ('pendente', 'enviando') for job in jobs)
+
+
+def render_status_uploads():
+    """Mostra o andamento dos envios ao Drive feitos nesta sessão."""
+    jobs = _jobs_upload_sessao()
+    if not jobs:
+        return
+
+    st.markdown("---")
+    st.subheader("Envios ao Google Drive")
+    # O fragmento (que se repete a cada 3 s) só é montado enquanto há envios na fila ou em andamento
+    if _envio_em_andamento(jobs):
+        render_andamento_uploads()
+    else:
+        render_lista_uploads(jobs)
+
+
+@st.fragment(run_every=3)
+def render_andamento_uploads():
+    """Atualiza a lista de envios sozinho; quando todos terminam, recarrega a página e deixa de ser montado."""
+    jobs = _jobs_upload_sessao()
+    if not _envio_em_andamento(jobs):
+        st.rerun()
+    render_lista_uploads(jobs)
+
+
+def render_lista_uploads(jobs):
+    status_labels = {
+        'pendente': "⏳ Na fila",
+        'enviando': "📤 Enviando",
+        'concluido': "✅ Concluído",
+        'erro': "❌ Erro",
+    }
+    for job in jobs:
+        col_nome, col_status = st.columns([2, 3])
+        with col_nome:
+            st.write(f"**{job['nome_arquivo']}**")
+        with col_status:
+            st.write(f"{status_labels.get(job['status'], job['status'])} (tentativa {job['tentativas']})")
+            if job['status'] == 'concluido':
+                st.markdown(f"[🔗 Abrir no Google Drive]({job['link']})")
+            elif job['status'] == 'erro':
+                st.caption(job['erro'])
+                if st.button("Tentar novamente", key=f"reenviar_{job['id']}"):
+                    funcoes.reenviar_upload(job['id'])
+                    st.rerun()  # Volta a acompanhar o envio
+            elif job['etapa']:
+                st.caption(job['etapa'])
+
+
+def abas_com_cotas(excel_master_path, impressoes):
+    """
+    Abas de fluxo de caixa que têm o bloco 'Creditos / Debitos AP' (da mais recente para a mais antiga)
+    e a tabela longa com as cotas de todas elas.
+    """
+    df_cotas_todos = funcoes.load_cotas_todos_anos(excel_master_path, impressoes)
+    anos_com_cotas = set(df_cotas_todos['Ano'].dropna().astype(int))
+    abas = sorted(funcoes.abas_fluxo_de_caixa(excel_master_path), key=lambda aba: aba[1], reverse=True)
+    return [sheet for sheet, ano in abas if ano in anos_com_cotas], df_cotas_todos
+
+
 def render_cotas_dashboard():
     """
     Renderiza o dashboard de análise das cotas condominiais pagas.
     """
     st.title("Cotas do Condomínio")
 
-    excel_master_path = 'planilhas/Contabilidade Condominio.xlsx'
-    sheet_name_cotas = "Fluxo de caixa 2026"
+    excel_master_path = condominio_atual()['planilha']
+    sheet_name_cotas = ABA_COTAS_PADRAO
 
     try:
-        df_cotas_raw, df_cotas = load_cotas_condominio_data(excel_master_path, sheet_name_cotas)
+        # Cotas de todos os anos (abas lidas em paralelo); o seletor lista só os anos com o bloco de cotas
+        impressoes = funcoes.registrar_versao_planilha(excel_master_path)
+        abas_cotas, df_cotas_todos = abas_com_cotas(excel_master_path, impressoes)
+        if not abas_cotas:
+            st.info("Nenhuma aba de fluxo de caixa desta planilha tem o bloco 'Creditos / Debitos AP'.")
+            return
+        sheet_name_cotas = st.selectbox("Ano de referência:", options=abas_cotas)
+
+        df_cotas_raw, df_cotas = load_cotas_condominio_data(excel_master_path, sheet_name_cotas, impressoes.get(sheet_name_cotas))
 
         st.markdown("### Visão Geral dos Pagamentos")
         # Preenche valores nulos com 0 e aplica a formatação de moeda
@@ -570,11 +831,178 @@ def render_cotas_dashboard():
         else:
             st.info("Não há dados suficientes para gerar o gráfico por apartamento.")
 
+        ano_cotas = int(re.search(r'(\d{4})', sheet_name_cotas).group(1))
+        st.markdown("---")
+        st.subheader("Cotas Lançadas por Comprovante")
+        render_lancamentos_cotas(ano_cotas)
+
+        st.markdown("---")
+        st.subheader("Conciliação: Planilha x Comprovantes")
+        df_fluxo_ano = funcoes.load_and_process_data(excel_master_path, sheet_name_cotas, ano_cotas, impressoes.get(sheet_name_cotas))
+        cota_mensal = funcoes.cota_por_apartamento(df_fluxo_ano, df_cotas['Apartamento'].nunique())
+        render_conciliacao_cotas(df_cotas_todos, ano_cotas, cota_mensal)
+
+        st.markdown("---")
+        st.subheader("Inadimplência (todos os anos)")
+        render_inadimplencia(df_cotas_todos)
+
     except FileNotFoundError:
         st.error(f"Arquivo mestre não encontrado em: '{excel_master_path}'")
     except ValueError:
         st.error(f"Aba '{sheet_name_cotas}' não encontrada na planilha. Por favor, verifique o nome exato da aba.")
 
+def render_lancamentos_cotas(ano):
+    """Mostra, por apartamento e mês, as cotas confirmadas no livro-caixa (comprovantes)."""
+    df_lancamentos = funcoes.consultar_lancamentos(ano=ano, categoria='Cotas Condominiais (Até dia 08)', ledger_path=condominio_atual()['ledger'])
+    if df_lancamentos.empty:
+        st.info(f"Nenhuma cota de {ano} foi lançada pela página de comprovantes ainda.")
+        return
+
+    df_pivot = df_lancamentos.pivot_table(index='apartamento', columns='mes', values='valor', aggfunc='sum', fill_value=0)
+    df_pivot.columns = [formatar_mes_em_portugues(datetime(ano, mes, 1)) for mes in df_pivot.columns]
+    df_pivot.index.name = 'Apartamento'
+    st.dataframe(df_pivot.style.format(funcoes.format_currency_brl))
+
+def render_conciliacao_cotas(df_cotas_todos, ano, cota_mensal):
+    """
+    Compara os pagamentos implícitos na grade de saldos (variação do saldo + cota do mês)
+    com os comprovantes lançados, mês a mês.
+    """
+    df_lancamentos = funcoes.consultar_lancamentos(ano=ano, categoria='Cotas Condominiais (Até dia 08)', ledger_path=condominio_atual()['ledger'])
+    df_conciliacao = funcoes.conciliar_cotas(df_cotas_todos, df_lancamentos, ano, cota_mensal)
+    if df_conciliacao.empty:
+        st.info("Não há dados de cotas para conciliar.")
+        return
+
+    contagem = df_conciliacao['Situação'].value_counts()
+    situacoes = [
+        funcoes.CONCILIACAO_OK, funcoes.CONCILIACAO_SEM_COMPROVANTE, funcoes.CONCILIACAO_SEM_PLANILHA,
+        funcoes.CONCILIACAO_DIVERGENTE, funcoes.CONCILIACAO_DUPLICADO, funcoes.CONCILIACAO_SEM_SALDO_ANTERIOR,
+    ]
+    for coluna, situacao in zip(st.columns(len(situacoes)), situacoes):
+        with coluna:
+            st.metric(situacao, int(contagem.get(situacao, 0)))
+
+    st.caption("'Valor Planilha' é o pagamento implícito na grade: saldo do mês - saldo do mês anterior + cota do mês.")
+    df_exibicao = df_conciliacao.copy()
+    df_exibicao.insert(1, 'Mês', [formatar_mes_em_portugues(datetime(ano, mes, 1)) for mes in df_exibicao['month_num']])
+    if st.checkbox("Mostrar apenas pendências", value=True, key="conciliacao_pendencias"):
+        df_exibicao = df_exibicao[df_exibicao['Situação'] != funcoes.CONCILIACAO_OK]
+
+    if df_exibicao.empty:
+        st.success("Nenhuma pendência: planilha e comprovantes conferem.")
+        return
+    st.dataframe(
+        df_exibicao.drop(columns=['month_num']).style.format(
+            funcoes.format_currency_brl, subset=['Saldo', 'Valor Planilha', 'Valor Comprovantes', 'Diferença'], na_rep="-"
+        ),
+        hide_index=True
+    )
+
+def render_inadimplencia(df_cotas_todos):
+    """Situação atual de cada apartamento (débito, meses em atraso e faixa) e evolução do saldo."""
+    if df_cotas_todos.empty:
+        st.info("Não há dados de cotas para calcular a inadimplência.")
+        return
+
+    historico, resumo = funcoes.calcular_inadimplencia(df_cotas_todos)
+    st.dataframe(
+        resumo.style.format(funcoes.format_currency_brl, subset=['Saldo', 'Débito']),
+        hide_index=True
+    )
+
+    fig_saldo_ap = px.line(
+        historico,
+        x='sort_date',
+        y='Saldo',
+        color='Apartamento',
+        title='Saldo por Apartamento (crédito > 0, débito < 0)',
+        markers=True,
+        hover_data={'Mês Referência': True, 'Meses em Atraso': True, 'sort_date': False},
+        labels={'Saldo': 'Saldo (R$)', 'sort_date': 'Mês'}
+    )
+    fig_saldo_ap.add_hline(y=0, line_dash='dot', line_color='gray')
+    st.plotly_chart(fig_saldo_ap, use_container_width=True, config={'scrollZoom': True})
+
+@st.fragment
+def render_projecao_fluxo_caixa(df_historico):
+    """
+    Simula milhares de cenários do saldo futuro e mostra faixas de percentis.
+    Fragmento: mexer nos parâmetros só reexecuta esta seção, não o dashboard inteiro.
+    """
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        meses = st.slider("Horizonte (meses)", 3, 36, 12)
+        reajuste = st.slider("Reajuste da cota (%)", -20, 50, 0)
+    with col2:
+        inadimplencia = st.slider("Inadimplência esperada (%)", 0, 100, 0)
+        n_cenarios = st.select_slider("Cenários simulados", options=[1000, 5000, 10000, 20000], value=5000)
+    with col3:
+        custo_obras = st.number_input("Obra prevista (R$)", min_value=0.0, value=0.0, step=500.0)
+        mes_obras = st.slider("Mês da obra", 1, meses, 1)
+
+    n_apartamentos = len(set(load_moradores_mapping(condominio_atual()['moradores']).values())) or 4
+    projecao = funcoes.projetar_fluxo_caixa(
+        df_historico, meses=meses, n_cenarios=n_cenarios, reajuste_cota=reajuste / 100,
+        taxa_inadimplencia=inadimplencia / 100, custo_obras=custo_obras, mes_obras=mes_obras,
+        n_apartamentos=n_apartamentos, seed=0
+    )
+    if projecao.empty:
+        st.info("Não há histórico suficiente para projetar o fluxo de caixa.")
+        return
+
+    fig = go.Figure()
+    for inferior, superior, nome, opacidade in [('P5', 'P95', 'Faixa 5%-95%', 0.15), ('P25', 'P75', 'Faixa 25%-75%', 0.3)]:
+        fig.add_trace(go.Scatter(x=projecao['sort_date'], y=projecao[superior], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(
+            x=projecao['sort_date'], y=projecao[inferior], mode='lines', line=dict(width=0),
+            fill='tonexty', fillcolor=f'rgba(31, 119, 180, {opacidade})', name=nome
+        ))
+    fig.add_trace(go.Scatter(x=projecao['sort_date'], y=projecao['P50'], mode='lines+markers', name='Mediana', line=dict(width=3)))
+    fig.add_hline(y=0, line_dash='dot', line_color='red')
+    fig.update_layout(title='Saldo Projetado (percentis dos cenários)', xaxis_title='Mês', yaxis_title='Saldo (R$)')
+    st.plotly_chart(fig, use_container_width=True, config={'scrollZoom': False})
+
+    risco = projecao['Prob. Saldo Negativo'].max()
+    if risco > 0:
+        st.warning(f"No pior mês do horizonte, {risco:.0%} dos cenários terminam com o caixa negativo.")
+
+def usuario_e_admin():
+    """Indica se o usuário logado tem a role 'admin'."""
+    username = st.session_state.get("username")
+    return config_credentials['usernames'].get(username, {}).get('role', 'user') == 'admin'
+
+
+def render_validacao_planilha(excel_path):
+    """Relatório de validação da planilha (em cache por versão do arquivo), com aba, célula e motivo."""
+    relatorio = funcoes.load_validacao_planilha(excel_path, funcoes.versao_arquivo(excel_path))
+    if relatorio.empty:
+        return
+    with st.expander(f"⚠️ Validação da planilha: {len(relatorio)} problema(s) encontrado(s)"):
+        st.caption("Corrija as células abaixo na planilha; até lá elas são ignoradas ou lidas como 0,00.")
+        st.dataframe(relatorio, hide_index=True, use_container_width=True)
+
+
+def render_alteracoes_planilha(excel_path):
+    """Registro das células alteradas entre as versões da planilha (aba, categoria, mês, anterior → novo)."""
+    alteracoes = funcoes.listar_alteracoes_planilha(excel_path)
+    if alteracoes.empty:
+        return
+    ultima = alteracoes['Detectado em'].iloc[0]
+    recentes = (alteracoes['Detectado em'] == ultima).sum()
+    with st.expander(f"📝 Alterações na planilha: {recentes} célula(s) na última versão ({ultima[:16].replace('T', ' ')})"):
+        st.caption("Diferenças entre cada versão enviada da planilha e a anterior (mais recentes primeiro).")
+        st.dataframe(
+            alteracoes,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'Anterior': st.column_config.NumberColumn(format="R$ %.2f"),
+                'Novo': st.column_config.NumberColumn(format="R$ %.2f"),
+            }
+        )
+
+
 def render_full_dashboard():
     """
     Função que renderiza o dashboard completo para administradores.
@@ -583,22 +1011,17 @@ def render_full_dashboard():
     # --- Carregamento e Preparação dos Dados (somente após login) ---
     # Caminhos para os arquivos CSV
     # Aponta para o único arquivo Excel mestre
-    excel_master_path = 'planilhas/Contabilidade Condominio.xlsx'
+    excel_master_path = condominio_atual()['planilha']
 
     # --- Carregamento Dinâmico de Abas ---
     all_dfs = []
     try:
-        xls = pd.ExcelFile(excel_master_path)
-        sheet_names = xls.sheet_names
-        year_pattern = re.compile(r'(\d{4})') # Padrão para encontrar um ano de 4 dígitos
-
-        for sheet in sheet_names:
-            match = year_pattern.search(sheet)
-            if match and "fluxo de caixa" in sheet.lower():
-                year = int(match.group(1))
-                df = funcoes.load_and_process_data(excel_master_path, sheet, year)
-                if df is not None:
-                    all_dfs.append(df)
+        # Impressão digital de cada aba: versões novas da planilha só recarregam as abas que mudaram
+        impressoes = funcoes.registrar_versao_planilha(excel_master_path)
+        for sheet, year in funcoes.abas_fluxo_de_caixa(excel_master_path):
+            df = funcoes.load_and_process_data(excel_master_path, sheet, year, impressoes.get(sheet))
+            if df is not None:
+                all_dfs.append(df)
     except FileNotFoundError:
         st.error(f"Arquivo mestre não encontrado em: '{excel_master_path}'")
         st.stop()
@@ -627,6 +1050,11 @@ def render_full_dashboard():
     st.title("Dashboard Financeiro do Condomínio")
     st.markdown("Análise do fluxo de caixa ao longo dos anos.")
 
+    # Anomalias da planilha (células que seriam ignoradas ou lidas como 0,00), só para administradores
+    if usuario_e_admin():
+        render_validacao_planilha(excel_master_path)
+        render_alteracoes_planilha(excel_master_path)
+
     # --- Sidebar para Filtros ---
     st.sidebar.header("Filtros")
 
@@ -660,7 +1088,7 @@ def render_full_dashboard():
 
     # --- Botão de Download da Planilha Estática ---
     # ATENÇÃO: Substitua 'NOME_DA_SUA_PLANILHA.xlsx' pelo nome real do seu arquivo.
-    planilha_path = 'planilhas/Contabilidade Condominio.xlsx'
+    planilha_path = excel_master_path
 
     try:
         with open(planilha_path, "rb") as fp:
@@ -746,25 +1174,35 @@ def render_full_dashboard():
 
     st.markdown("---")
 
+    st.subheader("Projeção do Saldo do Caixa")
+    render_projecao_fluxo_caixa(filtered_df_for_plot)
+
+    st.markdown("---")
+
     st.subheader("Créditos / Débitos por Apartamento")
     try:
-        _, df_cotas = load_cotas_condominio_data()
-        df_cotas_plot = df_cotas.copy()
-        df_cotas_plot = df_cotas_plot.sort_values(by=['month_num', 'Mês Referência'], na_position='last')
-
-        if not df_cotas_plot.empty:
-            fig_ap = px.line(
-                df_cotas_plot,
-                x='Mês Referência',
-                y='Valor Pago',
-                color='Apartamento',
-                title='Histórico de Créditos / Débitos por Apartamento',
-                markers=True,
-                labels={'Valor Pago': 'Valor (R$)', 'Mês Referência': 'Mês'}
-            )
-            st.plotly_chart(fig_ap, use_container_width=True, config={'scrollZoom': True})
+        # Ano mais recente com o bloco de cotas (a planilha pode não ter a aba do ano corrente)
+        abas_cotas, _ = abas_com_cotas(excel_master_path, impressoes)
+        if not abas_cotas:
+            st.info("Nenhuma aba de fluxo de caixa desta planilha tem o bloco 'Creditos / Debitos AP'.")
         else:
-            st.info("Não há dados suficientes para gerar o gráfico de créditos/debitos por apartamento.")
+            _, df_cotas = load_cotas_condominio_data(excel_master_path, abas_cotas[0], impressoes.get(abas_cotas[0]))
+            df_cotas_plot = df_cotas.copy()
+            df_cotas_plot = df_cotas_plot.sort_values(by=['month_num', 'Mês Referência'], na_position='last')
+
+            if not df_cotas_plot.empty:
+                fig_ap = px.line(
+                    df_cotas_plot,
+                    x='Mês Referência',
+                    y='Valor Pago',
+                    color='Apartamento',
+                    title='Histórico de Créditos / Débitos por Apartamento',
+                    markers=True,
+                    labels={'Valor Pago': 'Valor (R$)', 'Mês Referência': 'Mês'}
+                )
+                st.plotly_chart(fig_ap, use_container_width=True, config={'scrollZoom': True})
+            else:
+                st.info("Não há dados suficientes para gerar o gráfico de créditos/debitos por apartamento.")
     except FileNotFoundError:
         st.warning("A planilha de cotas não foi encontrada para montar o gráfico por apartamento.")
 
@@ -826,6 +1264,103 @@ def render_full_dashboard():
     else:
         st.info("Nenhum dado disponível para o período selecionado para detalhamento.")
 
+    st.markdown("---")
+    st.subheader("Relatório Anual (Prestação de Contas)")
+    render_relatorio_anual(df_combined, excel_master_path)
+
+
+def render_relatorio_anual(df_combined, excel_master_path):
+    """
+    Exporta os cards, a evolução do saldo, o comparativo e o detalhe por categoria de um ano em PDF ou XLSX.
+    A geração roda no worker de relatórios; o arquivo fica em cache por (condomínio, planilha, versão, ano, formato).
+    """
+    col_ano, col_formato = st.columns(2)
+    with col_ano:
+        ano = st.selectbox("Ano do relatório:", options=sorted(df_combined['Ano'].unique(), reverse=True), key="relatorio_ano")
+    with col_formato:
+        formato = st.radio("Formato:", options=['PDF', 'XLSX'], horizontal=True, key="relatorio_formato")
+
+    caminho = funcoes.caminho_relatorio_anual(
+        excel_master_path, funcoes.versao_arquivo(excel_master_path), ano, formato.lower(),
+        condominio=condominio_atual()['nome']
+    )
+    if funcoes.status_relatorio(caminho) == 'pronto':
+        if st.session_state.get('relatorio_pendente') == caminho:
+            del st.session_state['relatorio_pendente']
+        with open(caminho, 'rb') as fp:
+            st.download_button(
+                label=f"📄 Baixar Relatório {ano} ({formato})",
+                data=fp,
+                file_name=f"relatorio_condominio_{ano}.{formato.lower()}",
+                mime="application/pdf" if formato == 'PDF' else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+        return
+
+    if st.button(f"Gerar Relatório {ano} ({formato})", key="gerar_relatorio"):
+        dados = funcoes.dados_relatorio_anual(
+            df_combined[df_combined['Ano'] == ano],
+            DETAILED_REVENUE_CATEGORIES,
+            DETAILED_VARIABLE_EXPENSE_CATEGORIES + UPDATED_EXTRA_EXPENSE_CATEGORIES,
+            titulo=f"Prestação de Contas {ano} - {condominio_atual()['nome']}"
+        )
+        funcoes.solicitar_relatorio_anual(dados, caminho)
+        st.session_state['relatorio_pendente'] = caminho
+        st.session_state.pop('relatorio_erro', None)
+
+    erro = st.session_state.get('relatorio_erro')
+    if erro and erro[0] == caminho:
+        st.error(f"Não foi possível gerar o relatório ({erro[1]}).")
+    # O fragmento (que se repete a cada 2 s) só é montado enquanto há um relatório sendo gerado
+    if st.session_state.get('relatorio_pendente'):
+        render_status_relatorio()
+
+
+@st.fragment(run_every=2)
+def render_status_relatorio():
+    """Acompanha a geração do relatório em segundo plano; quando termina, recarrega a página para o download."""
+    caminho = st.session_state['relatorio_pendente']
+    status = funcoes.status_relatorio(caminho)
+    if status == 'gerando':
+        st.info("⏳ Gerando o relatório em segundo plano...")
+        return
+    # Terminou (ou foi descartado): a página inteira é recarregada e o fragmento deixa de ser montado
+    del st.session_state['relatorio_pendente']
+    if status and status.startswith('erro: '):
+        st.session_state['relatorio_erro'] = (caminho, status.removeprefix('erro: '))
+    st.rerun()
+
+
+def render_portfolio_page():
+    """Visão consolidada de todos os condomínios do registro (planilhas lidas em paralelo)."""
+    st.title("Portfólio de Condomínios")
+    registro = funcoes.load_registro_condominios()
+
+    with st.spinner(f"Carregando {len(registro)} planilha(s)..."):
+        fluxos = funcoes.carregar_fluxos_condominios(registro)
+
+    faltando = [cfg['nome'] for condominio_id, cfg in registro.items() if condominio_id not in fluxos]
+    if faltando:
+        st.warning(f"Planilha não encontrada para: {', '.join(faltando)}")
+
+    df_resumo = funcoes.resumo_portfolio(fluxos, registro)
+    if df_resumo.empty:
+        st.info("Nenhum condomínio com dados de fluxo de caixa.")
+        return
+
+    colunas_valores = [c for c in df_resumo.columns if c not in ('Condomínio', 'Último Mês')]
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Condomínios", len(df_resumo))
+    with col2:
+        st.metric("Saldo Total (todos)", funcoes.format_currency_brl(df_resumo['Saldo Atual'].sum()))
+    with col3:
+        st.metric("Em saldo negativo", int((df_resumo['Saldo Atual'] < 0).sum()))
+
+    st.dataframe(df_resumo.style.format(funcoes.format_currency_brl, subset=colunas_valores), hide_index=True)
+
+    fig = px.bar(df_resumo, x='Condomínio', y='Saldo Atual', title='Saldo Atual por Condomínio', text_auto='.2s')
+    st.plotly_chart(fig, use_container_width=True, config={'scrollZoom': False})
+
 def main_dashboard():
     """
     Função principal que atua como um roteador, verificando a role do usuário
@@ -839,6 +1374,18 @@ def main_dashboard():
     if not st.session_state.get("authentication_status"):
         return
 
+    # Poda periódica das cópias temporárias de uploads (começa na primeira execução do processo)
+    funcoes.iniciar_poda_uploads()
+
+    # Seletor de condomínio (só aparece quando o registro tem mais de um)
+    registro = funcoes.load_registro_condominios()
+    if len(registro) > 1:
+        st.sidebar.selectbox(
+            "Condomínio:",
+            options=list(registro.keys()),
+            format_func=lambda condominio_id: registro[condominio_id]['nome'],
+            key='condominio'
+        )
 
     # Pega o nome de usuário da sessão
     username = st.session_state["username"]
@@ -852,7 +1399,8 @@ def main_dashboard():
         "Gerenciar Usuários": render_admin_page,
         "Upload de Comprovantes": render_upload_page,
         "Condominio Mensal": render_cotas_dashboard,
-        "Visualizar Comprovantes": render_visualizar_comprovantes_google_drive
+        "Visualizar Comprovantes": render_visualizar_comprovantes_google_drive,
+        "Portfólio de Condomínios": render_portfolio_page
 
     }
     user_pages = {
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import streamlit as st 
 import streamlit_authenticator as stauth
@@ -7,11 +8,97 @@ from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 from google_auth_oauthlib.flow import Flow
 from google_auth_oauthlib.flow import InstalledAppFlow
-import requests, unicodedata
+import requests, unicodedata, yaml
+import json, threading, time, uuid, hashlib, re, functools
+import fitz # PyMuPDF
+import io, multiprocessing, tempfile, sqlite3
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from PIL import Image, ImageChops, ImageOps
+from cachetools import LRUCache
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.chart import BarChart, LineChart, PieChart, Reference
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+try:
+    import pytesseract
+except ImportError:  # OCR local é opcional; sem ele só o OCR.space fica disponível
+    pytesseract = None
 
 
 OCR_SPACE_API_KEY = os.getenv('OCR_SPACE_API_KEY')  # Use 'helloworld' para testes gratuitos
 
+# --- Motor de OCR (definido por deploy) ---
+# 'ocrspace'            -> API remota OCR.space
+# 'tesseract'           -> Tesseract local (pacotes tesseract-ocr e tesseract-ocr-por)
+# 'tesseract+ocrspace'  -> Tesseract local com OCR.space como alternativa em caso de falha
+# 'ocrspace+tesseract'  -> OCR.space com o Tesseract local como alternativa (padrão quando o pytesseract existe)
+OCR_ENGINE = os.getenv('OCR_ENGINE', 'ocrspace+tesseract' if pytesseract else 'ocrspace')
+OCR_TESSERACT_LANG = os.getenv('OCR_TESSERACT_LANG', 'por')
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', str(min(2, os.cpu_count() or 1))))
+OCR_TIMEOUT = float(os.getenv('OCR_TIMEOUT', '60'))
+
+# --- Cliente do OCR.space: tempos limite, cota do plano e disjuntor ---
+OCR_SPACE_URL = os.getenv('OCR_SPACE_URL', 'https://api.ocr.space/parse/image')
+OCR_SPACE_TIMEOUT_CONEXAO = float(os.getenv('OCR_SPACE_TIMEOUT_CONEXAO', '5'))
+OCR_SPACE_TIMEOUT_LEITURA = float(os.getenv('OCR_SPACE_TIMEOUT_LEITURA', '30'))
+OCR_SPACE_PRAZO_TOTAL = float(os.getenv('OCR_SPACE_PRAZO_TOTAL', '60'))  # Não inicia nova tentativa depois disso
+OCR_SPACE_MAX_TENTATIVAS = 3
+OCR_SPACE_LIMITE_POR_MINUTO = float(os.getenv('OCR_SPACE_LIMITE_POR_MINUTO', '3'))  # Plano gratuito: 180 por hora
+OCR_SPACE_RAJADA = int(os.getenv('OCR_SPACE_RAJADA', '10'))  # Um lote de comprovantes sai sem esperar
+OCR_SPACE_ESPERA_MAX = 10.0  # Espera máxima por uma ficha antes de desistir
+OCR_SPACE_FALHAS_DISJUNTOR = 5  # Falhas seguidas que abrem o disjuntor
+OCR_SPACE_PAUSA_DISJUNTOR = 60.0  # Segundos com o disjuntor aberto
+
+# --- Pré-processamento das imagens antes do OCR ---
+# Fotos de celular chegam com 12+ MP; ~2000 px no maior lado equivalem a ~300 DPI
+# para um comprovante, resolução suficiente (e ideal) para o reconhecimento.
+OCR_IMAGEM_LADO_MAX = int(os.getenv('OCR_IMAGEM_LADO_MAX', '2000'))
+OCR_IMAGEM_QUALIDADE = 85
+
+# --- PDFs digitalizados (sem camada de texto) ---
+PDF_OCR_DPI = int(os.getenv('PDF_OCR_DPI', '200'))
+PDF_MIN_CARACTERES_TEXTO = 20  # Páginas com menos texto que isso são tratadas como imagem
+
+# --- Fila de envio (outbox) para o Google Drive ---
+OUTBOX_DIR = os.getenv('OUTBOX_DIR', 'outbox')
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '4'))
+UPLOAD_MAX_TENTATIVAS = 3
+
+# --- Leitura das planilhas em paralelo ---
+PLANILHA_WORKERS = int(os.getenv('PLANILHA_WORKERS', str(os.cpu_count() or 1)))
+
+# --- Registro de condomínios (uma planilha por condomínio) ---
+REGISTRO_CONDOMINIOS_PATH = os.getenv('REGISTRO_CONDOMINIOS', 'condominios.yaml')
+# Pasta do Drive do condomínio original; só vale quando não há registro (condomínio único)
+DRIVE_FOLDER_ID_PADRAO = "1yAIs75wbsUrP8RqwLR_xqko11IpSHZEQ"
+
+# --- Livro-caixa local (somente inclusão) com os lançamentos confirmados ---
+LEDGER_PATH = os.getenv('LEDGER_PATH', os.path.join('dados', 'lancamentos.db'))
+
+# --- Versões da planilha: snapshot por aba e registro das células alteradas ---
+SNAPSHOTS_DIR = os.getenv('SNAPSHOTS_DIR', os.path.join('.cache', 'planilhas'))
+
+# --- Relatório anual (prestação de contas) gerado em segundo plano ---
+RELATORIOS_DIR = os.getenv('RELATORIOS_DIR', os.path.join('.cache', 'relatorios'))
+RELATORIOS_MAX = int(os.getenv('RELATORIOS_MAX', '50'))  # Relatórios mantidos em disco (os mais recentes)
+
+# --- Índice de busca (texto completo) dos comprovantes ---
+INDICE_COMPROVANTES_PATH = os.getenv('INDICE_COMPROVANTES_PATH', os.path.join('dados', 'comprovantes.db'))
+
+# --- Cache persistente da extração de texto (chaveado pelo SHA-256 do arquivo) ---
+EXTRACAO_CACHE_DIR = os.getenv('EXTRACAO_CACHE_DIR', os.path.join('.cache', 'extracao'))
+EXTRACAO_CACHE_MAX_BYTES = int(os.getenv('EXTRACAO_CACHE_MAX_MB', '50')) * 1024 * 1024
+
+# --- Uploads: limite por arquivo e registro compacto na sessão ---
+UPLOAD_TAMANHO_MAX = int(os.getenv('UPLOAD_TAMANHO_MAX_MB', '10')) * 1024 * 1024
+UPLOAD_LIMITE_MEMORIA = int(os.getenv('UPLOAD_LIMITE_MEMORIA_KB', '512')) * 1024  # Acima disso, os bytes vão para o disco
+UPLOAD_TMP_DIR = os.getenv('UPLOAD_TMP_DIR', os.path.join('.cache', 'uploads'))
+UPLOAD_TMP_IDADE_MAX = 6 * 3600  # Arquivos temporários sem uso há mais tempo (sessões abandonadas) são apagados
+UPLOAD_TMP_PODA_INTERVALO = 15 * 60  # Intervalo entre as podas dos arquivos temporários
+UPLOAD_PREVIA_CARACTERES = 3000
+
 
 # --- 1. Carregamento e Limpeza dos Dados ---
 
@@ -31,67 +118,131 @@ def clean_currency(value, default=0.0):
         return default
 
 @st.cache_data # Cache the data loading and processing
-def load_and_process_data(excel_path, sheet_name, year):
-    """Carrega, limpa e formata os dados de uma aba (ano) de um arquivo Excel."""
+def load_and_process_data(excel_path, sheet_name, year, impressao=None):
+    """
+    Carrega, limpa e formata os dados de uma aba (ano) de um arquivo Excel.
+    'impressao' (de registrar_versao_planilha) faz parte da chave do cache: só abas alteradas são relidas.
+    """
+    df_transposed, invalid_month_names = processar_aba_fluxo(excel_path, sheet_name, year)
+    if invalid_month_names:
+        st.warning(
+            f"**Aviso de Dados:** Os seguintes meses na aba '{sheet_name}' não foram reconhecidos e serão ignorados: "
+            f"`{', '.join(invalid_month_names)}`. Verifique se há erros de digitação ou colunas extras na planilha."
+        )
+    return df_transposed
+
+
+def ler_faixa_aba(excel_path, sheet_name, linha_cabecalho=5):
+    """
+    Lê em streaming a faixa usada de uma aba de fluxo de caixa (veja _ler_faixa_ws).
+    Levanta FileNotFoundError (arquivo) ou ValueError (aba inexistente), como o pd.read_excel.
+    """
+    workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        if sheet_name not in workbook.sheetnames:
+            raise ValueError(f"Aba '{sheet_name}' não encontrada na planilha.")
+        return _ler_faixa_ws(workbook[sheet_name], linha_cabecalho)
+    finally:
+        workbook.close()
+
+
+def ler_faixas_planilha(excel_path, linha_cabecalho=5):
+    """
+    Abre a planilha uma única vez e lê a faixa usada de todas as abas de fluxo de caixa.
+    Retorna [(aba, ano, cabecalho, rotulos, valores)] na ordem das abas.
+    """
+    year_pattern = re.compile(r'(\d{4})')
+    faixas = []
+    workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.sheetnames:
+            match = year_pattern.search(sheet)
+            if match and "fluxo de caixa" in sheet.lower():
+                faixas.append((sheet, int(match.group(1)), *_ler_faixa_ws(workbook[sheet], linha_cabecalho)))
+    finally:
+        workbook.close()
+    return faixas
+
+
+def _ler_faixa_ws(ws, linha_cabecalho):
+    """
+    Leitura em streaming (openpyxl read_only/values_only, sem estilos) de uma aba já aberta.
+    Retorna (cabecalho, rotulos, valores):
+      cabecalho -> rótulos das colunas B em diante na linha 'linha_cabecalho' (os meses);
+      rotulos   -> conteúdo da coluna A de cada linha abaixo do cabeçalho;
+      valores   -> matriz float64 (linhas x colunas), pré-alocada, com NaN nas células vazias.
+    Só entram as colunas até o último mês do cabeçalho; textos passam por clean_currency.
+    """
+    if ws.max_row is None or ws.max_column is None:  # Arquivo sem a marcação de dimensão
+        ws.calculate_dimension(force=True)
+
+    linha = next(ws.iter_rows(min_row=linha_cabecalho, max_row=linha_cabecalho, values_only=True), ())
+    ultima_coluna = max((j for j, valor in enumerate(linha) if valor not in (None, '')), default=0)
+    cabecalho = [
+        valor if valor not in (None, '') else f'Unnamed: {j}'
+        for j, valor in enumerate(linha[1:ultima_coluna + 1], start=1)
+    ]
+
+    n_linhas = max(ws.max_row - linha_cabecalho, 0)
+    rotulos = [None] * n_linhas
+    valores = np.full((n_linhas, len(cabecalho)), np.nan)
+    usadas = 0
+    if cabecalho and n_linhas:
+        linhas = ws.iter_rows(min_row=linha_cabecalho + 1, max_row=ws.max_row, max_col=ultima_coluna + 1, values_only=True)
+        for i, linha in enumerate(linhas):
+            if not linha:
+                continue
+            rotulos[i] = linha[0]
+            for j, valor in enumerate(linha[1:]):
+                if valor is None or (isinstance(valor, str) and not valor.strip()):
+                    continue
+                valores[i, j] = valor if isinstance(valor, (int, float)) else clean_currency(valor)
+            if linha[0] is not None or not np.isnan(valores[i]).all():
+                usadas = i + 1
+    # Descarta a cauda de linhas vazias (formatadas, mas sem dados)
+    return cabecalho, rotulos[:usadas], valores[:usadas]
+
+
+def processar_aba_fluxo(excel_path, sheet_name, year):
+    """
+    Núcleo de load_and_process_data, sem chamadas ao Streamlit (pode rodar em outro processo).
+    Retorna (DataFrame processado ou None, lista de meses não reconhecidos).
+    """
     try:
         # Lê uma aba específica do arquivo Excel. O nome da aba deve ser o ano.
-        df = pd.read_excel(excel_path, sheet_name=sheet_name, skiprows=4, index_col=0)
+        meses, categorias, valores = ler_faixa_aba(excel_path, sheet_name)
     except FileNotFoundError:
         print(f"Aviso: O arquivo Excel não foi encontrado em '{excel_path}'")
-        return None
+        return None, []
     except ValueError as e: # Captura erro se a aba não for encontrada
         print(f"Aviso: A aba '{sheet_name}' não foi encontrada no arquivo. Erro: {e}")
-        return None
-
-    # 1. Limpeza básica no DataFrame original (remove apenas linhas/colunas TOTALMENTE vazias)
-    df.dropna(axis=1, how='all', inplace=True) # Remove colunas (meses) totalmente vazias
-    df.dropna(axis=0, how='all', inplace=True) # Remove linhas (categorias) totalmente vazias
+        return None, []
+    return montar_fluxo(meses, categorias, valores, year)
 
-    
-    # Debut de tabelas de valores 
-    # print("DataFrame original antes da transposição:")
-    # print(df.head())
-
-    # # 2. Transpõe o DataFrame para ter os meses como linhas
-    df_transposed = df.T
-    
-    # print("DataFrame transposto:")
-    # print(df_transposed.head())
-    
 
-    # 3. Aplica a conversão de moeda APÓS a transposição
-    #df_transposed = df_transposed.map(clean_currency)
-    # Identifica as colunas de valores (exclui 'index' e 'Mês')
-    for col in df_transposed.columns:
-        df_transposed[col] = df_transposed[col].apply(clean_currency)
+def montar_fluxo(meses, categorias, valores, year):
+    """Monta o DataFrame de fluxo de caixa (um mês por linha) a partir da faixa lida por ler_faixa_aba."""
+    # 1. Remove apenas linhas (categorias) e colunas (meses) TOTALMENTE vazias
+    vazias = np.isnan(valores)
+    linhas_usadas = ~vazias.all(axis=1)
+    colunas_usadas = ~vazias.all(axis=0)
 
-    
-    df_transposed.reset_index(inplace=True) # Converte o índice em uma coluna chamada 'index'
-    df_transposed.rename(columns={'index': 'Mês'}, inplace=True) # Renomeia a coluna 'index' para 'Mês'
+    # 2. Transpõe a matriz para ter os meses como linhas (os valores já estão convertidos para float)
+    df_transposed = pd.DataFrame(
+        valores[linhas_usadas][:, colunas_usadas].T,
+        columns=[categoria for categoria, usada in zip(categorias, linhas_usadas) if usada],
+    )
+    df_transposed.insert(0, 'Mês', [mes for mes, usada in zip(meses, colunas_usadas) if usada])
     df_transposed['Ano'] = year
     
     # --- Criação da Coluna 'Período' e 'sort_date' ---
-    # Mapeia nomes de meses em português para número do mês para uma ordenação robusta
-    meses_map = {
-        'JANEIRO': 1, 'FEVEREIRO': 2, 'MARCO': 3, 'ABRIL': 4, 'MAIO': 5, 'JUNHO': 6,
-        'JULHO': 7, 'AGOSTO': 8, 'SETEMBRO': 9, 'OUTUBRO': 10, 'NOVEMBRO': 11, 'DEZEMBRO': 12,
-        'MARCO': 3 # Garantia para variações
-    }
-    # Extrai apenas o nome do mês da coluna 'Mês', ignorando qualquer coisa após '/'
-    month_names_only = df_transposed['Mês'].apply(normalize_month_name)
-    
+    # 4. Tenta mapear os meses para números (mesma regra da validação e do bloco de cotas).
+    df_transposed['month_num'] = df_transposed['Mês'].map(numero_do_mes)
 
-    # 4. Tenta mapear os meses para números.
-    df_transposed['month_num'] = month_names_only.map(meses_map)
-
-    # 5. Identifica e avisa sobre meses inválidos que não puderam ser mapeados.
+    # 5. Identifica os meses inválidos que não puderam ser mapeados (o aviso fica com quem chama).
     invalid_months = df_transposed[df_transposed['month_num'].isna()]
+    invalid_month_names = [str(name) for name in invalid_months['Mês'].unique()]
     if not invalid_months.empty:
-        invalid_month_names = invalid_months['Mês'].unique()
-        st.warning(
-            f"**Aviso de Dados:** Os seguintes meses na aba '{sheet_name}' não foram reconhecidos e serão ignorados: "
-            f"`{', '.join(invalid_month_names)}`. Verifique se há erros de digitação ou colunas extras na planilha."
-        )
         # Remove as linhas com meses inválidos para evitar que o app quebre.
         df_transposed.dropna(subset=['month_num'], inplace=True)
 
@@ -99,8 +250,248 @@ def load_and_process_data(excel_path, sheet_name, year):
     df_transposed['sort_date'] = pd.to_datetime(df_transposed['Ano'].astype(str) + '-' + df_transposed['month_num'].astype(int).astype(str))
     df_transposed['Período'] = df_transposed['sort_date'].dt.strftime('%b-%Y').str.capitalize()
     
-    return df_transposed
+    return df_transposed, invalid_month_names
+
+
+# --- Validação da planilha: varre as células brutas antes do processamento ---
+# Cada anomalia vira uma linha (aba, célula, valor, problema), apontando exatamente onde corrigir
+# aquilo que processar_aba_fluxo descartaria ou trocaria por 0,00 sem avisar.
+ERROS_DE_FORMULA = ('#REF!', '#DIV/0!', '#VALUE!', '#N/A', '#NAME?', '#NUM!', '#NULL!')
+COLUNAS_VALIDACAO = ['Aba', 'Célula', 'Valor', 'Problema']
+
+
+def validar_aba_fluxo(linhas, sheet_name, year, linha_cabecalho=5):
+    """
+    Valida as linhas de uma aba de fluxo de caixa (tuplas de valores, como em iter_rows(values_only=True)).
+    A linha 'linha_cabecalho' (1-based) traz os meses; as seguintes, uma categoria por linha.
+    Retorna uma lista de dicionários com as colunas de COLUNAS_VALIDACAO.
+    """
+    problemas = []
+
+    def anotar(linha, coluna, valor, problema):
+        problemas.append({
+            'Aba': sheet_name, 'Célula': f"{get_column_letter(coluna)}{linha}",
+            'Valor': '' if valor is None else str(valor), 'Problema': problema,
+        })
+
+    colunas_mes = {}  # índice da coluna (1-based) -> número do mês
+    categorias = {}
+    cabecalho_encontrado = False
+    for numero_linha, linha in enumerate(linhas, start=1):
+        if numero_linha < linha_cabecalho:
+            continue
+        if numero_linha == linha_cabecalho:
+            cabecalho_encontrado = True
+            vistos = {}
+            for coluna, valor in enumerate(linha[1:], start=2):
+                if valor is None or str(valor).strip() == '':
+                    continue
+                mes = numero_do_mes(valor)
+                if mes is None:
+                    anotar(numero_linha, coluna, valor, "Mês não reconhecido: a coluna será ignorada")
+                    continue
+                if mes in vistos:
+                    anotar(numero_linha, coluna, valor, f"Mês repetido (já aparece em {get_column_letter(vistos[mes])}{numero_linha})")
+                    continue
+                ano_no_cabecalho = re.search(r'(\d{4})', str(valor))
+                if ano_no_cabecalho and int(ano_no_cabecalho.group(1)) != year:
+                    anotar(numero_linha, coluna, valor, f"Ano do mês diferente do ano da aba ({year})")
+                vistos[mes] = coluna
+                colunas_mes[coluna] = mes
+            continue
+
+        if all(valor is None for valor in linha):
+            continue
+        categoria = linha[0] if linha else None
+        if categoria is None or str(categoria).strip() == '':
+            anotar(numero_linha, 1, None, "Linha com valores sem categoria na coluna A")
+        elif str(categoria).strip() in categorias:
+            anotar(numero_linha, 1, categoria, f"Categoria repetida (já aparece em A{categorias[str(categoria).strip()]})")
+        else:
+            categorias[str(categoria).strip()] = numero_linha
+
+        for coluna, valor in enumerate(linha[1:], start=2):
+            if valor is None or (isinstance(valor, str) and valor.strip() == ''):
+                continue
+            if coluna not in colunas_mes:
+                anotar(numero_linha, coluna, valor, "Valor fora das colunas de mês válidas")
+            elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                continue
+            elif isinstance(valor, str) and valor.strip() in ERROS_DE_FORMULA:
+                anotar(numero_linha, coluna, valor, "Erro de fórmula: será lido como 0,00")
+            elif isinstance(valor, str) and clean_currency(valor, default=None) is not None:
+                anotar(numero_linha, coluna, valor, "Número armazenado como texto")
+            else:
+                anotar(numero_linha, coluna, valor, "Valor não numérico: será lido como 0,00")
+
+    if not cabecalho_encontrado:
+        anotar(linha_cabecalho, 1, None, "Linha de cabeçalho com os meses não encontrada")
+    elif not colunas_mes:
+        anotar(linha_cabecalho, 2, None, "Nenhum mês reconhecido no cabeçalho")
+    return problemas
+
+
+def validar_planilha(excel_path):
+    """
+    Varre todas as abas de fluxo de caixa em modo somente leitura (sem montar DataFrames)
+    e devolve um DataFrame com uma linha por anomalia encontrada.
+    """
+    problemas = []
+    workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        for sheet_name in workbook.sheetnames:
+            match = re.search(r'(\d{4})', sheet_name)
+            if not match or "fluxo de caixa" not in sheet_name.lower():
+                continue
+            linhas = workbook[sheet_name].iter_rows(values_only=True)
+            problemas.extend(validar_aba_fluxo(linhas, sheet_name, int(match.group(1))))
+    finally:
+        workbook.close()
+    return pd.DataFrame(problemas, columns=COLUNAS_VALIDACAO)
+
+
+@st.cache_data
+def load_validacao_planilha(excel_path, versao):
+    """Relatório de validação em cache; 'versao' (mtime, tamanho do arquivo) refaz a varredura quando a planilha muda."""
+    return validar_planilha(excel_path)
+
+
+# --- Alterações entre versões da planilha ---
+# Cada versão carregada (mtime, tamanho) tem um snapshot por aba: a matriz de valores e uma impressão
+# digital (SHA-256). Ao trocar o arquivo, só as abas com impressão diferente são comparadas, célula a
+# célula e de forma vetorizada; as diferenças vão para um registro (JSON Lines) exibido aos administradores.
+# As impressões por aba também entram nas chaves dos caches (load_and_process_data, cotas), de modo
+# que só o que depende das abas alteradas é recalculado.
+COLUNAS_ALTERACOES = ['Detectado em', 'Aba', 'Categoria', 'Mês', 'Anterior', 'Novo']
+_versoes_planilha = {}  # planilha -> (versão do arquivo, {aba: impressão digital})
+_versoes_planilha_lock = threading.Lock()
+
+
+def _impressao_faixa(meses, categorias, valores):
+    conteudo = hashlib.sha256(repr((list(map(str, meses)), list(map(str, categorias)))).encode())
+    conteudo.update(np.ascontiguousarray(valores).tobytes())
+    return conteudo.hexdigest()
+
 
+def _serie_faixa(meses, categorias, valores):
+    # Células preenchidas indexadas por (categoria, ocorrência, mês): linhas inseridas ou removidas
+    # no meio da aba não deslocam a comparação, e categorias repetidas continuam distintas.
+    nomes = pd.Series(['' if c is None else str(c).strip() for c in categorias])
+    ocorrencia = nomes.groupby(nomes).cumcount()
+    linhas, colunas = np.nonzero(~np.isnan(valores))
+    indice = pd.MultiIndex.from_arrays(
+        [nomes.values[linhas], ocorrencia.values[linhas], np.asarray([str(m) for m in meses], dtype=object)[colunas]],
+        names=['Categoria', 'Ocorrência', 'Mês']
+    )
+    return pd.Series(valores[linhas, colunas], index=indice).groupby(level=[0, 1, 2]).last()
+
+
+def comparar_faixas(aba, anterior, atual, tolerancia=0.005):
+    """
+    Compara duas leituras de uma aba (dicionários com meses, categorias e valores, como nos snapshots).
+    Retorna um DataFrame (Aba, Categoria, Mês, Anterior, Novo) só com as células que mudaram.
+    """
+    serie_anterior = _serie_faixa(anterior['meses'], anterior['categorias'], anterior['valores'])
+    serie_atual = _serie_faixa(atual['meses'], atual['categorias'], atual['valores'])
+    antes, depois = serie_anterior.align(serie_atual, join='outer')
+    mudou = ~np.isclose(antes.values, depois.values, atol=tolerancia, rtol=0, equal_nan=True)
+    alteracoes = pd.DataFrame({
+        'Aba': aba,
+        'Categoria': antes.index.get_level_values('Categoria')[mudou],
+        'Mês': antes.index.get_level_values('Mês')[mudou],
+        'Anterior': antes.values[mudou],
+        'Novo': depois.values[mudou],
+    })
+    return alteracoes.reset_index(drop=True)
+
+
+def _caminho_snapshot(excel_path, snapshots_dir=SNAPSHOTS_DIR):
+    chave = hashlib.sha256(os.path.abspath(excel_path).encode()).hexdigest()[:16]
+    return os.path.join(snapshots_dir, f"{chave}.pkl"), os.path.join(snapshots_dir, f"{chave}_alteracoes.jsonl")
+
+
+def _ler_snapshot(caminho_snapshot):
+    # Snapshot ausente, truncado ou gravado por outra versão do código (classes que não existem
+    # mais, módulos renomeados): em qualquer caso a planilha é tratada como sem versão anterior.
+    try:
+        with open(caminho_snapshot, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+
+def registrar_versao_planilha(excel_path, snapshots_dir=SNAPSHOTS_DIR):
+    """
+    Registra a versão atual da planilha e devolve {aba: impressão digital} das abas de fluxo de caixa.
+    Versão já conhecida (mesmo mtime e tamanho): nada é lido. Versão nova: as abas são lidas uma vez,
+    comparadas com o snapshot anterior e as células alteradas entram no registro de alterações.
+    """
+    versao = versao_arquivo(excel_path)
+    caminho_snapshot, caminho_alteracoes = _caminho_snapshot(excel_path, snapshots_dir)
+    with _versoes_planilha_lock:
+        memorizado = _versoes_planilha.get(caminho_snapshot)
+    if memorizado and memorizado[0] == versao:
+        return memorizado[1]
+
+    snapshot = _ler_snapshot(caminho_snapshot)
+    if snapshot and snapshot['versao'] == versao:
+        impressoes = {aba: dados['impressao'] for aba, dados in snapshot['abas'].items()}
+        with _versoes_planilha_lock:
+            _versoes_planilha[caminho_snapshot] = (versao, impressoes)
+        return impressoes
+
+    # A leitura da planilha (a parte lenta) fica fora da trava: outras sessões e planilhas não esperam por ela
+    abas = {
+        sheet: {'meses': meses, 'categorias': categorias, 'valores': valores,
+                'impressao': _impressao_faixa(meses, categorias, valores)}
+        for sheet, _, meses, categorias, valores in ler_faixas_planilha(excel_path)
+    }
+    impressoes = {aba: dados['impressao'] for aba, dados in abas.items()}
+
+    with _versoes_planilha_lock:
+        # Outra sessão pode ter registrado esta versão enquanto a planilha era lida
+        memorizado = _versoes_planilha.get(caminho_snapshot)
+        if memorizado and memorizado[0] == versao:
+            return memorizado[1]
+        snapshot = _ler_snapshot(caminho_snapshot)
+        if snapshot and snapshot['versao'] == versao:
+            _versoes_planilha[caminho_snapshot] = (versao, impressoes)
+            return impressoes
+
+        if snapshot:
+            alteracoes = []
+            for aba in sorted(set(abas) | set(snapshot['abas'])):
+                anterior, atual = snapshot['abas'].get(aba), abas.get(aba)
+                if anterior is None or atual is None:
+                    # Aba inteira criada ou removida: uma linha só no registro
+                    alteracoes.append(pd.DataFrame([{'Aba': aba, 'Categoria': '(aba nova)' if atual else '(aba removida)'}]))
+                elif anterior['impressao'] != atual['impressao']:
+                    alteracoes.append(comparar_faixas(aba, anterior, atual))
+            alteracoes = pd.concat(alteracoes, ignore_index=True) if alteracoes else pd.DataFrame()
+            if not alteracoes.empty:
+                alteracoes.insert(0, 'Detectado em', _agora_iso())
+                linhas = alteracoes.reindex(columns=COLUNAS_ALTERACOES).astype(object).where(alteracoes.notna(), None)
+                os.makedirs(snapshots_dir, exist_ok=True)
+                with open(caminho_alteracoes, 'a', encoding='utf-8') as f:
+                    for registro in linhas.to_dict('records'):
+                        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+        os.makedirs(snapshots_dir, exist_ok=True)
+        _gravar_atomico(caminho_snapshot, pickle.dumps({'versao': versao, 'abas': abas}))
+        _versoes_planilha[caminho_snapshot] = (versao, impressoes)
+        return impressoes
+
+
+def listar_alteracoes_planilha(excel_path, limite=200, snapshots_dir=SNAPSHOTS_DIR):
+    """Últimas alterações registradas para a planilha (mais recentes primeiro), como DataFrame."""
+    _, caminho_alteracoes = _caminho_snapshot(excel_path, snapshots_dir)
+    try:
+        with open(caminho_alteracoes, 'r', encoding='utf-8') as f:
+            linhas = f.readlines()[-limite:]
+    except FileNotFoundError:
+        linhas = []
+    registros = [json.loads(linha) for linha in reversed(linhas) if linha.strip()]
+    return pd.DataFrame(registros, columns=COLUNAS_ALTERACOES)
 
 
 # def upload_comprovante_google_drive(local_path, nome_arquivo, folder_id=None):
@@ -141,26 +532,234 @@ def normalize_month_name(name):
     return name.upper()
 
 
-def ocr_space_api(file_path, api_key='helloworld'):
-    with open(file_path, 'rb') as f:
-        response = requests.post(
-            'https://api.ocr.space/parse/image',
-            files={'filename': f},
-            data={'apikey': api_key, 'language': 'por'}
-        )
-        
+# Nomes completos, abreviações em português ('Fev') e as do strftime('%b') ('Feb'), usadas nas colunas de data
+MESES = ['JANEIRO', 'FEVEREIRO', 'MARCO', 'ABRIL', 'MAIO', 'JUNHO',
+         'JULHO', 'AGOSTO', 'SETEMBRO', 'OUTUBRO', 'NOVEMBRO', 'DEZEMBRO']
+_NUMERO_DO_MES = {
+    **{nome: numero for numero, nome in enumerate(MESES, start=1)},
+    **{nome[:3]: numero for numero, nome in enumerate(MESES, start=1)},
+    **{abreviacao: numero for numero, abreviacao in enumerate(
+        ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC'], start=1)},
+}
 
+
+def numero_do_mes(value):
+    """
+    Número do mês (1-12) de um cabeçalho da planilha: 'Janeiro/2024', 'Março', 'Fev/26', 'Feb-26',
+    datas ou '2026-06-01 00:00:00'. Retorna None se não reconhecer. É a regra única de
+    montar_fluxo, validar_aba_fluxo e ler_bloco_cotas.
+    """
+    if value is None or pd.isna(value):
+        return None
+    if hasattr(value, 'month'):
+        return value.month
+    texto = str(value).strip()
+    data_iso = re.match(r'^\d{4}-(\d{2})-\d{2}', texto)
+    if data_iso:
+        mes = int(data_iso.group(1))
+        return mes if 1 <= mes <= 12 else None
+    nome = re.split(r'[\s\-.]', normalize_month_name(texto))[0]
+    return _NUMERO_DO_MES.get(nome)
+
+
+# Sessão única (conexões HTTP reaproveitadas entre chamadas e threads)
+_ocr_space_session = requests.Session()
+_ocr_space_session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=OCR_WORKERS * 2))
+_ocr_space_session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=OCR_WORKERS * 2))
+
+# Balde de fichas (limite do plano) e disjuntor, compartilhados por todas as sessões do app
+_ocr_space_estado = {'fichas': float(OCR_SPACE_RAJADA), 'fichas_em': time.monotonic(), 'falhas': 0, 'aberto_ate': 0.0}
+_ocr_space_lock = threading.Lock()
+
+
+def _reservar_ficha_ocr_space():
+    """
+    Reserva uma requisição no balde de fichas (OCR_SPACE_LIMITE_POR_MINUTO, rajada de OCR_SPACE_RAJADA)
+    e espera a vez dela. Se a espera passar de OCR_SPACE_ESPERA_MAX, desiste na hora.
+    """
+    taxa = OCR_SPACE_LIMITE_POR_MINUTO / 60.0
+    with _ocr_space_lock:
+        agora = time.monotonic()
+        fichas = min(OCR_SPACE_RAJADA, _ocr_space_estado['fichas'] + (agora - _ocr_space_estado['fichas_em']) * taxa)
+        espera = max(0.0, (1 - fichas) / taxa)
+        if espera > OCR_SPACE_ESPERA_MAX:
+            raise Exception(f"Limite de requisições do OCR.space atingido; nova ficha em {espera:.0f}s")
+        # O saldo pode ficar negativo: a ficha já fica reservada para daqui a 'espera' segundos
+        _ocr_space_estado.update(fichas=fichas - 1, fichas_em=agora)
+    if espera:
+        time.sleep(espera)
+
+
+def _disjuntor_ocr_space_permite():
+    """Fechado: libera. Aberto: recusa até 'aberto_ate'; depois libera uma única chamada de teste."""
+    with _ocr_space_lock:
+        if _ocr_space_estado['falhas'] < OCR_SPACE_FALHAS_DISJUNTOR:
+            return True
+        agora = time.monotonic()
+        if agora >= _ocr_space_estado['aberto_ate']:
+            _ocr_space_estado['aberto_ate'] = agora + OCR_SPACE_PAUSA_DISJUNTOR
+            return True
+        return False
+
+
+def _registrar_resultado_ocr_space(sucesso):
+    with _ocr_space_lock:
+        if sucesso:
+            _ocr_space_estado['falhas'] = 0
+            return
+        _ocr_space_estado['falhas'] += 1
+        if _ocr_space_estado['falhas'] >= OCR_SPACE_FALHAS_DISJUNTOR:
+            _ocr_space_estado['aberto_ate'] = time.monotonic() + OCR_SPACE_PAUSA_DISJUNTOR
+
+
+def _erro_transitorio(erro):
+    # Vale a pena tentar de novo: rede, tempo esgotado, limite (429) ou erro do servidor (5xx)
+    if isinstance(erro, (requests.Timeout, requests.ConnectionError)):
+        return True
+    resposta = getattr(erro, 'response', None)
+    return isinstance(erro, requests.HTTPError) and resposta is not None and (
+        resposta.status_code == 429 or resposta.status_code >= 500
+    )
+
+
+def _interpretar_resposta_ocr_space(response):
+    response.raise_for_status()
     try:
         result = response.json()
     except Exception as e:
         raise Exception(f"Erro ao interpretar resposta da API: {e}")
 
-    if isinstance(result, dict):
-        if result.get("IsErroredOnProcessing"):
-            raise Exception(result.get("ErrorMessage", "Erro desconhecido na API OCR"))
-        return result['ParsedResults'][0]['ParsedText']
-    else:
+    if not isinstance(result, dict):
         raise Exception("Resposta inesperada da API OCR: não é um JSON válido")
+    if result.get("IsErroredOnProcessing"):
+        mensagem = result.get("ErrorMessage") or "Erro desconhecido na API OCR"
+        raise Exception("; ".join(mensagem) if isinstance(mensagem, list) else mensagem)
+    paginas = result.get('ParsedResults') or []
+    if not paginas:
+        raise Exception("Resposta da API OCR sem resultados (ParsedResults vazio)")
+    return "\n".join(pagina.get('ParsedText') or '' for pagina in paginas)
+
+
+def ocr_space_api(image_bytes, api_key=None, url=None, espera_base=1.0):
+    """
+    OCR remoto com o OCR.space. Usa a sessão compartilhada, tempos limite de conexão e leitura,
+    o balde de fichas do plano e até OCR_SPACE_MAX_TENTATIVAS tentativas para falhas transitórias.
+    Com o disjuntor aberto (serviço falhando seguidamente), falha na hora para o próximo motor de OCR.
+    """
+    api_key = api_key or OCR_SPACE_API_KEY
+    if not api_key:
+        raise Exception("OCR_SPACE_API_KEY não configurada.")
+    if not _disjuntor_ocr_space_permite():
+        raise Exception("OCR.space indisponível (disjuntor aberto após falhas seguidas).")
+
+    inicio = time.monotonic()
+    for tentativa in range(1, OCR_SPACE_MAX_TENTATIVAS + 1):
+        _reservar_ficha_ocr_space()
+        try:
+            response = _ocr_space_session.post(
+                url or OCR_SPACE_URL,
+                files={'filename': ('comprovante.jpg', image_bytes, 'image/jpeg')},
+                data={'apikey': api_key, 'language': 'por'},
+                timeout=(OCR_SPACE_TIMEOUT_CONEXAO, OCR_SPACE_TIMEOUT_LEITURA),
+            )
+            texto = _interpretar_resposta_ocr_space(response)
+        except Exception as e:
+            transitorio = _erro_transitorio(e)
+            espera = espera_base * (2 ** (tentativa - 1))
+            prazo_esgotado = time.monotonic() - inicio + espera > OCR_SPACE_PRAZO_TOTAL
+            if not transitorio or tentativa == OCR_SPACE_MAX_TENTATIVAS or prazo_esgotado:
+                # Só falhas do serviço contam para o disjuntor; uma imagem ruim (4xx) não conta,
+                # mas também não zera as falhas seguidas do serviço
+                if transitorio:
+                    _registrar_resultado_ocr_space(False)
+                raise
+            time.sleep(espera)
+        else:
+            _registrar_resultado_ocr_space(True)
+            return texto
+
+
+def preprocessar_imagem_ocr(image_bytes, lado_max=OCR_IMAGEM_LADO_MAX, qualidade=OCR_IMAGEM_QUALIDADE):
+    """
+    Prepara a foto de um comprovante para o OCR: corrige a orientação (EXIF), converte
+    para tons de cinza, reduz a resolução, recorta as bordas e recodifica em JPEG compacto.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as original:
+        image = ImageOps.exif_transpose(original).convert('L')
+
+    image.thumbnail((lado_max, lado_max), Image.Resampling.LANCZOS)
+    image = _recortar_bordas(image)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=qualidade, optimize=True)
+    return buffer.getvalue()
+
+
+def _recortar_bordas(image, tolerancia=40, margem=0.02):
+    # Estima a cor do fundo pelos cantos e recorta a área onde há conteúdo diferente dele
+    largura, altura = image.size
+    cantos = sorted(image.getpixel(p) for p in [(0, 0), (largura - 1, 0), (0, altura - 1), (largura - 1, altura - 1)])
+    fundo = Image.new('L', image.size, (cantos[1] + cantos[2]) // 2)
+    mascara = ImageChops.difference(image, fundo).point(lambda p: 255 if p > tolerancia else 0)
+    bbox = mascara.getbbox()
+    if bbox is None:
+        return image
+
+    pad_x, pad_y = int(largura * margem), int(altura * margem)
+    esquerda, topo, direita, base = bbox
+    return image.crop((
+        max(0, esquerda - pad_x), max(0, topo - pad_y),
+        min(largura, direita + pad_x), min(altura, base + pad_y),
+    ))
+
+
+def _ocr_tesseract_worker(image_bytes, lang):
+    # Executado nos processos do pool: recebe os bytes da imagem (serializáveis)
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return pytesseract.image_to_string(image, lang=lang)
+
+
+@st.cache_resource
+def get_ocr_process_pool(max_workers=OCR_WORKERS):
+    """Pool de processos (limitado) para o OCR local, compartilhado entre as sessões."""
+    # 'spawn' evita herdar por fork as threads do servidor do Streamlit
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def ocr_tesseract(image_bytes, lang=OCR_TESSERACT_LANG):
+    """OCR local com Tesseract, executado no pool de processos."""
+    if pytesseract is None:
+        raise Exception("pytesseract não está instalado.")
+    future = get_ocr_process_pool().submit(_ocr_tesseract_worker, image_bytes, lang)
+    return future.result(timeout=OCR_TIMEOUT)
+
+
+OCR_BACKENDS = {
+    'ocrspace': ocr_space_api,
+    'tesseract': ocr_tesseract,
+}
+
+
+def ocr_imagem(image_bytes, engine=None):
+    """
+    Executa o OCR de uma imagem (em memória) com o motor configurado em OCR_ENGINE.
+    Motores separados por '+' são tentados em ordem, até o primeiro sucesso. Sem
+    OCR_SPACE_API_KEY, o OCR.space é pulado quando há outro motor depois dele.
+    """
+    motores = (engine or OCR_ENGINE).split('+')
+    for motor in motores:
+        if motor not in OCR_BACKENDS:
+            raise ValueError(f"Motor de OCR desconhecido: '{motor}'. Opções: {', '.join(OCR_BACKENDS)}")
+
+    erros = []
+    for posicao, motor in enumerate(motores, start=1):
+        if motor == 'ocrspace' and not OCR_SPACE_API_KEY and posicao < len(motores):
+            continue  # Sem chave do OCR.space: vai direto para o próximo motor
+        try:
+            return OCR_BACKENDS[motor](image_bytes)
+        except Exception as e:
+            erros.append(f"{motor}: {e}")
+    raise Exception(f"Falha no OCR ({'; '.join(erros)})")
     
 
 def formatar_mes_em_portugues(data_obj):
@@ -178,20 +777,22 @@ def formatar_mes_em_portugues(data_obj):
 
 
 
-def upload_comprovante_google_drive(local_path, nome_arquivo, folder_id=None):
-    st.write("🔄 Iniciando reconstrução do token...")
+def upload_comprovante_google_drive(local_path, nome_arquivo, folder_id=None, log=st.write):
+    # 'log' recebe as mensagens de progresso. Fora da thread do Streamlit (workers da
+    # outbox) as mensagens são gravadas no registro do job em vez de usar st.write.
+    log("🔄 Iniciando reconstrução do token...")
     token_bytes = base64.b64decode(st.secrets["google_drive"]["token_b64"])
     creds = pickle.loads(token_bytes)
 
-    st.write("✅ Token reconstruído. Conectando ao Google Drive...")
+    log("✅ Token reconstruído. Conectando ao Google Drive...")
     service = build('drive', 'v3', credentials=creds)
 
-    st.write("📁 Preparando metadados do arquivo...")
+    log("📁 Preparando metadados do arquivo...")
     file_metadata = {'name': nome_arquivo}
     if folder_id:
         file_metadata['parents'] = [folder_id]
 
-    st.write("📤 Iniciando upload...")
+    log("📤 Iniciando upload...")
     media = MediaFileUpload(local_path, resumable=True)
     file = service.files().create(
         body=file_metadata,
@@ -199,5 +800,1734 @@ def upload_comprovante_google_drive(local_path, nome_arquivo, folder_id=None):
         fields='id, webViewLink'
     ).execute()
 
-    st.write("✅ Upload concluído.")
-    return file.get('webViewLink')
+    log("✅ Upload concluído.")
+    return file.get('id'), file.get('webViewLink')
+
+
+# --- Outbox: envios duráveis processados em segundo plano ---
+# Cada comprovante confirmado vira um job na pasta OUTBOX_DIR: o arquivo em si
+# ('<id>.<ext>') e um registro JSON ('<id>.json') com status, tentativas, id e link no Drive.
+# Como tudo fica em disco, os jobs sobrevivem à queda da sessão ou ao reinício do
+# app e são retomados quando o pool de workers é criado novamente.
+
+_outbox_lock = threading.Lock()
+
+
+def _agora_iso():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _gravar_atomico(path, data, modo='wb'):
+    """Grava em um arquivo temporário exclusivo e o renomeia, para nunca deixar arquivos pela metade."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, modo, encoding=None if 'b' in modo else 'utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Sessões concorrentes nunca veem (nem herdam) um temporário incompleto
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _caminho_job(job_id, outbox_dir=OUTBOX_DIR):
+    return os.path.join(outbox_dir, f"{job_id}.json")
+
+
+def _salvar_job(job, outbox_dir=OUTBOX_DIR):
+    _gravar_atomico(_caminho_job(job['id'], outbox_dir), json.dumps(job, ensure_ascii=False, indent=2), modo='w')
+
+
+def gerar_nome_comprovante(nome_original, momento=None):
+    """
+    Nome do comprovante no Drive: 'AAAAMMDD_HHMMSS_<sufixo único>_<nome seguro>'.
+    O sufixo aleatório evita que envios simultâneos do mesmo nome se sobrescrevam.
+    """
+    timestamp = (momento or datetime.now()).strftime("%Y%m%d_%H%M%S")
+    safe_filename = "".join(c for c in nome_original if c.isalnum() or c in ('.', '_')).rstrip()
+    return f"{timestamp}_{uuid.uuid4().hex[:8]}_{safe_filename}"
+
+
+def enfileirar_upload(file_bytes, nome_arquivo, folder_id=None, metadados=None, outbox_dir=OUTBOX_DIR, job_id=None,
+                      indice_path=None):
+    """
+    Grava o comprovante e seu registro na outbox local e retorna o id do job.
+    'indice_path': índice de busca que recebe o id e o link no Drive quando o envio termina.
+    """
+    os.makedirs(outbox_dir, exist_ok=True)
+    job_id = job_id or uuid.uuid4().hex
+    # Mantém a extensão original para que o Drive identifique o tipo do arquivo
+    extensao = os.path.splitext(nome_arquivo)[1].lower()
+    payload = f"{job_id}{extensao}"
+
+    # O arquivo é gravado antes do registro: um job listado sempre tem o arquivo completo
+    payload_path = os.path.join(outbox_dir, payload)
+    _gravar_atomico(payload_path, file_bytes)
+    job = {
+        'id': job_id,
+        'nome_arquivo': nome_arquivo,
+        'payload': payload,
+        'sha256': hash_conteudo(file_bytes),
+        'folder_id': folder_id,
+        'metadados': metadados or {},
+        'status': 'pendente',
+        'etapa': None,
+        'tentativas': 0,
+        'drive_id': None,
+        'link': None,
+        'indice': indice_path,
+        'erro': None,
+        'criado_em': _agora_iso(),
+        'atualizado_em': _agora_iso(),
+    }
+    try:
+        with _outbox_lock:
+            _salvar_job(job, outbox_dir)
+    except BaseException:
+        # Sem registro o arquivo ficaria órfão na outbox
+        os.remove(payload_path)
+        raise
+    return job_id
+
+
+def status_upload(job_id, outbox_dir=OUTBOX_DIR):
+    """Retorna o registro de um job da outbox (ou None se não existir)."""
+    try:
+        with open(_caminho_job(job_id, outbox_dir), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def listar_uploads(outbox_dir=OUTBOX_DIR, limite=20):
+    """Lista os jobs da outbox, do mais recente para o mais antigo."""
+    if not os.path.isdir(outbox_dir):
+        return []
+    jobs = []
+    for nome in os.listdir(outbox_dir):
+        if nome.endswith('.json'):
+            job = status_upload(nome[:-len('.json')], outbox_dir)
+            if job is not None:
+                jobs.append(job)
+    jobs.sort(key=lambda job: job['criado_em'], reverse=True)
+    return jobs[:limite] if limite else jobs
+
+
+def buscar_upload_por_hash(sha256, folder_id=None, ledger_path=LEDGER_PATH, outbox_dir=OUTBOX_DIR):
+    """
+    Retorna o job que já enviou (ou está enviando) um arquivo com este conteúdo para a pasta
+    'folder_id' do Drive (a pasta de cada condomínio). O mesmo comprovante enviado para
+    outro condomínio não conta como duplicado.
+    Os lançamentos com esse SHA-256 vêm do índice do livro-caixa; só os jobs deles são lidos
+    da outbox, e não o histórico inteiro de envios.
+    """
+    if not os.path.exists(ledger_path):
+        return None
+    linhas = _conectar_ledger(ledger_path).execute(
+        "SELECT job_id FROM lancamentos WHERE sha256 = ? AND job_id IS NOT NULL ORDER BY id DESC", (sha256,)
+    ).fetchall()
+    for (job_id,) in linhas:
+        job = status_upload(job_id, outbox_dir)
+        if job is not None and job['status'] != 'erro' and job.get('folder_id') == folder_id:
+            return job
+    return None
+
+
+def _atualizar_job(job_id, outbox_dir=OUTBOX_DIR, **campos):
+    with _outbox_lock:
+        job = status_upload(job_id, outbox_dir)
+        if job is None:
+            return None
+        job.update(campos)
+        job['atualizado_em'] = _agora_iso()
+        _salvar_job(job, outbox_dir)
+        return job
+
+
+def processar_upload(job_id, outbox_dir=OUTBOX_DIR, uploader=None, espera_base=2.0):
+    """Envia um job da outbox para o Google Drive, com novas tentativas em caso de falha."""
+    uploader = uploader or upload_comprovante_google_drive
+    job = status_upload(job_id, outbox_dir)
+    if job is None or job['status'] == 'concluido':
+        return job
+
+    payload_path = os.path.join(outbox_dir, job['payload'])
+    registrar_etapa = lambda mensagem: _atualizar_job(job_id, outbox_dir, etapa=mensagem)
+
+    # Job retomado em 'enviando' (o app caiu no meio do envio): a tentativa interrompida não conta
+    primeira = job['tentativas'] if job['status'] == 'enviando' else job['tentativas'] + 1
+    for tentativa in range(max(1, primeira), UPLOAD_MAX_TENTATIVAS + 1):
+        _atualizar_job(job_id, outbox_dir, status='enviando', tentativas=tentativa, erro=None)
+        try:
+            drive_id, link = uploader(payload_path, job['nome_arquivo'], folder_id=job['folder_id'], log=registrar_etapa)
+        except Exception as e:
+            _atualizar_job(job_id, outbox_dir, erro=str(e))
+            if tentativa < UPLOAD_MAX_TENTATIVAS:
+                time.sleep(espera_base * 2 ** (tentativa - 1))
+            continue
+
+        # Envio concluído: o arquivo local não é mais necessário, só o registro
+        try:
+            os.remove(payload_path)
+        except FileNotFoundError:
+            pass
+        job = _atualizar_job(job_id, outbox_dir, status='concluido', drive_id=drive_id, link=link, erro=None)
+        if job.get('indice'):
+            try:
+                vincular_arquivo_drive(drive_id, link, job_id=job_id, indice_path=job['indice'])
+            except sqlite3.Error:
+                pass  # O envio em si deu certo; a indexação do Drive completa o vínculo depois
+        return job
+
+    return _atualizar_job(job_id, outbox_dir, status='erro')
+
+
+@st.cache_resource
+def get_upload_executor(max_workers=UPLOAD_WORKERS):
+    """Cria o pool de workers de envio (único por processo) e retoma jobs pendentes."""
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-drive')
+    for job in listar_uploads(limite=None):
+        if job['status'] in ('pendente', 'enviando'):
+            executor.submit(processar_upload, job['id'])
+    return executor
+
+
+def submeter_upload(file_bytes, nome_arquivo, folder_id=None, metadados=None, job_id=None, indice_path=None):
+    """Grava o comprovante na outbox e agenda o envio em segundo plano; retorna imediatamente."""
+    # O pool é obtido antes de enfileirar: na criação ele retoma os jobs pendentes
+    # e, assim, não agenda o job novo duas vezes.
+    executor = get_upload_executor()
+    job_id = enfileirar_upload(file_bytes, nome_arquivo, folder_id=folder_id, metadados=metadados, job_id=job_id,
+                               indice_path=indice_path)
+    executor.submit(processar_upload, job_id)
+    return job_id
+
+
+def reenviar_upload(job_id, outbox_dir=OUTBOX_DIR, executor=None):
+    """
+    Recoloca na fila um job que terminou com erro. Jobs pendentes ou em envio não são
+    tocados: agendá-los de novo faria o mesmo arquivo ser enviado duas vezes.
+    """
+    with _outbox_lock:
+        job = status_upload(job_id, outbox_dir)
+        if job is None or job['status'] != 'erro':
+            return job
+        job.update(status='pendente', tentativas=0, erro=None, atualizado_em=_agora_iso())
+        _salvar_job(job, outbox_dir)
+    (executor or get_upload_executor()).submit(processar_upload, job_id, outbox_dir)
+    return job
+
+
+
+# --- Extração de dados dos comprovantes ---
+# Versão do extrator de campos: ao mudar a lógica, os campos em cache são recalculados
+EXTRATOR_VERSAO = 2
+
+# Palavras que, logo antes de um valor/data/nome, indicam que ele é o do pagamento
+_CONTEXTO_VALOR = re.compile(r'valor|total|pago|pagamento|transferid|pix|quantia')
+_CONTEXTO_DATA = re.compile(r'data|pagamento|realizad|efetuad|transferencia|emissao')
+_CONTEXTO_PAGADOR = re.compile(r'pagador|origem|remetente|de:|nome')
+_JANELA_CONTEXTO = 40
+
+
+def hash_conteudo(file_bytes):
+    """SHA-256 do conteúdo do arquivo, usado para cache e detecção de duplicados."""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def _campos_completos(text, moradores_map):
+    # Valor, data e (se houver mapeamento) morador: o que o formulário de confirmação precisa
+    campos = extrair_campos_comprovante(text, moradores_map or {})
+    return bool(campos['valores'] and campos['datas'] and (campos['nome'] or not moradores_map))
+
+
+def extrair_texto_pdf(file_bytes, moradores_map=None, dpi=PDF_OCR_DPI, max_workers=OCR_WORKERS):
+    """
+    Extrai o texto de um PDF. Páginas com camada de texto são lidas diretamente; só as
+    páginas sem texto (digitalizadas) são rasterizadas e enviadas ao OCR, em paralelo.
+    A leitura para assim que valor, data e morador já tiverem sido encontrados.
+    """
+    partes = []  # (número da página, texto), unidas no final
+    with fitz.open(stream=file_bytes, filetype="pdf") as pdf_document:
+        paginas_digitalizadas = []
+        for page in pdf_document:
+            page_text = page.get_text()
+            if len(page_text.strip()) >= PDF_MIN_CARACTERES_TEXTO:
+                partes.append((page.number, page_text))
+            else:
+                paginas_digitalizadas.append(page.number)
+
+        juntar = lambda: "\n".join(texto for _, texto in sorted(partes))
+        if not paginas_digitalizadas or _campos_completos(juntar(), moradores_map):
+            return juntar()
+
+        # Lotes do tamanho do pool: entre um lote e outro verifica se já dá para parar.
+        # A rasterização fica na thread atual (o PyMuPDF não é thread-safe); só o OCR é paralelo.
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ocr-pdf') as executor:
+            for inicio in range(0, len(paginas_digitalizadas), max_workers):
+                lote = paginas_digitalizadas[inicio:inicio + max_workers]
+                imagens = [
+                    pdf_document[numero].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY).tobytes('jpg', jpg_quality=OCR_IMAGEM_QUALIDADE)
+                    for numero in lote
+                ]
+                partes.extend(zip(lote, executor.map(ocr_imagem, imagens)))
+                if _campos_completos(juntar(), moradores_map):
+                    break
+
+    return juntar()
+
+
+def extrair_texto_comprovante(file_bytes, file_ext, moradores_map=None):
+    """Extrai o texto de um comprovante: PDF (texto ou páginas digitalizadas) ou OCR da imagem."""
+    text = ""
+    if file_ext == "pdf":
+        text = extrair_texto_pdf(file_bytes, moradores_map)
+    elif file_ext in ["jpg", "jpeg"]:
+        # Tudo em memória: sessões simultâneas não disputam arquivos temporários
+        text = ocr_imagem(preprocessar_imagem_ocr(file_bytes))
+    return text
+
+
+def normalizar_texto(text):
+    """Remove acentos e converte para minúsculas, para buscas tolerantes a grafia."""
+    return unicodedata.normalize('NFKD', str(text)).encode('ASCII', 'ignore').decode('ASCII').lower()
+
+
+@functools.lru_cache(maxsize=8)
+def _compilar_extrator(moradores_itens):
+    """
+    Monta uma única regex que reconhece valores, datas e qualquer nome de morador.
+    Recebe os itens do mapeamento como tupla (hashable) para que o resultado fique em cache.
+    """
+    nomes = {}  # nome normalizado -> (nome original, apartamento)
+    for nome, apto in moradores_itens:
+        nome_normalizado = normalizar_texto(nome).strip()
+        if nome_normalizado:
+            nomes.setdefault(nome_normalizado, (nome, str(apto)))
+
+    partes = [
+        r'r\$\s*(?P<valor>\d{1,3}(?:\.\d{3})*,\d{2})',
+        r'\b(?P<data>\d{2}/\d{2}/\d{4})\b',
+    ]
+    if nomes:
+        # Nomes mais longos primeiro, para 'Ana Paula' vencer 'Ana'
+        alternativas = '|'.join(re.escape(nome) for nome in sorted(nomes, key=len, reverse=True))
+        partes.append(rf'\b(?P<nome>{alternativas})\b')
+    return re.compile('|'.join(partes)), nomes
+
+
+def _pontuar(candidatos, chave, contexto, padrao_contexto, posicao):
+    # Cada ocorrência soma 1 ponto; ocorrências precedidas de uma palavra-chave somam 3
+    pontos = 3 if padrao_contexto.search(contexto) else 1
+    if chave in candidatos:
+        candidatos[chave]['score'] += pontos
+    else:
+        candidatos[chave] = {'score': pontos, 'posicao': posicao}
+
+
+def _ordenar(candidatos):
+    return sorted(candidatos, key=lambda chave: (-candidatos[chave]['score'], candidatos[chave]['posicao']))
+
+
+def extrair_campos_comprovante(text, moradores_map):
+    """
+    Procura valores (R$), datas e o morador pagante no texto extraído, em uma única
+    passada sobre o texto normalizado. Os candidatos voltam ordenados por pontuação.
+    """
+    padrao, nomes = _compilar_extrator(tuple(sorted((str(k), str(v)) for k, v in moradores_map.items())))
+    texto_normalizado = normalizar_texto(text)
+
+    valores, datas, moradores = {}, {}, {}
+    for match in padrao.finditer(texto_normalizado):
+        contexto = texto_normalizado[max(0, match.start() - _JANELA_CONTEXTO):match.start()]
+        if match.group('valor'):
+            _pontuar(valores, match.group('valor'), contexto, _CONTEXTO_VALOR, match.start())
+        elif match.group('data'):
+            try:
+                datetime.strptime(match.group('data'), '%d/%m/%Y')
+            except ValueError:
+                continue  # Ex.: '31/02/2026' ou números de documento no formato de data
+            _pontuar(datas, match.group('data'), contexto, _CONTEXTO_DATA, match.start())
+        else:
+            _pontuar(moradores, match.group('nome'), contexto, _CONTEXTO_PAGADOR, match.start())
+
+    valores_ordenados = _ordenar(valores)
+    datas_ordenadas = _ordenar(datas)
+    candidatos_moradores = [
+        {'nome': nomes[chave][0], 'apartamento': nomes[chave][1], 'score': moradores[chave]['score']}
+        for chave in _ordenar(moradores)
+    ]
+    melhor_morador = candidatos_moradores[0] if candidatos_moradores else {'nome': None, 'apartamento': None}
+
+    return {
+        'valores': valores_ordenados,
+        'datas': datas_ordenadas,
+        'nome': melhor_morador['nome'],
+        'apartamento': melhor_morador['apartamento'],
+        'candidatos': {
+            'valores': [{'valor': v, 'score': valores[v]['score']} for v in valores_ordenados],
+            'datas': [{'data': d, 'score': datas[d]['score']} for d in datas_ordenadas],
+            'moradores': candidatos_moradores,
+        },
+    }
+
+
+def _chave_campos(moradores_map):
+    # Os campos dependem do mapeamento de moradores: se ele mudar, o texto em cache
+    # continua válido, mas os campos precisam ser recalculados.
+    chave = json.dumps([EXTRATOR_VERSAO, moradores_map], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(chave.encode('utf-8')).hexdigest()
+
+
+def _chave_texto(file_ext, moradores_map):
+    # A leitura de PDFs para assim que valor, data e morador aparecem (extrair_texto_pdf): o texto
+    # de um PDF pode ter ficado incompleto para outro mapeamento de moradores. Imagens não dependem dele.
+    if file_ext != "pdf":
+        return None
+    chave = json.dumps(sorted(moradores_map or {}), ensure_ascii=False)
+    return hashlib.sha256(chave.encode('utf-8')).hexdigest()
+
+
+def texto_em_cache_valido(registro, file_ext, moradores_map):
+    """Indica se o texto de uma extração em cache serve para este mapeamento de moradores."""
+    return registro is not None and 'chave_texto' in registro and \
+        registro['chave_texto'] in (None, _chave_texto(file_ext, moradores_map))
+
+
+def _caminho_cache_extracao(sha256, cache_dir=EXTRACAO_CACHE_DIR):
+    return os.path.join(cache_dir, f"{sha256}.json")
+
+
+def ler_cache_extracao(sha256, cache_dir=EXTRACAO_CACHE_DIR):
+    """Lê a extração em cache de um arquivo (ou None se não houver)."""
+    path = _caminho_cache_extracao(sha256, cache_dir)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            registro = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    # Atualiza a data de modificação: a poda remove primeiro os menos usados
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return registro
+
+
+def gravar_cache_extracao(sha256, registro, cache_dir=EXTRACAO_CACHE_DIR, max_bytes=EXTRACAO_CACHE_MAX_BYTES):
+    """Grava a extração de um arquivo no cache e poda o cache se passar do limite."""
+    os.makedirs(cache_dir, exist_ok=True)
+    _gravar_atomico(_caminho_cache_extracao(sha256, cache_dir), json.dumps(registro, ensure_ascii=False), modo='w')
+    _podar_cache_extracao(cache_dir, max_bytes)
+
+
+def _podar_cache_extracao(cache_dir, max_bytes):
+    entradas = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.name.endswith('.json'):
+                # Outra extração (extrair_lote) pode estar podando ao mesmo tempo
+                try:
+                    info = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entradas.append((info.st_mtime, info.st_size, entry.path))
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, path in sorted(entradas):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= tamanho
+
+
+def extrair_dados_comprovante(file_bytes, file_ext, moradores_map, cache_dir=EXTRACAO_CACHE_DIR):
+    """
+    Extrai texto e campos de um comprovante, reaproveitando o cache em disco.
+    O OCR/leitura do PDF só roda na primeira vez que um conteúdo é visto.
+    """
+    sha256 = hash_conteudo(file_bytes)
+    chave_campos = _chave_campos(moradores_map)
+
+    registro = ler_cache_extracao(sha256, cache_dir)
+    if not texto_em_cache_valido(registro, file_ext, moradores_map):
+        registro = {
+            'sha256': sha256,
+            'texto': extrair_texto_comprovante(file_bytes, file_ext, moradores_map),
+            'chave_texto': _chave_texto(file_ext, moradores_map),
+        }
+    elif registro.get('chave_campos') == chave_campos:
+        return registro
+
+    registro['campos'] = extrair_campos_comprovante(registro['texto'], moradores_map)
+    registro['chave_campos'] = chave_campos
+    gravar_cache_extracao(sha256, registro, cache_dir)
+    return registro
+
+
+def extrair_lote(arquivos, moradores_map, max_workers=OCR_WORKERS * 2):
+    """
+    Extrai vários comprovantes em paralelo. 'arquivos' é uma lista de (nome, extensão, bytes);
+    devolve, na mesma ordem, o registro de cada um ou {'erro': mensagem} se a extração falhar.
+    """
+    def extrair(arquivo):
+        nome, file_ext, file_bytes = arquivo
+        try:
+            return extrair_dados_comprovante(file_bytes, file_ext, moradores_map)
+        except Exception as e:
+            return {'sha256': hash_conteudo(file_bytes), 'erro': f"{nome}: {e}"}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='extracao-lote') as executor:
+        return list(executor.map(extrair, arquivos))
+
+
+# --- Uploads na sessão ---
+# Cada upload é extraído uma única vez e vira um registro compacto (campos, prévia do texto e
+# os bytes ou, se o arquivo for grande, o caminho de uma cópia temporária em disco). É esse
+# registro que fica no session_state: os reruns do formulário não releem nem reextraem o arquivo,
+# e a memória por sessão não cresce com o tamanho do comprovante. As cópias em disco são
+# "tocadas" a cada uso e uma thread apaga periodicamente as que ficaram sem uso.
+def validar_tamanho_upload(nome, tamanho, tamanho_max=UPLOAD_TAMANHO_MAX):
+    """Recusa arquivos vazios ou acima do limite por arquivo (antes de ler o conteúdo)."""
+    if tamanho == 0:
+        raise ValueError(f"O arquivo '{nome}' está vazio.")
+    if tamanho > tamanho_max:
+        raise ValueError(
+            f"O arquivo '{nome}' tem {tamanho / 1024 / 1024:.1f} MB; o limite é {tamanho_max / 1024 / 1024:.0f} MB por arquivo."
+        )
+
+
+def previa_texto(texto, limite=UPLOAD_PREVIA_CARACTERES):
+    """Trecho inicial do texto extraído, para exibição."""
+    if len(texto) <= limite:
+        return texto
+    return texto[:limite].rstrip() + f"\n\n[... mais {len(texto) - limite} caracteres]"
+
+
+def _podar_uploads_temporarios(tmp_dir, idade_max=UPLOAD_TMP_IDADE_MAX):
+    if not os.path.isdir(tmp_dir):
+        return
+    limite = time.time() - idade_max
+    with os.scandir(tmp_dir) as it:
+        for entry in it:
+            try:
+                if entry.name.startswith('upload_') and entry.stat().st_mtime < limite:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+@st.cache_resource
+def iniciar_poda_uploads(tmp_dir=UPLOAD_TMP_DIR, intervalo=UPLOAD_TMP_PODA_INTERVALO):
+    """
+    Thread (única por processo) que apaga as cópias temporárias sem uso: a primeira poda é na hora,
+    o que limpa as sobras de antes de um reinício do app, e as seguintes a cada 'intervalo' segundos.
+    """
+    def podar():
+        while True:
+            try:
+                _podar_uploads_temporarios(tmp_dir)
+            except OSError:
+                pass  # Pasta removida ou sem permissão: tenta de novo na próxima rodada
+            time.sleep(intervalo)
+
+    thread = threading.Thread(target=podar, name='poda-uploads', daemon=True)
+    thread.start()
+    return thread
+
+
+def registrar_upload(nome, file_bytes, extracao, limite_memoria=UPLOAD_LIMITE_MEMORIA, tmp_dir=UPLOAD_TMP_DIR):
+    """Monta o registro compacto de um upload já extraído (saída de extrair_dados_comprovante/extrair_lote)."""
+    file_ext = nome.split('.')[-1].lower()
+    registro = {
+        'nome': nome,
+        'ext': file_ext,
+        'tamanho': len(file_bytes),
+        'sha256': extracao['sha256'],
+        'campos': extracao['campos'],
+        'previa': previa_texto(extracao['texto']),
+        'caracteres': len(extracao['texto']),
+        'bytes': None,
+        'caminho': None,
+    }
+    if len(file_bytes) <= limite_memoria:
+        registro['bytes'] = file_bytes
+        return registro
+
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, caminho = tempfile.mkstemp(prefix='upload_', suffix=f".{file_ext}", dir=tmp_dir)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(file_bytes)
+    registro['caminho'] = caminho
+    return registro
+
+
+def manter_upload(registro):
+    """Marca a cópia temporária do upload como em uso, para a poda não apagá-la enquanto a sessão a usa."""
+    if registro.get('caminho'):
+        try:
+            os.utime(registro['caminho'])
+        except FileNotFoundError:
+            pass
+
+
+def bytes_upload(registro):
+    """Conteúdo original do upload (da memória ou da cópia temporária em disco)."""
+    if registro['bytes'] is not None:
+        return registro['bytes']
+    manter_upload(registro)
+    try:
+        with open(registro['caminho'], 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        raise Exception(f"A cópia temporária de '{registro['nome']}' expirou. Envie o arquivo novamente.")
+
+
+def texto_upload(registro, moradores_map):
+    """
+    Texto completo do upload: vem do cache de extração; se já foi podado ou foi lido com outro
+    mapeamento de moradores (ver texto_em_cache_valido), extrai de novo.
+    """
+    extracao = ler_cache_extracao(registro['sha256'])
+    if not texto_em_cache_valido(extracao, registro['ext'], moradores_map):
+        extracao = extrair_dados_comprovante(bytes_upload(registro), registro['ext'], moradores_map)
+    return extracao['texto']
+
+
+def descartar_upload(registro):
+    """Apaga a cópia temporária do upload, se houver."""
+    if registro.get('caminho'):
+        try:
+            os.remove(registro['caminho'])
+        except FileNotFoundError:
+            pass
+
+
+
+# --- Livro-caixa (ledger) dos lançamentos confirmados ---
+# Cada comprovante confirmado gera uma linha que nunca é alterada nem apagada
+# (correções entram como novos lançamentos). Os índices cobrem as consultas dos
+# dashboards: por apartamento/mês/categoria e por mês/categoria.
+_LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lancamentos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    registrado_em TEXT NOT NULL,
+    data_pagamento TEXT NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    apartamento TEXT,
+    morador TEXT,
+    categoria TEXT NOT NULL,
+    valor REAL NOT NULL,
+    arquivo TEXT,
+    sha256 TEXT,
+    job_id TEXT,
+    usuario TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_lancamentos_apto_mes_categoria ON lancamentos (apartamento, ano, mes, categoria);
+CREATE INDEX IF NOT EXISTS idx_lancamentos_mes_categoria ON lancamentos (ano, mes, categoria);
+CREATE INDEX IF NOT EXISTS idx_lancamentos_sha256 ON lancamentos (sha256);
+CREATE TRIGGER IF NOT EXISTS lancamentos_sem_update BEFORE UPDATE ON lancamentos
+BEGIN SELECT RAISE(ABORT, 'O livro-caixa é somente inclusão'); END;
+CREATE TRIGGER IF NOT EXISTS lancamentos_sem_delete BEFORE DELETE ON lancamentos
+BEGIN SELECT RAISE(ABORT, 'O livro-caixa é somente inclusão'); END;
+"""
+
+
+# --- Conexões SQLite (livro-caixa e índice de busca) ---
+# Cada thread reaproveita uma conexão por arquivo (o sqlite3 não compartilha conexões entre
+# threads). O schema e o modo WAL (leituras dos dashboards não bloqueiam as gravações) são
+# aplicados uma vez por arquivo no processo; se o arquivo for apagado ou trocado, tudo é refeito.
+_sqlite_local = threading.local()
+_sqlite_iniciados = {}  # caminho -> inode do arquivo em que o schema foi aplicado
+_sqlite_lock = threading.Lock()
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def _conexao_sqlite(path, schema):
+    caminho = os.path.abspath(path)
+    conexoes = getattr(_sqlite_local, 'conexoes', None)
+    if conexoes is None:
+        conexoes = _sqlite_local.conexoes = {}
+
+    inode = _inode(caminho)
+    conn, inode_conexao = conexoes.get(caminho, (None, None))
+    if conn is not None and inode is not None and inode == inode_conexao:
+        return conn
+    if conn is not None:
+        conn.close()
+
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    conn = sqlite3.connect(caminho, timeout=10)
+    with _sqlite_lock:
+        inode = _inode(caminho)
+        if inode is None or _sqlite_iniciados.get(caminho) != inode:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(schema)
+            inode = _inode(caminho)
+            _sqlite_iniciados[caminho] = inode
+    conexoes[caminho] = (conn, inode)
+    return conn
+
+
+def _conectar_ledger(ledger_path=LEDGER_PATH):
+    return _conexao_sqlite(ledger_path, _LEDGER_SCHEMA)
+
+
+def _validar_lancamento(data, valor):
+    try:
+        data_pagamento = datetime.strptime(str(data), '%d/%m/%Y')
+    except ValueError:
+        raise ValueError(f"Data inválida para o lançamento: '{data}' (use DD/MM/AAAA)")
+    valor_float = clean_currency(valor, default=None)
+    if valor_float is None:
+        raise ValueError(f"Valor inválido para o lançamento: '{valor}'")
+    return data_pagamento, valor_float
+
+
+def registrar_lancamento(data, valor, categoria, apartamento=None, morador=None, arquivo=None,
+                         sha256=None, job_id=None, usuario=None, ledger_path=LEDGER_PATH):
+    """Grava um lançamento confirmado no livro-caixa. 'data' no formato DD/MM/AAAA."""
+    data_pagamento, valor_float = _validar_lancamento(data, valor)
+
+    conn = _conectar_ledger(ledger_path)
+    with conn:
+        cursor = conn.execute(
+            """INSERT INTO lancamentos (registrado_em, data_pagamento, ano, mes, apartamento, morador,
+                                        categoria, valor, arquivo, sha256, job_id, usuario)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (_agora_iso(), data_pagamento.strftime('%Y-%m-%d'), data_pagamento.year, data_pagamento.month,
+             None if apartamento is None else str(apartamento), morador, categoria, valor_float,
+             arquivo, sha256, job_id, usuario)
+        )
+    return cursor.lastrowid
+
+
+def consultar_lancamentos(apartamento=None, ano=None, mes=None, categoria=None, ledger_path=LEDGER_PATH):
+    """Consulta o livro-caixa (filtros opcionais, combinados com E) e retorna um DataFrame."""
+    filtros = {'apartamento': None if apartamento is None else str(apartamento), 'ano': ano, 'mes': mes, 'categoria': categoria}
+    condicoes = [f"{coluna} = ?" for coluna, valor in filtros.items() if valor is not None]
+    parametros = [valor for valor in filtros.values() if valor is not None]
+    query = "SELECT * FROM lancamentos"
+    if condicoes:
+        query += " WHERE " + " AND ".join(condicoes)
+    query += " ORDER BY data_pagamento, id"
+
+    return pd.read_sql_query(query, _conectar_ledger(ledger_path), params=parametros)
+
+
+def lancar_comprovante(file_bytes, nome_original, metadados, folder_id=None, ledger_path=LEDGER_PATH,
+                       texto=None, indice_path=INDICE_COMPROVANTES_PATH):
+    """
+    Confirma um comprovante: registra o lançamento no livro-caixa, agenda o envio ao Drive
+    (outbox) e indexa o texto extraído para a busca. Retorna o id do job de envio.
+    """
+    # O lançamento é gravado primeiro (já com o id do job): se a inclusão falhar,
+    # nada foi enfileirado e o arquivo não chega ao Drive sem linha no livro-caixa.
+    # O texto é indexado antes do envio, para o worker encontrar a linha ao gravar o id no Drive.
+    nome_arquivo = gerar_nome_comprovante(nome_original)
+    job_id = uuid.uuid4().hex
+    registrar_lancamento(
+        metadados['data'], metadados['valor'], metadados['categoria'],
+        apartamento=metadados.get('apartamento'), morador=metadados.get('morador'),
+        arquivo=nome_arquivo, sha256=hash_conteudo(file_bytes), job_id=job_id,
+        usuario=metadados.get('usuario'), ledger_path=ledger_path
+    )
+    if texto is not None:
+        indexar_comprovante(
+            hash_conteudo(file_bytes), texto, arquivo=nome_arquivo, metadados=metadados,
+            job_id=job_id, indice_path=indice_path
+        )
+    submeter_upload(file_bytes, nome_arquivo, folder_id=folder_id, metadados=metadados, job_id=job_id,
+                    indice_path=indice_path if texto is not None else None)
+    return job_id
+
+
+# --- Índice de busca dos comprovantes (SQLite FTS5) ---
+# O texto extraído de cada comprovante (no upload ou pela indexação dos arquivos já no Drive)
+# fica num índice invertido local: a busca não lista o Drive nem repete o OCR.
+# 'remove_diacritics 2' faz 'Joao' encontrar 'João'; '150,00' e '05/02/2026' viram frases.
+_INDICE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS comprovantes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sha256 TEXT NOT NULL UNIQUE,
+    arquivo TEXT,
+    data_pagamento TEXT,
+    valor REAL,
+    morador TEXT,
+    apartamento TEXT,
+    categoria TEXT,
+    job_id TEXT,
+    drive_id TEXT,
+    link TEXT,
+    indexado_em TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_comprovantes_drive_id ON comprovantes (drive_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS comprovantes_fts USING fts5(
+    arquivo, morador, detalhes, texto, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+def _conectar_indice(indice_path=INDICE_COMPROVANTES_PATH):
+    return _conexao_sqlite(indice_path, _INDICE_SCHEMA)
+
+
+def indexar_comprovante(sha256, texto, arquivo=None, metadados=None, job_id=None, drive_id=None, link=None,
+                        indice_path=INDICE_COMPROVANTES_PATH):
+    """
+    Grava (ou atualiza, pelo SHA-256) um comprovante no índice de busca.
+    'metadados' segue o formato de lancar_comprovante: valor, data (DD/MM/AAAA), morador, apartamento, categoria.
+    """
+    metadados = metadados or {}
+    valor = clean_currency(metadados.get('valor'), default=None) if metadados.get('valor') not in (None, '') else None
+    try:
+        data_pagamento = datetime.strptime(str(metadados.get('data')), '%d/%m/%Y').strftime('%Y-%m-%d')
+    except ValueError:
+        data_pagamento = None
+    morador = metadados.get('morador')
+    apartamento = None if metadados.get('apartamento') is None else str(metadados['apartamento'])
+    detalhes = " ".join(str(parte) for parte in [
+        format_currency_brl(valor) if valor is not None else None, metadados.get('data'),
+        f"Apto {apartamento}" if apartamento else None, metadados.get('categoria'),
+    ] if parte)
+
+    conn = _conectar_indice(indice_path)
+    with conn:
+        anterior = conn.execute("SELECT id, job_id, drive_id, link FROM comprovantes WHERE sha256 = ?", (sha256,)).fetchone()
+        if anterior:
+            # Reindexação: mantém as referências já conhecidas (job, arquivo no Drive)
+            job_id, drive_id, link = job_id or anterior[1], drive_id or anterior[2], link or anterior[3]
+            conn.execute("DELETE FROM comprovantes WHERE id = ?", (anterior[0],))
+            conn.execute("DELETE FROM comprovantes_fts WHERE rowid = ?", (anterior[0],))
+        cursor = conn.execute(
+            """INSERT INTO comprovantes (sha256, arquivo, data_pagamento, valor, morador, apartamento, categoria,
+                                         job_id, drive_id, link, indexado_em)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (sha256, arquivo, data_pagamento, valor, morador, apartamento, metadados.get('categoria'),
+             job_id, drive_id, link, _agora_iso())
+        )
+        conn.execute(
+            "INSERT INTO comprovantes_fts (rowid, arquivo, morador, detalhes, texto) VALUES (?, ?, ?, ?, ?)",
+            (cursor.lastrowid, arquivo or '', morador or '', detalhes, texto or '')
+        )
+    return cursor.lastrowid
+
+
+def _consulta_fts(termos):
+    # Cada termo vira uma frase entre aspas (pontuação e operadores do FTS5 não quebram a consulta);
+    # o último também casa por prefixo, para a busca responder enquanto se digita.
+    frases = ['"' + termo.replace('"', '""') + '"' for termo in str(termos).split()]
+    if not frases:
+        return None
+    frases[-1] += '*'
+    return " ".join(frases)
+
+
+def buscar_comprovantes(termos, limite=50, indice_path=INDICE_COMPROVANTES_PATH, outbox_dir=OUTBOX_DIR):
+    """
+    Busca no índice (todos os termos, sem diferenciar acentos e maiúsculas), dos mais relevantes aos menos.
+    Retorna um DataFrame com os dados do comprovante, o link no Drive e um trecho do texto com os termos.
+    """
+    colunas = ['arquivo', 'data_pagamento', 'valor', 'morador', 'apartamento', 'categoria', 'link', 'trecho']
+    consulta = _consulta_fts(termos)
+    if consulta is None or not os.path.exists(indice_path):
+        return pd.DataFrame(columns=colunas)
+
+    df = pd.read_sql_query(
+        """SELECT c.arquivo, c.data_pagamento, c.valor, c.morador, c.apartamento, c.categoria, c.job_id, c.link,
+                  snippet(comprovantes_fts, 3, '**', '**', '…', 12) AS trecho
+           FROM comprovantes_fts JOIN comprovantes c ON c.id = comprovantes_fts.rowid
+           WHERE comprovantes_fts MATCH ?
+           ORDER BY bm25(comprovantes_fts) LIMIT ?""",
+        _conectar_indice(indice_path), params=(consulta, limite)
+    )
+
+    # Comprovantes enviados pelo app ganham o link quando o job da outbox termina
+    sem_link = df['link'].isna() & df['job_id'].notna()
+    df.loc[sem_link, 'link'] = [
+        (status_upload(job_id, outbox_dir) or {}).get('link') for job_id in df.loc[sem_link, 'job_id']
+    ]
+    return df[colunas]
+
+
+def listar_arquivos_drive(service, folder_id):
+    """Todos os arquivos (não excluídos) de uma pasta do Drive, percorrendo as páginas da listagem."""
+    arquivos, page_token = [], None
+    while True:
+        resposta = service.files().list(
+            q=f"'{folder_id}' in parents and trashed = false",
+            fields="nextPageToken, files(id, name, mimeType, webViewLink)",
+            pageSize=1000, pageToken=page_token
+        ).execute()
+        arquivos.extend(resposta.get("files", []))
+        page_token = resposta.get("nextPageToken")
+        if not page_token:
+            return arquivos
+
+
+def baixar_arquivo_drive(service, file_id):
+    """Conteúdo (bytes) de um arquivo do Drive."""
+    return service.files().get_media(fileId=file_id).execute()
+
+
+def vincular_arquivo_drive(drive_id, link, sha256=None, job_id=None, indice_path=INDICE_COMPROVANTES_PATH):
+    """
+    Grava o id e o link no Drive no comprovante já indexado (pelo job de envio ou pelo SHA-256),
+    sem tocar nos dados confirmados no lançamento. Retorna True se o comprovante estava no índice.
+    """
+    coluna, chave = ('job_id', job_id) if job_id else ('sha256', sha256)
+    conn = _conectar_indice(indice_path)
+    with conn:
+        cursor = conn.execute(
+            f"UPDATE comprovantes SET drive_id = COALESCE(drive_id, ?), link = COALESCE(link, ?) WHERE {coluna} = ?",
+            (drive_id, link, chave)
+        )
+    return cursor.rowcount > 0
+
+
+def drive_ids_indexados(indice_path=INDICE_COMPROVANTES_PATH):
+    conn = _conectar_indice(indice_path)
+    return {linha[0] for linha in conn.execute("SELECT drive_id FROM comprovantes WHERE drive_id IS NOT NULL")}
+
+
+def arquivos_drive_pendentes(arquivos, indice_path=INDICE_COMPROVANTES_PATH):
+    """Arquivos do Drive (PDF/JPG) que ainda não estão no índice de busca; os demais formatos nunca são indexados."""
+    ja_indexados = drive_ids_indexados(indice_path)
+    return [
+        arquivo for arquivo in arquivos
+        if arquivo['id'] not in ja_indexados and arquivo['name'].lower().endswith(('.pdf', '.jpg', '.jpeg'))
+    ]
+
+
+def indexar_arquivos_drive(arquivos, baixar, moradores_map, indice_path=INDICE_COMPROVANTES_PATH, progresso=None):
+    """
+    Indexa comprovantes que já estão no Drive ('arquivos' como em listar_arquivos_drive; 'baixar(file_id)' -> bytes).
+    Só PDF/JPG ainda fora do índice são baixados (ver arquivos_drive_pendentes);
+    o texto vem do cache de extração quando o arquivo já passou pelo OCR.
+    Um arquivo cujo conteúdo já está no índice (enviado pelo app) só ganha o id e o link no Drive:
+    os dados confirmados no lançamento não são trocados pelos extraídos.
+    Retorna (quantidade indexada, lista de erros).
+    """
+    pendentes = arquivos_drive_pendentes(arquivos, indice_path)
+    indexados, erros = 0, []
+    for posicao, arquivo in enumerate(pendentes, start=1):
+        try:
+            file_bytes = baixar(arquivo['id'])
+            ja_no_indice = vincular_arquivo_drive(
+                arquivo['id'], arquivo.get('webViewLink'), sha256=hash_conteudo(file_bytes), indice_path=indice_path
+            )
+            if not ja_no_indice:
+                dados = extrair_dados_comprovante(file_bytes, arquivo['name'].rsplit('.', 1)[-1].lower(), moradores_map)
+                campos = dados['campos']
+                metadados = {
+                    'valor': campos['valores'][0] if campos['valores'] else None,
+                    'data': campos['datas'][0] if campos['datas'] else None,
+                    'morador': campos['nome'],
+                    'apartamento': campos['apartamento'],
+                }
+                indexar_comprovante(
+                    dados['sha256'], dados['texto'], arquivo=arquivo['name'], metadados=metadados,
+                    drive_id=arquivo['id'], link=arquivo.get('webViewLink'), indice_path=indice_path
+                )
+            indexados += 1
+        except Exception as e:
+            erros.append(f"{arquivo['name']}: {e}")
+        if progresso:
+            progresso(posicao, len(pendentes))
+    return indexados, erros
+
+
+
+# --- Conciliação: comprovantes (livro-caixa) x grade de cotas da planilha ---
+CONCILIACAO_OK = "OK"
+CONCILIACAO_SEM_COMPROVANTE = "Sem comprovante"
+CONCILIACAO_SEM_PLANILHA = "Não lançado na planilha"
+CONCILIACAO_DIVERGENTE = "Valor divergente"
+CONCILIACAO_DUPLICADO = "Comprovante duplicado"
+CONCILIACAO_SEM_SALDO_ANTERIOR = "Sem saldo anterior"
+
+# Resultado por mês, chaveado pela impressão digital dos dados daquele mês:
+# só os meses cujos dados mudaram são recalculados.
+_conciliacao_cache = LRUCache(maxsize=1024)
+_conciliacao_lock = threading.Lock()
+
+
+def normalizar_apartamento(value):
+    """Normaliza identificadores de apartamento ('AP01', 'Apto 1', 1, '1') para '1'."""
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    numero = re.search(r'\d+', str(value))
+    return str(int(numero.group())) if numero else str(value).strip()
+
+
+def _impressao_digital(df):
+    if df is None or df.empty:
+        return ''
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+
+def cota_por_apartamento(df_fluxo, n_apartamentos, categoria='Cotas Condominiais (Até dia 08)'):
+    """Cota devida por apartamento em cada mês ({month_num: valor}): total da categoria no fluxo dividido pelos apartamentos."""
+    if df_fluxo is None or categoria not in df_fluxo.columns or not n_apartamentos:
+        return {}
+    return {int(mes): float(valor) / n_apartamentos for mes, valor in zip(df_fluxo['month_num'], df_fluxo[categoria].fillna(0.0))}
+
+
+def pagamentos_da_grade(df_cotas, cota_mensal):
+    """
+    A grade 'Creditos / Debitos AP' guarda o saldo acumulado de cada apartamento (positivo é crédito,
+    negativo é débito, como em calcular_inadimplencia). O pagamento de um mês é o que explica a variação
+    do saldo: saldo do mês - saldo do mês anterior + cota do mês ('cota_mensal': valor ou {month_num: valor}).
+    Sem o saldo do mês anterior (início da grade), o pagamento fica NaN. Retorna Apartamento, Ano,
+    month_num, Saldo e Pagamento.
+    """
+    df = pd.DataFrame({
+        'Apartamento': df_cotas['Apartamento'].map(normalizar_apartamento),
+        'Ano': pd.to_numeric(df_cotas['Ano'], errors='coerce') if 'Ano' in df_cotas else np.nan,
+        'month_num': pd.to_numeric(df_cotas['month_num'], errors='coerce'),
+        'Saldo': pd.to_numeric(df_cotas['Valor Pago'], errors='coerce').fillna(0.0),
+    }).dropna(subset=['month_num'])
+    df['Ano'] = df['Ano'].fillna(0).astype(int)
+    df = df.groupby(['Apartamento', 'Ano', 'month_num'], as_index=False)['Saldo'].sum()
+    df = df.sort_values(['Apartamento', 'Ano', 'month_num'], ignore_index=True)
+
+    # Só vale como mês anterior a linha do mesmo apartamento exatamente um mês antes
+    indice_mes = df['Ano'] * 12 + df['month_num']
+    mesmo_apartamento = df['Apartamento'].eq(df['Apartamento'].shift())
+    consecutivo = mesmo_apartamento & indice_mes.diff().eq(1)
+    if isinstance(cota_mensal, dict):
+        cota = df['month_num'].map(lambda mes: cota_mensal.get(int(mes), 0.0))
+    else:
+        cota = float(cota_mensal or 0.0)
+    pagamento = df['Saldo'] - df['Saldo'].shift() + cota
+    # Variação abaixo de -cota vem de cobranças extras (rateios), não de pagamento negativo
+    df['Pagamento'] = pagamento.clip(lower=0.0).where(consecutivo).round(2)
+    return df
+
+
+def _conciliar_mes(cotas_mes, lancamentos_mes, tolerancia):
+    # Junção por hash (merge) de uma linha por apartamento de cada lado
+    df = pd.merge(cotas_mes, lancamentos_mes, on=['Apartamento', 'month_num'], how='outer')
+    sem_saldo_anterior = df['Saldo'].notna() & df['Valor Planilha'].isna()
+    df['Valor Planilha'] = df['Valor Planilha'].fillna(0.0)
+    df['Valor Comprovantes'] = df['Valor Comprovantes'].fillna(0.0)
+    df['Comprovantes'] = df['Comprovantes'].fillna(0).astype(int)
+    df['Arquivos Repetidos'] = df['Arquivos Repetidos'].fillna(0).astype(int)
+
+    diferenca = (df['Valor Comprovantes'] - df['Valor Planilha']).round(2)
+    tem_planilha = df['Valor Planilha'].abs() > tolerancia
+    tem_comprovante = df['Comprovantes'] > 0
+
+    condicoes = [
+        df['Arquivos Repetidos'] > 0,
+        sem_saldo_anterior,
+        tem_planilha & ~tem_comprovante,
+        ~tem_planilha & tem_comprovante,
+        tem_comprovante & (diferenca.abs() > tolerancia),
+    ]
+    escolhas = [CONCILIACAO_DUPLICADO, CONCILIACAO_SEM_SALDO_ANTERIOR, CONCILIACAO_SEM_COMPROVANTE,
+                CONCILIACAO_SEM_PLANILHA, CONCILIACAO_DIVERGENTE]
+    df['Diferença'] = diferenca
+    df['Situação'] = np.select(condicoes, escolhas, default=CONCILIACAO_OK)
+    return df
+
+
+def conciliar_cotas(df_cotas, df_lancamentos, ano, cota_mensal, tolerancia=0.01):
+    """
+    Concilia a grade de cotas (formato longo, como em load_cotas_todos_anos; com a coluna 'Ano'
+    o saldo de dezembro do ano anterior vale para janeiro) com os lançamentos do livro-caixa, por
+    (Apartamento, month_num). O lado da planilha é o pagamento implícito na variação do saldo
+    (pagamentos_da_grade). Retorna uma linha por apartamento/mês de 'ano' com o saldo, os valores
+    dos dois lados e a 'Situação' encontrada.
+    """
+    cotas = pagamentos_da_grade(df_cotas, cota_mensal)
+    if 'Ano' in df_cotas:
+        cotas = cotas[cotas['Ano'] == ano]
+    cotas = cotas.rename(columns={'Pagamento': 'Valor Planilha'})[['Apartamento', 'month_num', 'Saldo', 'Valor Planilha']]
+
+    if df_lancamentos is not None and not df_lancamentos.empty:
+        lanc = pd.DataFrame({
+            'Apartamento': df_lancamentos['apartamento'].map(normalizar_apartamento),
+            'month_num': df_lancamentos['mes'].astype(float),
+            'valor': df_lancamentos['valor'],
+            'sha256': df_lancamentos['sha256'],
+        })
+        lanc = lanc.groupby(['Apartamento', 'month_num'], as_index=False).agg(
+            **{
+                'Valor Comprovantes': ('valor', 'sum'),
+                'Comprovantes': ('valor', 'size'),
+                # O mesmo arquivo lançado mais de uma vez no mesmo mês
+                'Arquivos Repetidos': ('sha256', lambda hashes: hashes.dropna().duplicated().sum()),
+            }
+        )
+    else:
+        lanc = pd.DataFrame({
+            'Apartamento': pd.Series(dtype=object),
+            'month_num': pd.Series(dtype=float),
+            'Valor Comprovantes': pd.Series(dtype=float),
+            'Comprovantes': pd.Series(dtype=int),
+            'Arquivos Repetidos': pd.Series(dtype=int),
+        })
+
+    cotas_por_mes = {mes: grupo for mes, grupo in cotas.groupby('month_num')}
+    lanc_por_mes = {mes: grupo for mes, grupo in lanc.groupby('month_num')}
+
+    partes = []
+    for mes in sorted(set(cotas_por_mes) | set(lanc_por_mes)):
+        cotas_mes = cotas_por_mes.get(mes, cotas.iloc[0:0])
+        lanc_mes = lanc_por_mes.get(mes, lanc.iloc[0:0])
+        chave = (ano, mes, tolerancia, _impressao_digital(cotas_mes), _impressao_digital(lanc_mes))
+        with _conciliacao_lock:
+            resultado = _conciliacao_cache.get(chave)
+        if resultado is None:
+            resultado = _conciliar_mes(cotas_mes, lanc_mes, tolerancia)
+            with _conciliacao_lock:
+                _conciliacao_cache[chave] = resultado
+        partes.append(resultado)
+
+    colunas = ['Apartamento', 'month_num', 'Saldo', 'Valor Planilha', 'Valor Comprovantes', 'Comprovantes', 'Diferença', 'Situação']
+    if not partes:
+        return pd.DataFrame(columns=colunas)
+    df = pd.concat(partes, ignore_index=True)[colunas]
+    df['month_num'] = df['month_num'].astype(int)
+    return df.sort_values(['month_num', 'Apartamento'], ignore_index=True)
+
+
+
+# --- Cotas por apartamento (bloco 'Creditos / Debitos AP') de todos os anos ---
+def ler_bloco_cotas(excel_path, sheet_name):
+    """
+    Lê o bloco 'Creditos / Debitos AP' de uma aba de fluxo de caixa em formato longo
+    (Apartamento, Mês Referência, Valor Pago, month_num, Ano, sort_date).
+    Retorna um DataFrame vazio se a aba não tiver esse bloco.
+    """
+    colunas = ['Apartamento', 'Mês Referência', 'Valor Pago', 'month_num', 'Ano', 'sort_date']
+    meses, rotulos, valores = ler_faixa_aba(excel_path, sheet_name)
+    primeira_coluna = ['' if rotulo is None else str(rotulo).strip() for rotulo in rotulos]
+    titulo = next((i for i, rotulo in enumerate(primeira_coluna) if 'creditos / debitos ap' in rotulo.lower()), None)
+    if titulo is None:
+        return pd.DataFrame(columns=colunas)
+
+    if all(str(mes).startswith('Unnamed: ') for mes in meses):
+        meses = [f'Mês {j + 1}' for j in range(len(meses))]
+
+    # Linhas de apartamento abaixo do título; as células preenchidas viram o formato longo
+    apartamentos = np.array([
+        i for i in range(titulo + 1, len(primeira_coluna))
+        if primeira_coluna[i] and not primeira_coluna[i].startswith(('SALDO', 'RECEITAS'))
+    ], dtype=int)
+    linhas, colunas_mes = np.nonzero(~np.isnan(valores[apartamentos]))
+    if linhas.size == 0:
+        return pd.DataFrame(columns=colunas)
+
+    df_cotas = pd.DataFrame({
+        'Apartamento': [primeira_coluna[i] for i in apartamentos[linhas]],
+        'Mês Referência': [str(meses[j]) for j in colunas_mes],
+        'Valor Pago': valores[apartamentos[linhas], colunas_mes],
+    })
+    df_cotas['month_num'] = df_cotas['Mês Referência'].map(numero_do_mes)
+    ano = re.search(r'(\d{4})', sheet_name)
+    df_cotas['Ano'] = int(ano.group(1)) if ano else None
+    df_cotas['sort_date'] = pd.to_datetime(
+        dict(year=df_cotas['Ano'], month=df_cotas['month_num'], day=1), errors='coerce'
+    ) if ano else pd.NaT
+    return df_cotas[colunas]
+
+
+@st.cache_resource
+def get_planilha_process_pool(max_workers=PLANILHA_WORKERS):
+    """Pool de processos para ler abas/planilhas em paralelo (o parse do Excel é limitado pela GIL)."""
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def ler_em_paralelo(funcao, argumentos):
+    """Executa 'funcao(*args)' para cada item de 'argumentos' no pool de processos, mantendo a ordem."""
+    argumentos = list(argumentos)
+    if len(argumentos) <= 1 or PLANILHA_WORKERS <= 1:
+        return [funcao(*args) for args in argumentos]
+    futures = [get_planilha_process_pool().submit(funcao, *args) for args in argumentos]
+    return [future.result() for future in futures]
+
+
+def abas_fluxo_de_caixa(excel_path):
+    """Nomes das abas 'Fluxo de caixa <ano>' de uma planilha, com o ano de cada uma."""
+    year_pattern = re.compile(r'(\d{4})')
+    abas = []
+    workbook = load_workbook(excel_path, read_only=True)
+    sheet_names = workbook.sheetnames
+    workbook.close()
+    for sheet in sheet_names:
+        match = year_pattern.search(sheet)
+        if match and "fluxo de caixa" in sheet.lower():
+            abas.append((sheet, int(match.group(1))))
+    return abas
+
+
+# Cache por aba: (planilha, aba, impressão digital da aba) -> bloco de cotas. Ao trocar a planilha,
+# só as abas cuja impressão mudou são lidas de novo; as demais vêm daqui.
+_cotas_abas_cache = LRUCache(maxsize=int(os.getenv('COTAS_ABAS_CACHE_MAX', '64')))
+_cotas_abas_lock = threading.Lock()
+
+
+def load_cotas_todos_anos(excel_path, impressoes=None):
+    """
+    Junta o bloco de cotas de todas as abas de fluxo de caixa em uma tabela longa.
+    'impressoes' ({aba: impressão digital}, como em registrar_versao_planilha) chaveia o cache de
+    cada aba: só as abas novas ou alteradas são lidas (em paralelo). Sem impressões, as abas são
+    chaveadas pela versão do arquivo.
+    """
+    planilha = os.path.abspath(excel_path)
+    if impressoes:
+        chaves = {sheet: (planilha, sheet, impressao) for sheet, impressao in dict(impressoes).items()}
+    else:
+        versao = versao_arquivo(excel_path)
+        chaves = {sheet: (planilha, sheet, versao) for sheet, _ in abas_fluxo_de_caixa(excel_path)}
+
+    blocos = {}  # Guardados aqui porque o LRU pode descartar entradas no meio da chamada
+    with _cotas_abas_lock:
+        for sheet, chave in chaves.items():
+            em_cache = _cotas_abas_cache.get(chave)
+            if em_cache is not None:
+                blocos[sheet] = em_cache
+
+    pendentes = [sheet for sheet in chaves if sheet not in blocos]
+    resultados = ler_em_paralelo(ler_bloco_cotas, [(excel_path, sheet) for sheet in pendentes])
+    with _cotas_abas_lock:
+        for sheet, df in zip(pendentes, resultados):
+            _cotas_abas_cache[chaves[sheet]] = df
+            blocos[sheet] = df
+
+    partes = [df for df in blocos.values() if not df.empty]
+    if not partes:
+        return pd.DataFrame(columns=['Apartamento', 'Mês Referência', 'Valor Pago', 'month_num', 'Ano', 'sort_date'])
+    return pd.concat(partes, ignore_index=True).sort_values(['Apartamento', 'sort_date'], ignore_index=True)
+
+
+# --- Inadimplência (calculada de forma vetorizada com NumPy) ---
+# Os valores da grade de cotas são o saldo do apartamento no mês:
+# positivo = crédito, negativo = débito com o condomínio.
+FAIXAS_ATRASO = [
+    (0, "Em dia"),
+    (1, "1 mês"),
+    (3, "2-3 meses"),
+    (6, "4-6 meses"),
+    (np.inf, "Mais de 6 meses"),
+]
+
+
+def _meses_consecutivos_em_debito(apartamentos, em_debito):
+    """Para cada linha, quantos meses seguidos (até ela) o apartamento está em débito."""
+    n = len(em_debito)
+    if n == 0:
+        return np.zeros(0, dtype=int)
+    idx = np.arange(n)
+    inicio_grupo = np.ones(n, dtype=bool)
+    inicio_grupo[1:] = apartamentos[1:] != apartamentos[:-1]
+    # Posição do último "reinício" da contagem: início do apartamento ou mês sem débito
+    reinicio = inicio_grupo | ~em_debito
+    ultimo_reinicio = np.maximum.accumulate(np.where(reinicio, idx, 0))
+    return np.where(em_debito, idx - ultimo_reinicio + em_debito[ultimo_reinicio], 0)
+
+
+@st.cache_data
+def calcular_inadimplencia(df_cotas):
+    """
+    A partir da tabela longa de cotas (todos os anos), calcula por apartamento/mês o saldo,
+    o débito e os meses consecutivos em atraso, além da faixa de atraso (aging).
+    Retorna (histórico mês a mês, resumo da situação atual por apartamento).
+    """
+    df = df_cotas.dropna(subset=['sort_date']).sort_values(['Apartamento', 'sort_date'], ignore_index=True)
+    apartamentos = df['Apartamento'].to_numpy(dtype=str)
+    saldo = df['Valor Pago'].to_numpy(dtype=float)
+    em_debito = saldo < 0
+
+    meses_atraso = _meses_consecutivos_em_debito(apartamentos, em_debito)
+    limites = np.array([limite for limite, _ in FAIXAS_ATRASO])
+    rotulos = np.array([rotulo for _, rotulo in FAIXAS_ATRASO])
+
+    historico = df[['Apartamento', 'Ano', 'month_num', 'Mês Referência', 'sort_date']].copy()
+    historico['Saldo'] = saldo
+    historico['Débito'] = np.where(em_debito, -saldo, 0.0)
+    historico['Meses em Atraso'] = meses_atraso
+    historico['Faixa'] = rotulos[np.searchsorted(limites, meses_atraso)]
+
+    # Situação atual = último mês de cada apartamento
+    ultimo = np.ones(len(df), dtype=bool)
+    ultimo[:-1] = apartamentos[:-1] != apartamentos[1:]
+    resumo = historico.loc[ultimo, ['Apartamento', 'Mês Referência', 'Saldo', 'Débito', 'Meses em Atraso', 'Faixa']]
+    return historico, resumo.reset_index(drop=True)
+
+
+
+# --- Projeção do fluxo de caixa (Monte Carlo vetorizado) ---
+PERCENTIS_PROJECAO = [5, 25, 50, 75, 95]
+
+
+@st.cache_data
+def projetar_fluxo_caixa(df_historico, meses=12, n_cenarios=5000, reajuste_cota=0.0, taxa_inadimplencia=0.0,
+                         custo_obras=0.0, mes_obras=1, variacao_obras=0.2, n_apartamentos=4,
+                         meses_base=12, seed=None):
+    """
+    Projeta o saldo do caixa para os próximos 'meses' em 'n_cenarios' caminhos simulados de uma vez
+    (matrizes cenários x meses). Usa as séries mensais de load_and_process_data:
+    - cotas: média recente x (1 + reajuste), com cada apartamento pagando ou não (binomial);
+    - despesas: meses históricos sorteados com reposição (bootstrap), sem 'Obras';
+    - obras: custo pontual no mês 'mes_obras', com variação uniforme de ±variacao_obras.
+    Retorna um DataFrame por mês com os percentis do saldo e a probabilidade de saldo negativo.
+    """
+    colunas = ['Cotas Condominiais (Até dia 08)', 'Rendimentos', 'DESPESAS FIXAS', 'DESPESAS VARIÁVEIS', 'DESPESAS EXTRAS', 'Obras']
+    df = df_historico.sort_values('sort_date').reindex(columns=colunas + ['sort_date', 'SALDO Total (Caixa)'])
+    df[colunas] = df[colunas].fillna(0.0)
+    # Meses futuros da planilha vêm zerados: só entram meses com alguma movimentação
+    movimento = df[colunas].abs().sum(axis=1) > 0
+    df = df[movimento].tail(meses_base)
+    if df.empty:
+        return pd.DataFrame()
+
+    cotas = df['Cotas Condominiais (Até dia 08)'].to_numpy(dtype=float)
+    rendimentos = df['Rendimentos'].to_numpy(dtype=float)
+    despesas = (df['DESPESAS FIXAS'] + df['DESPESAS VARIÁVEIS'] + df['DESPESAS EXTRAS'] - df['Obras']).to_numpy(dtype=float)
+    saldo_inicial = float(pd.to_numeric(df['SALDO Total (Caixa)'], errors='coerce').fillna(0.0).iloc[-1])
+
+    rng = np.random.default_rng(seed)
+    forma = (n_cenarios, meses)
+
+    cota_por_apartamento = cotas.mean() * (1 + reajuste_cota) / max(1, n_apartamentos)
+    apartamentos_pagantes = rng.binomial(n_apartamentos, 1 - taxa_inadimplencia, size=forma)
+    receitas = apartamentos_pagantes * cota_por_apartamento + rendimentos.mean()
+
+    saidas = despesas[rng.integers(0, len(despesas), size=forma)]
+    if custo_obras and 1 <= mes_obras <= meses:
+        saidas[:, mes_obras - 1] += custo_obras * rng.uniform(1 - variacao_obras, 1 + variacao_obras, size=n_cenarios)
+
+    saldos = saldo_inicial + np.cumsum(receitas - saidas, axis=1)
+
+    percentis = np.percentile(saldos, PERCENTIS_PROJECAO, axis=0)
+    projecao = pd.DataFrame(percentis.T, columns=[f'P{p}' for p in PERCENTIS_PROJECAO])
+    projecao.insert(0, 'sort_date', pd.date_range(df['sort_date'].iloc[-1], periods=meses + 1, freq='MS')[1:])
+    projecao['Prob. Saldo Negativo'] = (saldos < 0).mean(axis=0)
+    return projecao
+
+
+
+# --- Vários condomínios: registro, cache por condomínio e portfólio ---
+def load_registro_condominios(path=REGISTRO_CONDOMINIOS_PATH):
+    """
+    Lê o registro de condomínios (YAML): {id: {nome, planilha, moradores, drive_folder_id, ledger}}.
+    Sem o arquivo, usa a planilha, o mapeamento de moradores e a pasta do Drive padrão do repositório.
+    Condomínios registrados sem 'drive_folder_id' ficam sem pasta (None): nunca herdam a de outro.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            condominios = (yaml.safe_load(file) or {}).get('condominios') or {}
+    except FileNotFoundError:
+        condominios = {}
+    if not condominios:
+        condominios = {'padrao': {'nome': 'Condomínio', 'drive_folder_id': DRIVE_FOLDER_ID_PADRAO,
+                                  'ledger': LEDGER_PATH, 'indice': INDICE_COMPROVANTES_PATH}}
+
+    registro = {}
+    for condominio_id, cfg in condominios.items():
+        cfg = dict(cfg or {})
+        cfg.setdefault('nome', str(condominio_id))
+        cfg.setdefault('planilha', os.path.join('planilhas', 'Contabilidade Condominio.xlsx'))
+        cfg.setdefault('moradores', 'moradores.yaml')
+        cfg.setdefault('drive_folder_id', None)
+        # Cada condomínio tem o seu livro-caixa, para apartamentos de prédios diferentes não se misturarem
+        cfg.setdefault('ledger', os.path.join('dados', f'lancamentos_{condominio_id}.db'))
+        cfg.setdefault('indice', os.path.join('dados', f'comprovantes_{condominio_id}.db'))
+        registro[str(condominio_id)] = cfg
+    return registro
+
+
+def meses_com_movimento(df):
+    """Linhas de um fluxo de caixa com alguma receita ou despesa (meses futuros da planilha vêm zerados)."""
+    colunas = [c for c in ['RECEITAS', 'DESPESAS FIXAS', 'DESPESAS VARIÁVEIS', 'DESPESAS EXTRAS'] if c in df.columns]
+    if not colunas:
+        return df.iloc[0:0]
+    return df[df[colunas].fillna(0).abs().sum(axis=1) > 0]
+
+
+def carregar_fluxo_planilha(excel_path):
+    """Lê e junta todas as abas de fluxo de caixa de uma planilha (sem Streamlit; roda no pool de processos)."""
+    dfs = []
+    for _, year, meses, categorias, valores in ler_faixas_planilha(excel_path):
+        df, _ = montar_fluxo(meses, categorias, valores, year)
+        dfs.append(df)
+    return pd.concat(dfs, ignore_index=True).sort_values('sort_date', ignore_index=True) if dfs else pd.DataFrame()
+
+
+# Cache por condomínio: planilha -> (versão do arquivo, DataFrame). A versão é (mtime, tamanho),
+# então só as planilhas substituídas são lidas de novo; as menos usadas saem quando o cache enche.
+_fluxo_condominios_cache = LRUCache(maxsize=int(os.getenv('FLUXO_CONDOMINIOS_CACHE_MAX', '32')))
+_fluxo_condominios_lock = threading.Lock()
+
+
+def versao_arquivo(path):
+    info = os.stat(path)
+    return (info.st_mtime_ns, info.st_size)
+
+
+def carregar_fluxos_condominios(registro):
+    """
+    Carrega o fluxo de caixa de todos os condomínios do registro. Planilhas novas ou
+    alteradas são lidas em paralelo (um processo por planilha); as demais vêm do cache.
+    Condomínios cuja planilha não existe ficam de fora.
+    """
+    versoes = {}
+    for condominio_id, cfg in registro.items():
+        try:
+            versoes[condominio_id] = versao_arquivo(cfg['planilha'])
+        except FileNotFoundError:
+            continue
+
+    fluxos = {}  # planilha -> DataFrame; guardado aqui porque o LRU pode descartar entradas no meio da chamada
+    with _fluxo_condominios_lock:
+        for condominio_id, versao in versoes.items():
+            planilha = registro[condominio_id]['planilha']
+            em_cache = _fluxo_condominios_cache.get(planilha)
+            if em_cache is not None and em_cache[0] == versao:
+                fluxos[planilha] = em_cache[1]
+
+    planilhas_pendentes = sorted({registro[condominio_id]['planilha'] for condominio_id in versoes} - set(fluxos))
+    resultados = ler_em_paralelo(carregar_fluxo_planilha, [(planilha,) for planilha in planilhas_pendentes])
+
+    with _fluxo_condominios_lock:
+        for planilha, df in zip(planilhas_pendentes, resultados):
+            _fluxo_condominios_cache[planilha] = (versao_arquivo(planilha), df)
+            fluxos[planilha] = df
+    return {condominio_id: fluxos[registro[condominio_id]['planilha']] for condominio_id in versoes}
+
+
+def resumo_portfolio(fluxos, registro, meses=12):
+    """Uma linha por condomínio com o saldo atual e receitas/despesas dos últimos 'meses' com movimento."""
+    linhas = []
+    for condominio_id, df in fluxos.items():
+        df_movimento = meses_com_movimento(df).tail(meses) if not df.empty else df
+        if df_movimento.empty:
+            continue
+        # Saldo atual = último mês com saldo preenchido (fórmulas sem valor calculado vêm vazias)
+        saldos = pd.to_numeric(df_movimento['SALDO Total (Caixa)'], errors='coerce').dropna()
+        linhas.append({
+            'Condomínio': registro[condominio_id]['nome'],
+            'Último Mês': df_movimento.loc[saldos.index[-1], 'Período'] if not saldos.empty else None,
+            'Saldo Atual': float(saldos.iloc[-1]) if not saldos.empty else 0.0,
+            f'Receitas ({meses} meses)': df_movimento['RECEITAS'].sum(),
+            f'Despesas ({meses} meses)': df_movimento.reindex(columns=['DESPESAS FIXAS', 'DESPESAS VARIÁVEIS', 'DESPESAS EXTRAS']).fillna(0).sum().sum(),
+        })
+    return pd.DataFrame(linhas)
+
+
+# --- Relatório anual para a assembleia (XLSX e PDF) ---
+# Os dados já agregados pelo dashboard são passados a um worker em segundo plano; o arquivo
+# gerado fica em disco, chaveado pelo condomínio, pela planilha, pela versão dela e pelo ano: baixar de
+# novo é imediato. Só os RELATORIOS_MAX mais recentes ficam em disco.
+_relatorios_em_andamento = {}
+_relatorios_lock = threading.Lock()
+
+
+def dados_relatorio_anual(df_ano, categorias_receita, categorias_despesa, titulo):
+    """
+    Agrega o fluxo de caixa de um ano com as mesmas regras dos cards e gráficos do Dashboard Principal.
+    Retorna {'titulo', 'resumo': {rótulo: valor}, 'mensal', 'receitas', 'despesas'} (DataFrames pequenos).
+    """
+    df = df_ano.sort_values('sort_date').copy()
+    df['SALDO Total (Caixa)'] = pd.to_numeric(df['SALDO Total (Caixa)'], errors='coerce')
+    df_saldo = df[df['SALDO Total (Caixa)'].notna()]
+
+    mensal = pd.DataFrame({
+        'Período': df_saldo['Período'],
+        'Receitas': df_saldo['RECEITAS'],
+        'Despesas Variáveis': df_saldo['DESPESAS VARIÁVEIS'],
+        'Despesas Extras': df_saldo['DESPESAS EXTRAS'],
+        'Saldo': df_saldo['SALDO Total (Caixa)'],
+    }).fillna(0).reset_index(drop=True)
+
+    def por_categoria(categorias):
+        totais = df.reindex(columns=categorias).fillna(0).sum()
+        return pd.DataFrame({'Categoria': totais.index.str.strip(), 'Valor': totais.values}).query('Valor > 0')
+
+    return {
+        'titulo': titulo,
+        'resumo': {
+            'Total de Receitas': float(mensal['Receitas'].sum()),
+            'Total de Despesas': float(mensal['Despesas Variáveis'].sum() + mensal['Despesas Extras'].sum()),
+            'Saldo Final': float(mensal['Saldo'].iloc[-1]) if not mensal.empty else 0.0,
+        },
+        'mensal': mensal,
+        'receitas': por_categoria(categorias_receita).reset_index(drop=True),
+        'despesas': por_categoria(categorias_despesa).reset_index(drop=True),
+    }
+
+
+def _celula(ws, valor, negrito=False, moeda=False):
+    cell = WriteOnlyCell(ws, value=valor)
+    if negrito:
+        cell.font = Font(bold=True)
+    if moeda:
+        cell.number_format = '"R$" #,##0.00'
+    return cell
+
+
+def gerar_relatorio_xlsx(dados):
+    """Relatório em XLSX (openpyxl em modo write-only), com gráficos nativos do Excel. Retorna os bytes."""
+    workbook = Workbook(write_only=True)
+    mensal = dados['mensal']
+
+    ws = workbook.create_sheet("Resumo")
+    ws.append([_celula(ws, dados['titulo'], negrito=True)])
+    ws.append([])
+    for rotulo, valor in dados['resumo'].items():
+        ws.append([_celula(ws, rotulo, negrito=True), _celula(ws, valor, moeda=True)])
+    ws.append([])
+    linha_tabela = len(dados['resumo']) + 4  # título, linha em branco, cards, linha em branco
+    ws.append([_celula(ws, coluna, negrito=True) for coluna in mensal.columns])
+    for linha in mensal.itertuples(index=False):
+        ws.append([linha[0]] + [_celula(ws, float(valor), moeda=True) for valor in linha[1:]])
+    ultima = linha_tabela + len(mensal)
+
+    if not mensal.empty:
+        periodos = Reference(ws, min_col=1, min_row=linha_tabela + 1, max_row=ultima)
+        saldo = LineChart()
+        saldo.title, saldo.y_axis.title, saldo.width = "Evolução do Saldo Total do Caixa", "Saldo (R$)", 18
+        saldo.add_data(Reference(ws, min_col=5, min_row=linha_tabela, max_row=ultima), titles_from_data=True)
+        saldo.set_categories(periodos)
+        ws.add_chart(saldo, "H2")
+
+        comparativo = BarChart()
+        comparativo.type, comparativo.grouping, comparativo.overlap = "col", "stacked", 100
+        comparativo.title, comparativo.y_axis.title, comparativo.width = "Comparativo: Receitas vs. Despesas", "Valor (R$)", 18
+        comparativo.add_data(Reference(ws, min_col=2, max_col=4, min_row=linha_tabela, max_row=ultima), titles_from_data=True)
+        comparativo.set_categories(periodos)
+        ws.add_chart(comparativo, "H18")
+
+    ws_categorias = workbook.create_sheet("Categorias")
+    linha = 1
+    for nome, df, ancora in [("Receitas Detalhadas", dados['receitas'], "D1"), ("Despesas Detalhadas", dados['despesas'], "D18")]:
+        ws_categorias.append([_celula(ws_categorias, nome, negrito=True)])
+        ws_categorias.append([_celula(ws_categorias, 'Categoria', negrito=True), _celula(ws_categorias, 'Valor', negrito=True)])
+        for categoria, valor in df.itertuples(index=False):
+            ws_categorias.append([categoria, _celula(ws_categorias, float(valor), moeda=True)])
+        if not df.empty:
+            pizza = PieChart()
+            pizza.title = f"Distribuição das {nome.split()[0]}"
+            pizza.add_data(Reference(ws_categorias, min_col=2, min_row=linha + 1, max_row=linha + 1 + len(df)), titles_from_data=True)
+            pizza.set_categories(Reference(ws_categorias, min_col=1, min_row=linha + 2, max_row=linha + 1 + len(df)))
+            ws_categorias.add_chart(pizza, ancora)
+        ws_categorias.append([])
+        linha += len(df) + 3
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+# Cores dos gráficos do PDF (RGB 0-1), na ordem das séries
+_CORES_PDF = [(0.39, 0.43, 0.98), (0.94, 0.33, 0.23), (0.0, 0.8, 0.59), (0.67, 0.39, 0.98), (1.0, 0.63, 0.35)]
+
+
+def _pdf_eixos(page, rect, minimo, maximo):
+    # Moldura, linha do zero e rótulos de mínimo/máximo; devolve a função valor -> y
+    page.draw_rect(rect, color=(0.8, 0.8, 0.8), width=0.5)
+    escala = (maximo - minimo) or 1.0
+    y = lambda valor: rect.y1 - (valor - minimo) / escala * rect.height
+    if minimo < 0 < maximo:
+        page.draw_line((rect.x0, y(0)), (rect.x1, y(0)), color=(0.6, 0.6, 0.6), width=0.5)
+    page.insert_text((rect.x0 + 2, rect.y0 + 8), format_currency_brl(maximo), fontsize=6, color=(0.4, 0.4, 0.4))
+    page.insert_text((rect.x0 + 2, rect.y1 - 2), format_currency_brl(minimo), fontsize=6, color=(0.4, 0.4, 0.4))
+    return y
+
+
+def _pdf_rotulos_x(page, rect, rotulos):
+    passo = rect.width / max(len(rotulos), 1)
+    for i, rotulo in enumerate(rotulos):
+        page.insert_text((rect.x0 + i * passo + 2, rect.y1 + 9), str(rotulo), fontsize=6)
+    return passo
+
+
+def _pdf_grafico_linha(page, rect, rotulos, valores):
+    valores = [float(v) for v in valores]
+    if not valores:
+        return
+    y = _pdf_eixos(page, rect, min(0.0, min(valores)), max(valores))
+    passo = _pdf_rotulos_x(page, rect, rotulos)
+    pontos = [fitz.Point(rect.x0 + (i + 0.5) * passo, y(valor)) for i, valor in enumerate(valores)]
+    if len(pontos) > 1:
+        page.draw_polyline(pontos, color=_CORES_PDF[0], width=2)
+    for ponto in pontos:
+        page.draw_circle(ponto, 2, color=_CORES_PDF[0], fill=_CORES_PDF[0])
+
+
+def _pdf_grafico_barras_empilhadas(page, rect, rotulos, series):
+    if not rotulos:
+        return
+    totais = [sum(float(valores[i]) for _, valores in series) for i in range(len(rotulos))]
+    y = _pdf_eixos(page, rect, 0.0, max(totais + [0.0]))
+    passo = _pdf_rotulos_x(page, rect, rotulos)
+    for i in range(len(rotulos)):
+        base = 0.0
+        for cor, (_, valores) in zip(_CORES_PDF, series):
+            valor = max(float(valores[i]), 0.0)
+            page.draw_rect(fitz.Rect(rect.x0 + i * passo + passo * 0.15, y(base + valor),
+                                     rect.x0 + (i + 0.85) * passo, y(base)), color=None, fill=cor)
+            base += valor
+    for j, (cor, (nome, _)) in enumerate(zip(_CORES_PDF, series)):
+        x = rect.x0 + j * 130
+        page.draw_rect(fitz.Rect(x, rect.y1 + 14, x + 8, rect.y1 + 20), color=None, fill=cor)
+        page.insert_text((x + 11, rect.y1 + 20), nome, fontsize=7)
+
+
+def _pdf_barras_horizontais(page, rect, df, cor):
+    if df.empty:
+        page.insert_text((rect.x0, rect.y0 + 12), "Nenhum valor no período.", fontsize=8)
+        return
+    maximo = float(df['Valor'].max()) or 1.0
+    altura = min(rect.height / len(df), 22)
+    for i, (categoria, valor) in enumerate(df.itertuples(index=False)):
+        topo = rect.y0 + i * altura
+        largura = (rect.width - 230) * float(valor) / maximo
+        page.insert_text((rect.x0, topo + altura * 0.65), str(categoria)[:34], fontsize=8)
+        page.draw_rect(fitz.Rect(rect.x0 + 160, topo + 3, rect.x0 + 160 + largura, topo + altura - 3), color=None, fill=cor)
+        page.insert_text((rect.x0 + 164 + largura, topo + altura * 0.65), format_currency_brl(float(valor)), fontsize=7)
+
+
+def gerar_relatorio_pdf(dados):
+    """Relatório em PDF (desenhado com o PyMuPDF): cards, evolução do saldo, comparativo e categorias. Retorna os bytes."""
+    mensal = dados['mensal']
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)  # A4
+    page.insert_text((40, 50), dados['titulo'], fontsize=16)
+
+    for i, (rotulo, valor) in enumerate(dados['resumo'].items()):
+        card = fitz.Rect(40 + i * 175, 70, 200 + i * 175, 120)
+        page.draw_rect(card, color=(0.8, 0.8, 0.8), fill=(0.95, 0.95, 0.97), width=0.5)
+        page.insert_text((card.x0 + 8, card.y0 + 18), rotulo, fontsize=9, color=(0.4, 0.4, 0.4))
+        page.insert_text((card.x0 + 8, card.y0 + 38), format_currency_brl(valor), fontsize=13)
+
+    rotulos = [str(periodo).split('-')[0] for periodo in mensal['Período']]
+    page.insert_text((40, 150), "Evolução do Saldo Total do Caixa", fontsize=11)
+    _pdf_grafico_linha(page, fitz.Rect(40, 160, 555, 360), rotulos, mensal['Saldo'])
+    page.insert_text((40, 400), "Comparativo: Receitas vs. Despesas", fontsize=11)
+    _pdf_grafico_barras_empilhadas(page, fitz.Rect(40, 410, 555, 610), rotulos, [
+        (coluna, mensal[coluna].tolist()) for coluna in ['Receitas', 'Despesas Variáveis', 'Despesas Extras']
+    ])
+
+    page.insert_text((40, 660), "Receitas Detalhadas", fontsize=11)
+    _pdf_barras_horizontais(page, fitz.Rect(40, 670, 555, 740), dados['receitas'], _CORES_PDF[2])
+    page.insert_text((40, 760), "Despesas Detalhadas", fontsize=11)
+    _pdf_barras_horizontais(page, fitz.Rect(40, 770, 555, 830), dados['despesas'], _CORES_PDF[1])
+
+    # Segunda página: a tabela mensal com os valores usados nos gráficos
+    page = doc.new_page(width=595, height=842)
+    page.insert_text((40, 50), f"{dados['titulo']} - Valores Mensais", fontsize=12)
+    colunas_x = [40, 130, 240, 350, 460]
+    for x, coluna in zip(colunas_x, mensal.columns):
+        page.insert_text((x, 80), coluna, fontsize=8, color=(0.3, 0.3, 0.3))
+    for i, linha in enumerate(mensal.itertuples(index=False)):
+        for x, valor in zip(colunas_x, linha):
+            page.insert_text((x, 98 + i * 16), valor if isinstance(valor, str) else format_currency_brl(float(valor)), fontsize=8)
+
+    pdf_bytes = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return pdf_bytes
+
+
+GERADORES_RELATORIO = {
+    'pdf': gerar_relatorio_pdf,
+    'xlsx': gerar_relatorio_xlsx,
+}
+
+
+@st.cache_resource
+def get_relatorio_executor():
+    """Worker único para gerar relatórios sem ocupar a thread da página."""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="relatorio")
+
+
+def caminho_relatorio_anual(planilha, versao, ano, formato, relatorios_dir=RELATORIOS_DIR, condominio=None):
+    """
+    Arquivo do relatório em disco: muda quando a planilha (ou a versão dela) muda e quando muda o
+    condomínio, cujo nome vai no título do relatório.
+    """
+    chave = hashlib.sha256(f"{condominio}|{os.path.abspath(planilha)}|{versao}".encode()).hexdigest()[:16]
+    return os.path.join(relatorios_dir, f"relatorio_{ano}_{chave}.{formato}")
+
+
+def _gerar_relatorio(formato, dados, caminho):
+    _gravar_atomico(caminho, GERADORES_RELATORIO[formato](dados))
+    return caminho
+
+
+def _podar_relatorios(relatorios_dir, limite):
+    # Chamado com _relatorios_lock. Gerações concluídas com sucesso saem do registro (o arquivo em
+    # disco basta); das que falharam ficam só as 'limite' mais recentes, para mostrar o erro.
+    falhas = []
+    for caminho, future in list(_relatorios_em_andamento.items()):
+        if future.done():
+            if future.exception() is None:
+                del _relatorios_em_andamento[caminho]
+            else:
+                falhas.append(caminho)
+    for caminho in falhas[:max(0, len(falhas) - limite)]:
+        del _relatorios_em_andamento[caminho]
+
+    arquivos = []
+    with os.scandir(relatorios_dir) as it:
+        for entry in it:
+            if entry.name.startswith('relatorio_') and not entry.name.endswith('.tmp'):
+                try:
+                    arquivos.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+    for _, path in sorted(arquivos)[:max(0, len(arquivos) - limite)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def solicitar_relatorio_anual(dados, caminho, executor=None, limite=RELATORIOS_MAX):
+    """
+    Agenda a geração do relatório (formato pela extensão do caminho) no worker, se ainda não existir
+    nem estiver em andamento. Retorna imediatamente; acompanhe com status_relatorio.
+    Antes de agendar, descarta os relatórios mais antigos além de 'limite'.
+    """
+    formato = caminho.rsplit('.', 1)[-1]
+    if formato not in GERADORES_RELATORIO:
+        raise ValueError(f"Formato de relatório desconhecido: '{formato}'. Opções: {', '.join(GERADORES_RELATORIO)}")
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    with _relatorios_lock:
+        em_andamento = _relatorios_em_andamento.get(caminho)
+        if os.path.exists(caminho) or (em_andamento and not em_andamento.done()):
+            return
+        _podar_relatorios(os.path.dirname(caminho) or '.', limite)
+        executor = executor or get_relatorio_executor()
+        _relatorios_em_andamento[caminho] = executor.submit(_gerar_relatorio, formato, dados, caminho)
+
+
+def status_relatorio(caminho):
+    """'pronto', 'gerando', 'erro: <mensagem>' ou None (nunca solicitado ou já descartado)."""
+    if os.path.exists(caminho):
+        return 'pronto'
+    with _relatorios_lock:
+        future = _relatorios_em_andamento.get(caminho)
+    if future is None:
+        return None
+    if not future.done():
+        return 'gerando'
+    erro = future.exception()
+    return f"erro: {erro}" if erro else None
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from openpyxl import Workbook
+
+import funcoes
+
+
+def _planilha(path, receitas_fev=150.0, obras_jan=None, aba_2026=False):
+    workbook = Workbook()
+    ws = workbook.active
+    ws.title = "Fluxo de caixa 2025"
+    for _ in range(4):
+        ws.append([])
+    ws.append(["Mês", "Janeiro/2025", "Fevereiro/2025"])
+    ws.append(["RECEITAS", 100, receitas_fev])
+    ws.append(["Obras", obras_jan, 0])
+    if aba_2026:
+        nova = workbook.create_sheet("Fluxo de caixa 2026")
+        for _ in range(4):
+            nova.append([])
+        nova.append(["Mês", "Janeiro/2026"])
+        nova.append(["RECEITAS", 200])
+    workbook.save(path)
+    # Garante que a versão (mtime, tamanho) muda mesmo quando o arquivo é regravado no mesmo instante
+    mtime = os.stat(path).st_mtime_ns + (receitas_fev + (obras_jan or 0) + aba_2026) * 10**9
+    os.utime(path, ns=(int(mtime), int(mtime)))
+
+
+class AlteracoesPlanilhaTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "planilha.xlsx")
+        self.snapshots = os.path.join(self._tmp.name, "snapshots")
+        patcher = mock.patch.dict(funcoes._versoes_planilha, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _registrar(self):
+        return funcoes.registrar_versao_planilha(self.path, snapshots_dir=self.snapshots)
+
+    def test_registra_so_as_celulas_alteradas(self):
+        _planilha(self.path)
+        primeira = self._registrar()
+        self.assertTrue(funcoes.listar_alteracoes_planilha(self.path, snapshots_dir=self.snapshots).empty)
+
+        _planilha(self.path, receitas_fev=175.5, obras_jan=30, aba_2026=True)
+        segunda = self._registrar()
+
+        self.assertNotEqual(primeira["Fluxo de caixa 2025"], segunda["Fluxo de caixa 2025"])
+        alteracoes = funcoes.listar_alteracoes_planilha(self.path, snapshots_dir=self.snapshots)
+        self.assertEqual(
+            alteracoes[['Aba', 'Categoria', 'Mês', 'Anterior', 'Novo']].fillna(0).values.tolist(),
+            [["Fluxo de caixa 2026", "(aba nova)", 0, 0, 0],
+             ["Fluxo de caixa 2025", "RECEITAS", "Fevereiro/2025", 150.0, 175.5],
+             ["Fluxo de caixa 2025", "Obras", "Janeiro/2025", 0, 30.0]]
+        )
+
+    def test_versao_conhecida_nao_rele_a_planilha(self):
+        _planilha(self.path)
+        impressoes = self._registrar()
+        funcoes._versoes_planilha.clear()
+
+        with mock.patch.object(funcoes, 'ler_faixas_planilha') as ler:
+            self.assertEqual(self._registrar(), impressoes)
+            self.assertEqual(self._registrar(), impressoes)
+        ler.assert_not_called()
+
+    def test_snapshot_ilegivel_conta_como_sem_versao_anterior(self):
+        _planilha(self.path)
+        caminho_snapshot, _ = funcoes._caminho_snapshot(self.path, self.snapshots)
+        os.makedirs(self.snapshots)
+        with open(caminho_snapshot, 'wb') as f:
+            f.write(b"cfuncoes\nClasseRemovida\n.")  # Pickle de uma classe que não existe mais
+
+        impressoes = self._registrar()
+        self.assertEqual(list(impressoes), ["Fluxo de caixa 2025"])
+        self.assertTrue(funcoes.listar_alteracoes_planilha(self.path, snapshots_dir=self.snapshots).empty)
+
+    def test_planilha_e_lida_fora_da_trava(self):
+        _planilha(self.path)
+        ler_faixas = funcoes.ler_faixas_planilha
+
+        def ler_sem_trava(excel_path):
+            self.assertFalse(funcoes._versoes_planilha_lock.locked())
+            return ler_faixas(excel_path)
+
+        with mock.patch.object(funcoes, 'ler_faixas_planilha', side_effect=ler_sem_trava) as ler:
+            self._registrar()
+        ler.assert_called_once()
+
+    def test_linhas_inseridas_e_diferencas_de_centavo_nao_geram_ruido(self):
+        anterior = {'meses': ["Janeiro/2025"], 'categorias': ["RECEITAS", "Obras"],
+                    'valores': funcoes.np.array([[100.0], [20.0]])}
+        atual = {'meses': ["Janeiro/2025"], 'categorias': ["Nova", "RECEITAS", None, "Obras"],
+                 'valores': funcoes.np.array([[5.0], [100.001], [funcoes.np.nan], [20.0]])}
+
+        alteracoes = funcoes.comparar_faixas("Fluxo de caixa 2025", anterior, atual)
+        self.assertEqual(alteracoes[['Categoria', 'Mês', 'Novo']].values.tolist(), [["Nova", "Janeiro/2025", 5.0]])
+        self.assertTrue(funcoes.np.isnan(alteracoes['Anterior'].iloc[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import funcoes
+
+
+class BuscaComprovantesTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.indice_path = os.path.join(self._tmp.name, "comprovantes.db")
+        funcoes.indexar_comprovante(
+            "h1", "Pix recebido de JOÃO DA SILVA\nValor R$ 150,00 em 05/02/2026",
+            arquivo="20260205_pix.pdf", indice_path=self.indice_path,
+            metadados={'valor': "150,00", 'data': "05/02/2026", 'morador': "João", 'apartamento': "2"},
+        )
+        funcoes.indexar_comprovante(
+            "h2", "Conta de luz - Companhia Energética - R$ 233,37",
+            arquivo="20260310_luz.jpg", indice_path=self.indice_path,
+            metadados={'valor': 233.37, 'data': "10/03/2026", 'categoria': "Luz  (venc. Dia 21)"},
+        )
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _arquivos(self, termos):
+        return funcoes.buscar_comprovantes(termos, indice_path=self.indice_path)['arquivo'].tolist()
+
+    def test_busca_sem_acentos_por_nome_valor_data_e_prefixo(self):
+        self.assertEqual(self._arquivos("joao silva"), ["20260205_pix.pdf"])
+        self.assertEqual(self._arquivos("150,00"), ["20260205_pix.pdf"])
+        self.assertEqual(self._arquivos("05/02/2026"), ["20260205_pix.pdf"])
+        self.assertEqual(self._arquivos("energet"), ["20260310_luz.jpg"])
+        self.assertEqual(self._arquivos('R$ "luz'), ["20260310_luz.jpg"])
+        self.assertEqual(self._arquivos("joao luz"), [])
+
+    def test_reindexar_o_mesmo_arquivo_nao_duplica_e_mantem_o_job(self):
+        funcoes.indexar_comprovante("h1", "texto novo", arquivo="20260205_pix.pdf", job_id="job-1",
+                                    indice_path=self.indice_path)
+        funcoes.indexar_comprovante("h1", "texto revisado", arquivo="20260205_pix.pdf",
+                                    indice_path=self.indice_path)
+
+        self.assertEqual(self._arquivos("silva"), [])
+        with mock.patch.object(funcoes, 'status_upload', return_value={'link': "https://drive/pix"}) as status:
+            resultado = funcoes.buscar_comprovantes("revisado", indice_path=self.indice_path)
+        status.assert_called_once_with("job-1", funcoes.OUTBOX_DIR)
+        self.assertEqual(resultado['link'].tolist(), ["https://drive/pix"])
+
+    def test_indexa_arquivos_do_drive_uma_unica_vez(self):
+        arquivos = [
+            {'id': "d1", 'name': "20250105_recibo.pdf", 'webViewLink': "https://drive/d1"},
+            {'id': "d2", 'name': "20250106_foto.jpg", 'webViewLink': "https://drive/d2"},
+            {'id': "d3", 'name': "planilha.xlsx"},
+        ]
+
+        def extrair(file_bytes, file_ext, moradores_map):
+            if file_bytes == b"d2":
+                raise ValueError("imagem corrompida")
+            return {'sha256': "sha-d1", 'texto': "Boleto Inez R$ 80,00",
+                    'campos': {'valores': ["80,00"], 'datas': [], 'nome': "Inez", 'apartamento': "3"}}
+
+        baixar = mock.Mock(side_effect=lambda file_id: file_id.encode())
+        with mock.patch.object(funcoes, 'extrair_dados_comprovante', side_effect=extrair):
+            self.assertEqual(
+                funcoes.indexar_arquivos_drive(arquivos, baixar, {}, indice_path=self.indice_path),
+                (1, ["20250106_foto.jpg: imagem corrompida"])
+            )
+            # A planilha nunca entra no índice; só o arquivo que falhou continua pendente
+            self.assertEqual([a['id'] for a in funcoes.arquivos_drive_pendentes(arquivos, self.indice_path)], ["d2"])
+            funcoes.indexar_arquivos_drive(arquivos, baixar, {}, indice_path=self.indice_path)
+
+        self.assertEqual([c.args[0] for c in baixar.call_args_list], ["d1", "d2", "d2"])
+        resultado = funcoes.buscar_comprovantes("inez", indice_path=self.indice_path)
+        self.assertEqual(resultado[['arquivo', 'valor', 'link']].values.tolist(),
+                         [["20250105_recibo.pdf", 80.0, "https://drive/d1"]])
+
+    def test_envio_do_app_grava_o_id_no_drive_e_a_indexacao_mantem_os_dados_confirmados(self):
+        outbox_dir = os.path.join(self._tmp.name, "outbox")
+        metadados = {'valor': "150,00", 'data': "05/03/2026", 'morador': "Inez", 'apartamento': "3",
+                     'categoria': "Cotas Condominiais (Até dia 08)"}
+        funcoes.indexar_comprovante(funcoes.hash_conteudo(b"%PDF-inez"), "Pix R$ 150,00", arquivo="20260305_pix.pdf",
+                                    metadados=metadados, job_id="job-inez", indice_path=self.indice_path)
+        job_id = funcoes.enfileirar_upload(b"%PDF-inez", "20260305_pix.pdf", outbox_dir=outbox_dir,
+                                           job_id="job-inez", indice_path=self.indice_path)
+
+        job = funcoes.processar_upload(job_id, outbox_dir,
+                                       uploader=lambda *args, **kwargs: ("d-inez", "https://drive/d-inez"))
+        self.assertEqual(job['drive_id'], "d-inez")
+        self.assertIn("d-inez", funcoes.drive_ids_indexados(self.indice_path))
+
+        # Cópia do mesmo comprovante posta no Drive à mão: só ganha o vínculo, sem novo OCR
+        with mock.patch.object(funcoes, 'extrair_dados_comprovante') as extrair:
+            resultado = funcoes.indexar_arquivos_drive(
+                [{'id': "d-manual", 'name': "copia.pdf", 'webViewLink': "https://drive/d-manual"}],
+                lambda file_id: b"%PDF-inez", {}, indice_path=self.indice_path
+            )
+        self.assertEqual(resultado, (1, []))
+        extrair.assert_not_called()
+        encontrado = funcoes.buscar_comprovantes("inez", indice_path=self.indice_path, outbox_dir=outbox_dir)
+        self.assertEqual(
+            encontrado[['valor', 'apartamento', 'categoria', 'link']].values.tolist(),
+            [[150.0, "3", "Cotas Condominiais (Até dia 08)", "https://drive/d-inez"]]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
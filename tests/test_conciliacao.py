@@ -0,0 +1,105 @@
+import os
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+import funcoes
+
+
+def _cotas(linhas):
+    # Grade 'Creditos / Debitos AP': saldo acumulado de cada apartamento ao fim do mês
+    return pd.DataFrame(linhas, columns=['Apartamento', 'Mês Referência', 'Valor Pago', 'month_num'])
+
+
+def _lancamentos(linhas):
+    return pd.DataFrame(linhas, columns=['apartamento', 'mes', 'valor', 'sha256'])
+
+
+class ConciliacaoTests(unittest.TestCase):
+    def test_normaliza_identificadores_de_apartamento(self):
+        self.assertEqual(funcoes.normalizar_apartamento("AP01"), "1")
+        self.assertEqual(funcoes.normalizar_apartamento(4.0), "4")
+        self.assertEqual(funcoes.normalizar_apartamento("Apto 3"), "3")
+        self.assertIsNone(funcoes.normalizar_apartamento(None))
+
+    def test_pagamento_vem_da_variacao_do_saldo(self):
+        df = funcoes.pagamentos_da_grade(_cotas([
+            ("AP02", "Janeiro/2026", 1500, 1),
+            ("AP02", "Fevereiro/2026", 1350, 2),   # usou o crédito: nada pago
+            ("AP02", "Março/2026", 1500, 3),       # pagou a cota e mais 150 de crédito
+            ("AP02", "Abril/2026", -3000, 4),      # rateio extra lançado como débito
+            ("AP01", "Fevereiro/2026", 0, 2),
+            ("AP01", "Março/2026", 0, 3),          # saldo zerado: pagou a cota
+        ]), 150.0)
+        pagamentos = {(r['Apartamento'], r['month_num']): r['Pagamento'] for r in df.to_dict('records')}
+        self.assertTrue(pd.isna(pagamentos[("2", 1)]))
+        self.assertTrue(pd.isna(pagamentos[("1", 2)]))
+        self.assertEqual(
+            [pagamentos[("2", 2)], pagamentos[("2", 3)], pagamentos[("2", 4)], pagamentos[("1", 3)]],
+            [0.0, 300.0, 0.0, 150.0]
+        )
+
+    def test_classifica_cada_apartamento_por_mes(self):
+        df_cotas = _cotas([
+            ("AP01", "Janeiro/2026", 0, 1), ("AP01", "Fevereiro/2026", 0, 2),
+            ("AP02", "Janeiro/2026", 300, 1), ("AP02", "Fevereiro/2026", 150, 2),
+            ("AP03", "Janeiro/2026", 0, 1), ("AP03", "Fevereiro/2026", 0, 2),
+            ("AP04", "Janeiro/2026", 0, 1), ("AP04", "Fevereiro/2026", 0, 2),
+        ])
+        df_lanc = _lancamentos([
+            ("1", 2, 150.0, "a"),
+            ("2", 2, 150.0, "b"),
+            ("3", 2, 100.0, "c"),
+            ("4", 2, 150.0, "d"),
+            ("4", 2, 150.0, "d"),
+        ])
+
+        df = funcoes.conciliar_cotas(df_cotas, df_lanc, 2026, {1: 150.0, 2: 150.0})
+        situacao = {(r['Apartamento'], r['month_num']): r['Situação'] for r in df.to_dict('records')}
+        self.assertEqual(situacao, {
+            ("1", 1): funcoes.CONCILIACAO_SEM_SALDO_ANTERIOR,
+            ("2", 1): funcoes.CONCILIACAO_SEM_SALDO_ANTERIOR,
+            ("3", 1): funcoes.CONCILIACAO_SEM_SALDO_ANTERIOR,
+            ("4", 1): funcoes.CONCILIACAO_SEM_SALDO_ANTERIOR,
+            ("1", 2): funcoes.CONCILIACAO_OK,
+            ("2", 2): funcoes.CONCILIACAO_SEM_PLANILHA,    # usou o crédito, mas há comprovante
+            ("3", 2): funcoes.CONCILIACAO_DIVERGENTE,
+            ("4", 2): funcoes.CONCILIACAO_DUPLICADO,
+        })
+
+    def test_dezembro_do_ano_anterior_vale_para_janeiro(self):
+        df_cotas = _cotas([("AP01", "Dezembro/2025", -150, 12), ("AP01", "Janeiro/2026", 0, 1)])
+        df_cotas['Ano'] = [2025, 2026]
+        df = funcoes.conciliar_cotas(df_cotas, _lancamentos([("1", 1, 300.0, "a")]), 2026, 150.0)
+        self.assertEqual(df[['month_num', 'Valor Planilha', 'Situação']].values.tolist(), [[1, 300.0, funcoes.CONCILIACAO_OK]])
+
+    def test_recalcula_apenas_meses_alterados(self):
+        df_cotas = _cotas([("AP01", "Janeiro/2027", 0, 1), ("AP01", "Fevereiro/2027", 0, 2), ("AP01", "Março/2027", 0, 3)])
+        df_lanc = _lancamentos([("1", 2, 150.0, "a")])
+        funcoes.conciliar_cotas(df_cotas, df_lanc, 2027, 150.0)
+
+        df_lanc_novo = _lancamentos([("1", 2, 150.0, "a"), ("1", 3, 150.0, "b")])
+        with mock.patch.object(funcoes, '_conciliar_mes', wraps=funcoes._conciliar_mes) as conciliar_mes:
+            df = funcoes.conciliar_cotas(df_cotas, df_lanc_novo, 2027, 150.0)
+        self.assertEqual(conciliar_mes.call_count, 1)
+        self.assertEqual(df['Situação'].tolist()[1:], [funcoes.CONCILIACAO_OK, funcoes.CONCILIACAO_OK])
+
+    def test_planilha_do_repositorio_le_a_grade_como_saldo(self):
+        planilha = os.path.join(os.path.dirname(__file__), "..", "planilhas", "Contabilidade Condominio.xlsx")
+        df_cotas = funcoes.ler_bloco_cotas(planilha, "Fluxo de caixa 2026")
+        df_fluxo, _ = funcoes.processar_aba_fluxo(planilha, "Fluxo de caixa 2026", 2026)
+        cota = funcoes.cota_por_apartamento(df_fluxo, df_cotas['Apartamento'].nunique())
+        self.assertEqual(cota[1], 150.0)
+
+        df = funcoes.conciliar_cotas(df_cotas, _lancamentos([]), 2026, cota)
+        ap02 = df[(df['Apartamento'] == "2") & (df['month_num'].between(2, 5))]
+        # AP02 está consumindo o crédito: sem pagamento esperado, nada a cobrar
+        self.assertEqual(set(ap02['Situação']), {funcoes.CONCILIACAO_OK})
+        ap01 = df[(df['Apartamento'] == "1") & (df['month_num'] == 2)]
+        # Saldo zerado sem comprovante: a cota foi paga, mas falta o comprovante
+        self.assertEqual(ap01['Situação'].tolist(), [funcoes.CONCILIACAO_SEM_COMPROVANTE])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import fitz
+
+import funcoes
+
+
+def _pdf_com_texto(*textos):
+    # Um texto vazio gera uma página sem camada de texto (como um PDF digitalizado)
+    doc = fitz.open()
+    for texto in textos:
+        page = doc.new_page()
+        if texto:
+            page.insert_text((72, 72), texto)
+    return doc.tobytes()
+
+
+class ExtracaoCacheTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_extracao_reaproveita_cache_pelo_conteudo(self):
+        pdf = _pdf_com_texto("Pagador: David  R$ 150,00  05/02/2026")
+        moradores = {"David": "4"}
+
+        primeiro = funcoes.extrair_dados_comprovante(pdf, "pdf", moradores, cache_dir=self.cache_dir)
+        self.assertEqual(primeiro['campos']['valores'], ["150,00"])
+        self.assertEqual(primeiro['campos']['apartamento'], "4")
+
+        with mock.patch.object(funcoes, 'extrair_texto_comprovante') as extrair:
+            segundo = funcoes.extrair_dados_comprovante(pdf, "pdf", moradores, cache_dir=self.cache_dir)
+            # Só o apartamento mudou: recalcula os campos, mas reaproveita o texto
+            terceiro = funcoes.extrair_dados_comprovante(pdf, "pdf", {"David": "7"}, cache_dir=self.cache_dir)
+        extrair.assert_not_called()
+        self.assertEqual(segundo['sha256'], funcoes.hash_conteudo(pdf))
+        self.assertEqual(terceiro['campos']['apartamento'], "7")
+
+    def test_pdf_lido_com_outros_moradores_e_extraido_de_novo(self):
+        # A leitura do PDF para quando encontra o morador: o texto pode ter ficado incompleto
+        pdf = _pdf_com_texto("Pagador: David  R$ 150,00  05/02/2026")
+        funcoes.extrair_dados_comprovante(pdf, "pdf", {"David": "4"}, cache_dir=self.cache_dir)
+
+        with mock.patch.object(funcoes, 'extrair_texto_comprovante', return_value="Inez R$ 80,00") as extrair:
+            registro = funcoes.extrair_dados_comprovante(pdf, "pdf", {"Inez": "3"}, cache_dir=self.cache_dir)
+        extrair.assert_called_once()
+        self.assertEqual(registro['campos']['nome'], "Inez")
+        self.assertTrue(funcoes.texto_em_cache_valido(funcoes.ler_cache_extracao(registro['sha256'], self.cache_dir),
+                                                      "pdf", {"Inez": "9"}))
+
+    def test_poda_remove_entradas_menos_usadas(self):
+        for i in range(3):
+            funcoes.gravar_cache_extracao(f"h{i}", {'texto': "x" * 100}, cache_dir=self.cache_dir)
+            os.utime(os.path.join(self.cache_dir, f"h{i}.json"), (i, i))
+
+        funcoes.gravar_cache_extracao("h3", {'texto': "x" * 100}, cache_dir=self.cache_dir, max_bytes=250)
+
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ["h2.json", "h3.json"])
+
+
+class ExtracaoPdfTests(unittest.TestCase):
+    def test_paginas_com_texto_nao_passam_pelo_ocr(self):
+        pdf = _pdf_com_texto("Pagador: David  R$ 150,00  05/02/2026", "")
+        with mock.patch.object(funcoes, 'ocr_imagem') as ocr:
+            texto = funcoes.extrair_texto_pdf(pdf, {"David": "4"})
+        ocr.assert_not_called()
+        self.assertIn("R$ 150,00", texto)
+
+    def test_ocr_das_paginas_digitalizadas_para_quando_campos_sao_encontrados(self):
+        pdf = _pdf_com_texto("Extrato bancario - conta corrente", "", "", "")
+        with mock.patch.object(funcoes, 'ocr_imagem', return_value="David R$ 150,00 05/02/2026") as ocr:
+            texto = funcoes.extrair_texto_pdf(pdf, {"David": "4"}, max_workers=1)
+        self.assertEqual(ocr.call_count, 1)
+        linhas = [linha for linha in texto.splitlines() if linha]
+        self.assertEqual(linhas, ["Extrato bancario - conta corrente", "David R$ 150,00 05/02/2026"])
+
+
+
+class ExtracaoLoteTests(unittest.TestCase):
+    def test_extrai_em_paralelo_mantendo_ordem_e_isolando_falhas(self):
+        def extrair(file_bytes, file_ext, moradores_map):
+            if file_bytes == b"corrompido":
+                raise ValueError("arquivo inválido")
+            return {'sha256': funcoes.hash_conteudo(file_bytes), 'texto': file_bytes.decode()}
+
+        arquivos = [("a.pdf", "pdf", b"um"), ("b.jpg", "jpg", b"corrompido"), ("c.pdf", "pdf", b"tres")]
+        with mock.patch.object(funcoes, 'extrair_dados_comprovante', side_effect=extrair):
+            resultados = funcoes.extrair_lote(arquivos, {}, max_workers=3)
+
+        self.assertEqual(resultados[0]['texto'], "um")
+        self.assertEqual(resultados[1]['erro'], "b.jpg: arquivo inválido")
+        self.assertEqual(resultados[2]['texto'], "tres")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+import funcoes
+
+
+MORADORES = {"Jéssica": "1", "Felippe": "1", "David": "4", "Inez": "4", "Ana": "2", "Ana Paula": "3"}
+
+
+class ExtratorCamposTests(unittest.TestCase):
+    def test_encontra_morador_sem_acento_e_sem_diferenciar_maiusculas(self):
+        campos = funcoes.extrair_campos_comprovante("PAGADOR: JESSICA SOUZA\nR$ 150,00", MORADORES)
+        self.assertEqual((campos['nome'], campos['apartamento']), ("Jéssica", "1"))
+
+    def test_prioriza_candidatos_proximos_de_palavras_chave(self):
+        texto = (
+            "Tarifa R$ 2,50 em 01/01/2026\n"
+            "Data do pagamento: 05/02/2026\n"
+            "Valor pago: R$ 1.150,00\n"
+            "Favorecido: David\n"
+            "Pagador: Inez"
+        )
+        campos = funcoes.extrair_campos_comprovante(texto, MORADORES)
+        self.assertEqual(campos['valores'], ["1.150,00", "2,50"])
+        self.assertEqual(campos['datas'][0], "05/02/2026")
+        self.assertEqual(campos['nome'], "Inez")
+        self.assertEqual([c['nome'] for c in campos['candidatos']['moradores']], ["Inez", "David"])
+
+    def test_nomes_respeitam_limites_de_palavra_e_preferem_o_mais_longo(self):
+        campos = funcoes.extrair_campos_comprovante("Pagador: Ana Paula  Davidson", MORADORES)
+        self.assertEqual([c['nome'] for c in campos['candidatos']['moradores']], ["Ana Paula"])
+
+    def test_ignora_datas_invalidas(self):
+        campos = funcoes.extrair_campos_comprovante("Doc 31/02/2026 pago em 10/02/2026", {})
+        self.assertEqual(campos['datas'], ["10/02/2026"])
+        self.assertIsNone(campos['nome'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+import funcoes
+
+
+PLANILHA = os.path.join(os.path.dirname(__file__), '..', 'planilhas', 'Contabilidade Condominio.xlsx')
+
+def _cotas(saldos_por_apartamento, ano=2026):
+    linhas = []
+    for apartamento, saldos in saldos_por_apartamento.items():
+        for mes, saldo in enumerate(saldos, start=1):
+            linhas.append({
+                'Apartamento': apartamento,
+                'Mês Referência': f"{mes:02d}/{ano}",
+                'Valor Pago': saldo,
+                'month_num': mes,
+                'Ano': ano,
+                'sort_date': pd.Timestamp(ano, mes, 1),
+            })
+    return pd.DataFrame(linhas)
+
+
+class InadimplenciaTests(unittest.TestCase):
+    def test_conta_meses_consecutivos_em_debito_por_apartamento(self):
+        df = _cotas({
+            'AP01': [0, 0, 0],
+            'AP02': [150, -150, -300],
+            'AP03': [-150, 0, -150],
+            'AP04': [-150, -300, -450],
+        })
+        historico, resumo = funcoes.calcular_inadimplencia(df)
+
+        atraso = historico.groupby('Apartamento')['Meses em Atraso'].apply(list).to_dict()
+        self.assertEqual(atraso, {'AP01': [0, 0, 0], 'AP02': [0, 1, 2], 'AP03': [1, 0, 1], 'AP04': [1, 2, 3]})
+
+        resumo = resumo.set_index('Apartamento')
+        self.assertEqual(resumo.loc['AP02', 'Débito'], 300)
+        self.assertEqual(resumo['Faixa'].to_dict(), {'AP01': "Em dia", 'AP02': "2-3 meses", 'AP03': "1 mês", 'AP04': "2-3 meses"})
+
+    def test_le_bloco_de_cotas_de_todas_as_abas(self):
+        df = funcoes.load_cotas_todos_anos(PLANILHA)
+        self.assertEqual(sorted(df['Ano'].unique()), [2026])
+        self.assertEqual(sorted(df['Apartamento'].unique()), ['AP01', 'AP02', 'AP03', 'AP04'])
+        self.assertTrue(df['sort_date'].notna().all())
+
+    def test_cache_por_aba_so_rele_a_aba_alterada(self):
+        def ler(excel_path, sheet_name):
+            return _cotas({'AP01': [100.0]}, ano=int(sheet_name[-4:]))
+
+        with mock.patch.object(funcoes, '_cotas_abas_cache', funcoes.LRUCache(maxsize=8)), \
+                mock.patch.object(funcoes, 'ler_bloco_cotas', side_effect=ler) as ler_bloco:
+            funcoes.load_cotas_todos_anos(PLANILHA, {'Fluxo de caixa 2025': "a", 'Fluxo de caixa 2026': "b"})
+            df = funcoes.load_cotas_todos_anos(PLANILHA, {'Fluxo de caixa 2025': "a", 'Fluxo de caixa 2026': "c"})
+
+        self.assertEqual([c.args[1] for c in ler_bloco.call_args_list],
+                         ['Fluxo de caixa 2025', 'Fluxo de caixa 2026', 'Fluxo de caixa 2026'])
+        self.assertEqual(df['Ano'].tolist(), [2025, 2026])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import funcoes
+
+
+class LedgerTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.ledger_path = os.path.join(self._tmp.name, 'lancamentos.db')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_registra_e_consulta_por_apartamento_mes_e_categoria(self):
+        cotas = 'Cotas Condominiais (Até dia 08)'
+        funcoes.registrar_lancamento("05/02/2026", "150,00", cotas, apartamento=4, morador="David", ledger_path=self.ledger_path)
+        funcoes.registrar_lancamento("06/03/2026", "1.150,00", cotas, apartamento="4", ledger_path=self.ledger_path)
+        funcoes.registrar_lancamento("10/02/2026", "81,24", 'Água (venc. Dia 10)', ledger_path=self.ledger_path)
+
+        df = funcoes.consultar_lancamentos(apartamento=4, ano=2026, mes=2, categoria=cotas, ledger_path=self.ledger_path)
+        self.assertEqual(df['valor'].tolist(), [150.0])
+        self.assertEqual(df['data_pagamento'].tolist(), ["2026-02-05"])
+
+        df_todos = funcoes.consultar_lancamentos(ledger_path=self.ledger_path)
+        self.assertEqual(df_todos['valor'].tolist(), [150.0, 81.24, 1150.0])
+
+    def test_ledger_e_somente_inclusao(self):
+        funcoes.registrar_lancamento("05/02/2026", "150,00", "Rendimentos", ledger_path=self.ledger_path)
+        conn = sqlite3.connect(self.ledger_path)
+        try:
+            with self.assertRaises(sqlite3.IntegrityError):
+                conn.execute("UPDATE lancamentos SET valor = 0")
+            with self.assertRaises(sqlite3.IntegrityError):
+                conn.execute("DELETE FROM lancamentos")
+        finally:
+            conn.close()
+
+    def test_rejeita_data_ou_valor_invalidos(self):
+        with self.assertRaises(ValueError):
+            funcoes.registrar_lancamento("2026-02-05", "150,00", "Rendimentos", ledger_path=self.ledger_path)
+        with self.assertRaises(ValueError):
+            funcoes.registrar_lancamento("05/02/2026", "abc", "Rendimentos", ledger_path=self.ledger_path)
+
+    def test_falha_no_livro_caixa_nao_enfileira_o_envio(self):
+        metadados = {'data': "05/02/2026", 'valor': "150,00", 'categoria': "Rendimentos"}
+        with mock.patch.object(funcoes, 'submeter_upload') as submeter, \
+                mock.patch.object(funcoes, 'registrar_lancamento', side_effect=sqlite3.OperationalError("database is locked")):
+            with self.assertRaises(sqlite3.OperationalError):
+                funcoes.lancar_comprovante(b"%PDF", "recibo.pdf", metadados, ledger_path=self.ledger_path)
+        submeter.assert_not_called()
+
+        with mock.patch.object(funcoes, 'submeter_upload') as submeter:
+            job_id = funcoes.lancar_comprovante(b"%PDF", "recibo.pdf", metadados, ledger_path=self.ledger_path)
+        self.assertEqual(submeter.call_args.kwargs['job_id'], job_id)
+        self.assertEqual(funcoes.consultar_lancamentos(ledger_path=self.ledger_path)['job_id'].tolist(), [job_id])
+
+    def test_conexao_e_schema_reaproveitados_na_mesma_thread(self):
+        conn = funcoes._conectar_ledger(self.ledger_path)
+        with mock.patch.object(sqlite3, 'connect') as connect:
+            self.assertIs(funcoes._conectar_ledger(self.ledger_path), conn)
+        connect.assert_not_called()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.styles import PatternFill
+
+import funcoes
+
+
+def _planilha(path):
+    workbook = Workbook()
+    ws = workbook.active
+    ws.title = "Fluxo de caixa 2025"
+    for _ in range(4):
+        ws.append([])
+    ws.append(["Mês", "Janeiro/2025", "Fevereiro/2025", "Março/2025"])
+    ws.append(["SALDO Total (Caixa)", 100, 150.5, None])
+    ws.append([])
+    ws.append(["RECEITAS", "R$ 1.200,50", 0, None])
+    ws.append(["Creditos / Debitos AP"])
+    ws.append(["AP01", 350, -350, None])
+    ws.append(["AP02", None, 0, None])
+    # Linhas e colunas só com formatação (aumentam a dimensão da aba, mas não têm dados)
+    for linha in range(20, 400):
+        ws.cell(row=linha, column=30).fill = PatternFill("solid", fgColor="FFFF00")
+    workbook.create_sheet("TaxaCondominio")
+    workbook.save(path)
+
+
+class LeituraPlanilhaTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "planilha.xlsx")
+        _planilha(self.path)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_le_apenas_a_faixa_usada_em_matriz_float(self):
+        [(aba, ano, meses, categorias, valores)] = funcoes.ler_faixas_planilha(self.path)
+
+        self.assertEqual((aba, ano), ("Fluxo de caixa 2025", 2025))
+        self.assertEqual(meses, ["Janeiro/2025", "Fevereiro/2025", "Março/2025"])
+        self.assertEqual(categorias, ["SALDO Total (Caixa)", None, "RECEITAS", "Creditos / Debitos AP", "AP01", "AP02"])
+        self.assertEqual(valores.dtype, np.float64)
+        self.assertEqual(valores.shape, (6, 3))
+        self.assertEqual(valores[2, 0], 1200.50)
+        self.assertTrue(np.isnan(valores[:, 2]).all())
+
+    def test_fluxo_e_bloco_de_cotas_saem_da_mesma_leitura(self):
+        df, invalidos = funcoes.processar_aba_fluxo(self.path, "Fluxo de caixa 2025", 2025)
+        self.assertEqual(invalidos, [])
+        self.assertEqual(df['Mês'].tolist(), ["Janeiro/2025", "Fevereiro/2025"])
+        self.assertEqual(df['RECEITAS'].tolist(), [1200.50, 0.0])
+        self.assertNotIn("Creditos / Debitos AP", df.columns)
+
+        cotas = funcoes.ler_bloco_cotas(self.path, "Fluxo de caixa 2025")
+        self.assertEqual(cotas[['Apartamento', 'month_num', 'Valor Pago']].values.tolist(),
+                         [["AP01", 1, 350.0], ["AP01", 2, -350.0], ["AP02", 2, 0.0]])
+
+    def test_aba_inexistente_retorna_none(self):
+        self.assertEqual(funcoes.processar_aba_fluxo(self.path, "Fluxo de caixa 2030", 2030), (None, []))
+        # Mesmo erro do pd.read_excel, que as páginas já tratam
+        with self.assertRaisesRegex(ValueError, "Fluxo de caixa 2030"):
+            funcoes.ler_bloco_cotas(self.path, "Fluxo de caixa 2030")
+
+
+if __name__ == "__main__":
+    unittest.main()
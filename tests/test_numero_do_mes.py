@@ -0,0 +1,29 @@
+import unittest
+from datetime import datetime
+
+import funcoes
+
+
+class NumeroDoMesTests(unittest.TestCase):
+    def test_numero_do_mes_for_portuguese_month_names(self):
+        self.assertEqual(funcoes.numero_do_mes("Janeiro/2024"), 1)
+        self.assertEqual(funcoes.numero_do_mes("Março/2024"), 3)
+        self.assertEqual(funcoes.numero_do_mes("2026-06-01 00:00:00"), 6)
+        self.assertEqual(funcoes.numero_do_mes(datetime(2026, 11, 1)), 11)
+
+    def test_numero_do_mes_accepts_abbreviations(self):
+        self.assertEqual(funcoes.numero_do_mes("Fev/26"), 2)
+        self.assertEqual(funcoes.numero_do_mes("Feb/26"), 2)
+        self.assertEqual(funcoes.numero_do_mes("dez"), 12)
+        self.assertEqual(funcoes.numero_do_mes("Mai-2025"), 5)
+
+    def test_numero_do_mes_returns_none_for_invalid_values(self):
+        self.assertIsNone(funcoes.numero_do_mes(""))
+        self.assertIsNone(funcoes.numero_do_mes(None))
+        self.assertIsNone(funcoes.numero_do_mes("Janiero/2026"))
+        self.assertIsNone(funcoes.numero_do_mes("Outras"))
+        self.assertIsNone(funcoes.numero_do_mes("2026"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import io
+import random
+import unittest
+from unittest import mock
+
+from PIL import Image, ImageDraw
+
+import funcoes
+
+
+def _foto_comprovante(tamanho=(4000, 3000), orientacao=None):
+    # Fundo escuro (mesa) com um "papel" claro ao centro, coberto de ruído como uma foto real
+    image = Image.new('RGB', tamanho, (40, 40, 40))
+    draw = ImageDraw.Draw(image)
+    largura, altura = tamanho
+    draw.rectangle((largura // 4, altura // 4, 3 * largura // 4, 3 * altura // 4), fill=(235, 235, 235))
+    rnd = random.Random(0)
+    for _ in range(4000):
+        x, y = rnd.randrange(largura // 4, 3 * largura // 4), rnd.randrange(altura // 4, 3 * altura // 4)
+        draw.line((x, y, x + 30, y), fill=(rnd.randrange(80), 0, 0), width=3)
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientacao:
+        exif[0x0112] = orientacao
+    image.save(buffer, format='JPEG', quality=95, exif=exif)
+    return buffer.getvalue()
+
+
+class OcrEngineTests(unittest.TestCase):
+    def test_ocr_imagem_usa_alternativa_quando_motor_local_falha(self):
+        def tesseract_indisponivel(image_bytes):
+            raise RuntimeError("tesseract is not installed")
+
+        backends = {'tesseract': tesseract_indisponivel, 'ocrspace': lambda image_bytes: "R$ 150,00"}
+        with mock.patch.dict(funcoes.OCR_BACKENDS, backends):
+            self.assertEqual(funcoes.ocr_imagem(b"jpeg", engine="tesseract+ocrspace"), "R$ 150,00")
+
+    def test_ocr_imagem_reune_erros_de_todos_os_motores(self):
+        def falha(image_bytes):
+            raise RuntimeError("fora do ar")
+
+        with mock.patch.dict(funcoes.OCR_BACKENDS, {'tesseract': falha, 'ocrspace': falha}):
+            with self.assertRaisesRegex(Exception, "tesseract: fora do ar; ocrspace: fora do ar"):
+                funcoes.ocr_imagem(b"jpeg", engine="tesseract+ocrspace")
+
+    def test_sem_chave_do_ocr_space_vai_direto_para_o_tesseract(self):
+        ocr_space = mock.Mock(side_effect=AssertionError("não deveria chamar o OCR.space"))
+        backends = {'ocrspace': ocr_space, 'tesseract': lambda image_bytes: "texto local"}
+        with mock.patch.dict(funcoes.OCR_BACKENDS, backends), mock.patch.object(funcoes, 'OCR_SPACE_API_KEY', None):
+            self.assertEqual(funcoes.ocr_imagem(b"jpeg", engine="ocrspace+tesseract"), "texto local")
+        ocr_space.assert_not_called()
+
+    def test_ocr_imagem_rejeita_motor_desconhecido(self):
+        with self.assertRaises(ValueError):
+            funcoes.ocr_imagem(b"jpeg", engine="easyocr")
+
+
+class PreprocessamentoImagemTests(unittest.TestCase):
+    def test_reduz_resolucao_recorta_bordas_e_converte_para_cinza(self):
+        original = _foto_comprovante()
+        processada = funcoes.preprocessar_imagem_ocr(original)
+
+        self.assertLess(len(processada), len(original))
+        with Image.open(io.BytesIO(processada)) as image:
+            self.assertEqual(image.mode, 'L')
+            # O papel ocupa metade da foto; o resto é borda recortada
+            self.assertLessEqual(max(image.size), 1100)
+            self.assertGreaterEqual(max(image.size), 1000)
+
+    def test_aplica_orientacao_exif(self):
+        processada = funcoes.preprocessar_imagem_ocr(_foto_comprovante(orientacao=6))
+        with Image.open(io.BytesIO(processada)) as image:
+            largura, altura = image.size
+        self.assertGreater(altura, largura)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+
+import funcoes
+
+
+class _FakeOcrSpace(BaseHTTPRequestHandler):
+    # Cada requisição consome a próxima resposta da fila: (status, corpo JSON, atraso em segundos)
+    respostas = []
+    corpos = []
+
+    def do_POST(self):
+        corpo = self.rfile.read(int(self.headers['Content-Length']))
+        type(self).corpos.append(corpo)
+        status, resposta, atraso = type(self).respostas.pop(0)
+        time.sleep(atraso)
+        dados = json.dumps(resposta).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+def _ok(texto):
+    return 200, {'IsErroredOnProcessing': False, 'ParsedResults': [{'ParsedText': texto}]}, 0
+
+
+class OcrSpaceClienteTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeOcrSpace)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/parse/image"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _FakeOcrSpace.respostas = []
+        _FakeOcrSpace.corpos = []
+        estado = {'fichas': float(funcoes.OCR_SPACE_RAJADA), 'fichas_em': time.monotonic(), 'falhas': 0, 'aberto_ate': 0.0}
+        for patcher in (
+            mock.patch.dict(funcoes._ocr_space_estado, estado),
+            mock.patch.object(funcoes, 'OCR_SPACE_URL', self.url),
+            mock.patch.object(funcoes, 'OCR_SPACE_API_KEY', 'chave-do-plano'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_usa_a_chave_configurada_e_repete_falhas_transitorias(self):
+        _FakeOcrSpace.respostas = [(503, {}, 0), _ok("R$ 150,00")]
+
+        self.assertEqual(funcoes.ocr_space_api(b"jpeg", espera_base=0), "R$ 150,00")
+        self.assertEqual(len(_FakeOcrSpace.corpos), 2)
+        self.assertIn(b"chave-do-plano", _FakeOcrSpace.corpos[0])
+        self.assertNotIn(b"helloworld", _FakeOcrSpace.corpos[0])
+
+    def test_resposta_sem_resultados_falha_sem_repetir(self):
+        _FakeOcrSpace.respostas = [(200, {'IsErroredOnProcessing': False, 'ParsedResults': []}, 0), (400, {}, 0)]
+        funcoes._ocr_space_estado['falhas'] = 2
+
+        with self.assertRaisesRegex(Exception, "ParsedResults vazio"):
+            funcoes.ocr_space_api(b"jpeg", espera_base=0)
+        with self.assertRaises(requests.HTTPError):
+            funcoes.ocr_space_api(b"jpeg", espera_base=0)
+        self.assertEqual(len(_FakeOcrSpace.corpos), 2)
+        # Imagem ilegível não conta como falha do serviço, mas também não zera as anteriores
+        self.assertEqual(funcoes._ocr_space_estado['falhas'], 2)
+
+    def test_servidor_lento_estoura_o_tempo_de_leitura(self):
+        _FakeOcrSpace.respostas = [(200, {}, 1.0)]
+
+        inicio = time.monotonic()
+        with mock.patch.object(funcoes, 'OCR_SPACE_TIMEOUT_LEITURA', 0.2), \
+                mock.patch.object(funcoes, 'OCR_SPACE_MAX_TENTATIVAS', 1):
+            with self.assertRaises(requests.Timeout):
+                funcoes.ocr_space_api(b"jpeg")
+        self.assertLess(time.monotonic() - inicio, 1.0)
+
+    def test_disjuntor_aberto_falha_na_hora_para_o_motor_local(self):
+        _FakeOcrSpace.respostas = [(503, {}, 0), (503, {}, 0)]
+
+        with mock.patch.object(funcoes, 'OCR_SPACE_FALHAS_DISJUNTOR', 2), \
+                mock.patch.object(funcoes, 'OCR_SPACE_MAX_TENTATIVAS', 1), \
+                mock.patch.dict(funcoes.OCR_BACKENDS, {'tesseract': lambda image_bytes: "texto local"}):
+            for _ in range(2):
+                with self.assertRaises(requests.HTTPError):
+                    funcoes.ocr_space_api(b"jpeg")
+            texto = funcoes.ocr_imagem(b"jpeg", engine="ocrspace+tesseract")
+
+        self.assertEqual(texto, "texto local")
+        self.assertEqual(len(_FakeOcrSpace.corpos), 2)
+
+    def test_balde_de_fichas_recusa_quando_a_espera_passa_do_limite(self):
+        _FakeOcrSpace.respostas = [_ok("primeiro")]
+
+        with mock.patch.object(funcoes, 'OCR_SPACE_RAJADA', 1), \
+                mock.patch.object(funcoes, 'OCR_SPACE_LIMITE_POR_MINUTO', 6), \
+                mock.patch.object(funcoes, 'OCR_SPACE_ESPERA_MAX', 1.0):
+            funcoes._ocr_space_estado['fichas'] = 1.0
+            self.assertEqual(funcoes.ocr_space_api(b"jpeg"), "primeiro")
+            with self.assertRaisesRegex(Exception, "Limite de requisições"):
+                funcoes.ocr_space_api(b"jpeg")
+        self.assertEqual(len(_FakeOcrSpace.corpos), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import funcoes
+
+
+class OutboxTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.outbox_dir = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_enfileirar_upload_grava_arquivo_e_registro_pendente(self):
+        job_id = funcoes.enfileirar_upload(b"%PDF", "20260105_recibo.pdf", folder_id="pasta", outbox_dir=self.outbox_dir)
+
+        job = funcoes.status_upload(job_id, self.outbox_dir)
+        self.assertEqual(job['status'], 'pendente')
+        self.assertTrue(job['payload'].endswith('.pdf'))
+        with open(os.path.join(self.outbox_dir, job['payload']), 'rb') as f:
+            self.assertEqual(f.read(), b"%PDF")
+
+    def test_processar_upload_conclui_e_remove_arquivo_local(self):
+        job_id = funcoes.enfileirar_upload(b"img", "recibo.jpg", outbox_dir=self.outbox_dir)
+
+        def uploader(path, nome, folder_id=None, log=print):
+            log("enviando")
+            return "drive-1", f"https://drive/{nome}"
+
+        job = funcoes.processar_upload(job_id, self.outbox_dir, uploader=uploader)
+        self.assertEqual(job['status'], 'concluido')
+        self.assertEqual((job['drive_id'], job['link']), ("drive-1", "https://drive/recibo.jpg"))
+        self.assertFalse(os.path.exists(os.path.join(self.outbox_dir, job['payload'])))
+
+    def test_processar_upload_marca_erro_apos_esgotar_tentativas(self):
+        job_id = funcoes.enfileirar_upload(b"img", "recibo.jpg", outbox_dir=self.outbox_dir)
+
+        def uploader(path, nome, folder_id=None, log=print):
+            raise RuntimeError("Drive indisponível")
+
+        job = funcoes.processar_upload(job_id, self.outbox_dir, uploader=uploader, espera_base=0)
+        self.assertEqual(job['status'], 'erro')
+        self.assertEqual(job['tentativas'], funcoes.UPLOAD_MAX_TENTATIVAS)
+        self.assertEqual(job['erro'], "Drive indisponível")
+        self.assertEqual([j['id'] for j in funcoes.listar_uploads(self.outbox_dir)], [job_id])
+
+    def test_envio_interrompido_na_ultima_tentativa_e_retomado(self):
+        job_id = funcoes.enfileirar_upload(b"img", "recibo.jpg", outbox_dir=self.outbox_dir)
+        funcoes._atualizar_job(job_id, self.outbox_dir, status='enviando', tentativas=funcoes.UPLOAD_MAX_TENTATIVAS)
+
+        job = funcoes.processar_upload(job_id, self.outbox_dir, uploader=lambda *args, **kwargs: ("drive-ok", "https://drive/ok"))
+        self.assertEqual((job['status'], job['tentativas']), ('concluido', funcoes.UPLOAD_MAX_TENTATIVAS))
+
+    def test_reenviar_so_agenda_jobs_com_erro(self):
+        job_id = funcoes.enfileirar_upload(b"img", "recibo.jpg", outbox_dir=self.outbox_dir)
+        executor = mock.Mock()
+
+        self.assertEqual(funcoes.reenviar_upload(job_id, self.outbox_dir, executor)['status'], 'pendente')
+        executor.submit.assert_not_called()
+
+        funcoes._atualizar_job(job_id, self.outbox_dir, status='erro', tentativas=3, erro="falhou")
+        job = funcoes.reenviar_upload(job_id, self.outbox_dir, executor)
+        self.assertEqual((job['status'], job['tentativas'], job['erro']), ('pendente', 0, None))
+        executor.submit.assert_called_once_with(funcoes.processar_upload, job_id, self.outbox_dir)
+
+    def test_duplicado_so_conta_na_pasta_do_mesmo_condominio(self):
+        ledger_path = os.path.join(self._tmp.name, "lancamentos.db")
+        sha256 = funcoes.hash_conteudo(b"%PDF")
+        self.assertIsNone(funcoes.buscar_upload_por_hash(sha256, "pasta_a", ledger_path, self.outbox_dir))
+
+        job_id = funcoes.enfileirar_upload(b"%PDF", "recibo.pdf", folder_id="pasta_a", outbox_dir=self.outbox_dir)
+        funcoes.registrar_lancamento("05/02/2026", "150,00", "Rendimentos", sha256=sha256, job_id=job_id,
+                                     ledger_path=ledger_path)
+
+        self.assertEqual(funcoes.buscar_upload_por_hash(sha256, "pasta_a", ledger_path, self.outbox_dir)['id'], job_id)
+        self.assertIsNone(funcoes.buscar_upload_por_hash(sha256, "pasta_b", ledger_path, self.outbox_dir))
+
+        # Só o job do lançamento com esse conteúdo é lido; o restante da outbox não
+        funcoes.enfileirar_upload(b"outro", "outro.pdf", folder_id="pasta_a", outbox_dir=self.outbox_dir)
+        with mock.patch.object(funcoes, 'status_upload', wraps=funcoes.status_upload) as status:
+            funcoes.buscar_upload_por_hash(sha256, "pasta_a", ledger_path, self.outbox_dir)
+        status.assert_called_once_with(job_id, self.outbox_dir)
+
+        funcoes._atualizar_job(job_id, self.outbox_dir, status='erro')
+        self.assertIsNone(funcoes.buscar_upload_por_hash(sha256, "pasta_a", ledger_path, self.outbox_dir))
+
+    def test_nomes_gerados_no_mesmo_segundo_sao_unicos(self):
+        momento = datetime(2026, 2, 5, 10, 30, 0)
+        nomes = {funcoes.gerar_nome_comprovante("recibo pix.jpg", momento) for _ in range(50)}
+        self.assertEqual(len(nomes), 50)
+        self.assertTrue(all(n.startswith("20260205_103000_") and n.endswith("_recibopix.jpg") for n in nomes))
+
+
+if __name__ == "__main__":
+    unittest.main()
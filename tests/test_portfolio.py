@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import funcoes
+
+
+PLANILHAS = os.path.join(os.path.dirname(__file__), '..', 'planilhas')
+
+
+class PortfolioTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.predio_a = os.path.join(self._tmp.name, 'predio_a.xlsx')
+        self.predio_b = os.path.join(self._tmp.name, 'predio_b.xlsx')
+        shutil.copy(os.path.join(PLANILHAS, 'Contabilidade Condominio.xlsx'), self.predio_a)
+        shutil.copy(os.path.join(PLANILHAS, 'Contabilidade Condominio_old.xlsx'), self.predio_b)
+
+        self.registro_path = os.path.join(self._tmp.name, 'condominios.yaml')
+        with open(self.registro_path, 'w', encoding='utf-8') as f:
+            f.write(
+                "condominios:\n"
+                f"  a:\n    nome: Prédio A\n    planilha: '{self.predio_a}'\n"
+                f"  b:\n    nome: Prédio B\n    planilha: '{self.predio_b}'\n"
+                f"  c:\n    nome: Prédio C\n    planilha: '{os.path.join(self._tmp.name, 'nao_existe.xlsx')}'\n"
+            )
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_registro_preenche_valores_padrao(self):
+        registro = funcoes.load_registro_condominios(self.registro_path)
+        self.assertEqual(registro['a']['moradores'], 'moradores.yaml')
+        self.assertEqual(registro['b']['ledger'], os.path.join('dados', 'lancamentos_b.db'))
+        # Sem pasta própria no Drive, o prédio não herda a pasta de outro condomínio
+        self.assertIsNone(registro['a']['drive_folder_id'])
+
+        padrao = funcoes.load_registro_condominios(os.path.join(self._tmp.name, 'sem_registro.yaml'))
+        self.assertEqual(list(padrao), ['padrao'])
+        self.assertEqual(padrao['padrao']['drive_folder_id'], funcoes.DRIVE_FOLDER_ID_PADRAO)
+
+    def test_portfolio_rele_apenas_planilhas_alteradas(self):
+        registro = funcoes.load_registro_condominios(self.registro_path)
+        fluxos = funcoes.carregar_fluxos_condominios(registro)
+        self.assertEqual(sorted(fluxos), ['a', 'b'])
+        self.assertEqual(sorted(fluxos['b']['Ano'].unique()), [2024, 2025])
+
+        resumo = funcoes.resumo_portfolio(fluxos, registro).set_index('Condomínio')
+        self.assertAlmostEqual(resumo.loc['Prédio B', 'Saldo Atual'], 3473.87)
+
+        os.utime(self.predio_a, ns=(0, 0))
+        with mock.patch.object(funcoes, 'ler_em_paralelo', wraps=funcoes.ler_em_paralelo) as ler:
+            funcoes.carregar_fluxos_condominios(registro)
+        self.assertEqual(ler.call_args.args[1], [(self.predio_a,)])
+
+    def test_cache_limitado_descarta_planilhas_menos_usadas(self):
+        registro = funcoes.load_registro_condominios(self.registro_path)
+        with mock.patch.object(funcoes, '_fluxo_condominios_cache', funcoes.LRUCache(maxsize=1)):
+            fluxos = funcoes.carregar_fluxos_condominios(registro)
+            self.assertEqual(sorted(fluxos), ['a', 'b'])
+            self.assertEqual(len(funcoes._fluxo_condominios_cache), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
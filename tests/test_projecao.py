@@ -0,0 +1,45 @@
+import unittest
+
+import pandas as pd
+
+import funcoes
+
+
+def _historico(meses=6, cotas=600.0, despesas=400.0, saldo_final=1000.0):
+    datas = pd.date_range('2026-01-01', periods=meses, freq='MS')
+    df = pd.DataFrame({
+        'sort_date': datas,
+        'Cotas Condominiais (Até dia 08)': cotas,
+        'Rendimentos': 0.0,
+        'DESPESAS VARIÁVEIS': despesas,
+        'DESPESAS EXTRAS': 0.0,
+        'Obras': 0.0,
+        'SALDO Total (Caixa)': saldo_final,
+    })
+    # Meses futuros zerados, como na planilha, não entram na base
+    futuro = pd.DataFrame({'sort_date': pd.date_range('2026-07-01', periods=3, freq='MS'), 'SALDO Total (Caixa)': 0.0})
+    return pd.concat([df, futuro], ignore_index=True).fillna(0.0)
+
+
+class ProjecaoFluxoCaixaTests(unittest.TestCase):
+    def test_cenario_sem_incerteza_segue_media_historica(self):
+        projecao = funcoes.projetar_fluxo_caixa(_historico(), meses=3, n_cenarios=200, seed=1)
+        self.assertEqual(projecao['sort_date'].dt.strftime('%Y-%m').tolist(), ['2026-07', '2026-08', '2026-09'])
+        self.assertEqual(projecao['P5'].tolist(), [1200.0, 1400.0, 1600.0])
+        self.assertEqual(projecao['P95'].tolist(), [1200.0, 1400.0, 1600.0])
+        self.assertTrue((projecao['Prob. Saldo Negativo'] == 0).all())
+
+    def test_reajuste_obra_e_inadimplencia_deslocam_o_saldo(self):
+        projecao = funcoes.projetar_fluxo_caixa(
+            _historico(), meses=2, n_cenarios=200, reajuste_cota=0.5,
+            custo_obras=2000.0, mes_obras=1, variacao_obras=0.0, seed=1
+        )
+        self.assertEqual(projecao['P50'].tolist(), [1000 + 900 - 400 - 2000, 1000 + 2 * 500 - 2000])
+        self.assertEqual(projecao['Prob. Saldo Negativo'].tolist(), [1.0, 0.0])
+
+        sem_pagamentos = funcoes.projetar_fluxo_caixa(_historico(), meses=1, n_cenarios=100, taxa_inadimplencia=1.0, seed=1)
+        self.assertEqual(sem_pagamentos['P50'].tolist(), [600.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
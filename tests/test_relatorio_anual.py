@@ -0,0 +1,93 @@
+import io
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz
+import pandas as pd
+from openpyxl import load_workbook
+
+import funcoes
+
+
+def _fluxo_ano():
+    return pd.DataFrame({
+        'Mês': ["Janeiro/2025", "Fevereiro/2025", "Março/2025"],
+        'Período': ["Jan-2025", "Feb-2025", "Mar-2025"],
+        'sort_date': pd.to_datetime(["2025-01-01", "2025-02-01", "2025-03-01"]),
+        'Ano': 2025,
+        'SALDO Total (Caixa)': [1000.0, 1200.0, None],
+        'RECEITAS': [600.0, 650.0, 0.0],
+        'DESPESAS VARIÁVEIS': [300.0, 250.0, 0.0],
+        'DESPESAS EXTRAS': [100.0, 0.0, 0.0],
+        'Cotas Condominiais (Até dia 08)': [600.0, 600.0, 0.0],
+        'Rendimentos': [0.0, 50.0, 0.0],
+        'Faxina ': [200.0, 200.0, 0.0],
+        'Obras': [100.0, 0.0, 0.0],
+    })
+
+
+class RelatorioAnualTests(unittest.TestCase):
+    def setUp(self):
+        self.dados = funcoes.dados_relatorio_anual(
+            _fluxo_ano(), ['Cotas Condominiais (Até dia 08)', 'Rendimentos'], ['Faxina ', 'Obras', 'Consertos'],
+            titulo="Prestação de Contas 2025 - Teste"
+        )
+
+    def test_agrega_com_as_regras_do_dashboard(self):
+        self.assertEqual(self.dados['resumo'], {'Total de Receitas': 1250.0, 'Total de Despesas': 650.0, 'Saldo Final': 1200.0})
+        self.assertEqual(self.dados['mensal']['Período'].tolist(), ["Jan-2025", "Feb-2025"])
+        self.assertEqual(self.dados['despesas'].values.tolist(), [["Faxina", 400.0], ["Obras", 100.0]])
+
+    def test_xlsx_tem_tabelas_e_graficos(self):
+        workbook = load_workbook(io.BytesIO(funcoes.gerar_relatorio_xlsx(self.dados)))
+        self.assertEqual(workbook.sheetnames, ["Resumo", "Categorias"])
+        resumo = workbook["Resumo"]
+        self.assertEqual(resumo["B5"].value, 1200.0)
+        self.assertEqual([c.value for c in resumo[7]], ['Período', 'Receitas', 'Despesas Variáveis', 'Despesas Extras', 'Saldo'])
+        self.assertEqual(len(resumo._charts), 2)
+        self.assertEqual(len(workbook["Categorias"]._charts), 2)
+
+    def test_pdf_tem_titulo_e_tabela_mensal(self):
+        with fitz.open(stream=funcoes.gerar_relatorio_pdf(self.dados)) as doc:
+            self.assertEqual(doc.page_count, 2)
+            self.assertIn("Prestação de Contas 2025 - Teste", doc[0].get_text())
+            self.assertIn("R$ 1.250,00", doc[0].get_text())
+            self.assertIn("Feb-2025", doc[1].get_text())
+
+    def test_relatorio_e_gerado_uma_vez_por_versao_da_planilha(self):
+        with tempfile.TemporaryDirectory() as relatorios_dir, ThreadPoolExecutor(max_workers=1) as executor:
+            caminho = funcoes.caminho_relatorio_anual("planilha.xlsx", (1, 2), 2025, "xlsx", relatorios_dir)
+            self.assertIsNone(funcoes.status_relatorio(caminho))
+
+            funcoes.solicitar_relatorio_anual(self.dados, caminho, executor=executor)
+            funcoes._relatorios_em_andamento[caminho].result(timeout=10)
+            self.assertEqual(funcoes.status_relatorio(caminho), 'pronto')
+            gerado_em = os.path.getmtime(caminho)
+
+            funcoes.solicitar_relatorio_anual(self.dados, caminho, executor=executor)
+            self.assertEqual(os.path.getmtime(caminho), gerado_em)
+            self.assertNotEqual(caminho, funcoes.caminho_relatorio_anual("planilha.xlsx", (1, 3), 2025, "xlsx", relatorios_dir))
+            self.assertNotEqual(
+                funcoes.caminho_relatorio_anual("planilha.xlsx", (1, 2), 2025, "xlsx", relatorios_dir, condominio="Ed. Azul"),
+                funcoes.caminho_relatorio_anual("planilha.xlsx", (1, 2), 2025, "xlsx", relatorios_dir, condominio="Ed. Verde")
+            )
+
+    def test_descarta_relatorios_antigos_e_geracoes_concluidas(self):
+        with tempfile.TemporaryDirectory() as relatorios_dir, ThreadPoolExecutor(max_workers=1) as executor:
+            caminhos = [funcoes.caminho_relatorio_anual("planilha.xlsx", (1, versao), 2025, "xlsx", relatorios_dir)
+                        for versao in range(3)]
+            for posicao, caminho in enumerate(caminhos):
+                funcoes.solicitar_relatorio_anual(self.dados, caminho, executor=executor, limite=2)
+                funcoes._relatorios_em_andamento[caminho].result(timeout=10)
+                os.utime(caminho, (posicao, posicao))
+
+            funcoes.solicitar_relatorio_anual(self.dados, caminhos[0].replace(".xlsx", ".pdf"), executor=executor, limite=2)
+            self.assertEqual([os.path.exists(caminho) for caminho in caminhos], [False, True, True])
+            self.assertEqual(funcoes.status_relatorio(caminhos[0]), None)
+            self.assertFalse(set(caminhos) & set(funcoes._relatorios_em_andamento))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import funcoes
+
+
+def _extracao(texto, chave_texto=None):
+    return {'sha256': "abc123", 'texto': texto, 'chave_texto': chave_texto,
+            'campos': {'valores': ["150,00"], 'datas': [], 'nome': None, 'apartamento': None,
+                       'candidatos': {'moradores': []}}}
+
+
+class UploadSessaoTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp_dir = os.path.join(self._tmp.name, "uploads")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_limite_por_arquivo_e_arquivo_vazio(self):
+        funcoes.validar_tamanho_upload("recibo.pdf", 1024, tamanho_max=1024)
+        with self.assertRaisesRegex(ValueError, "limite é 1 MB"):
+            funcoes.validar_tamanho_upload("grande.pdf", 3 * 1024 * 1024, tamanho_max=1024 * 1024)
+        with self.assertRaisesRegex(ValueError, "está vazio"):
+            funcoes.validar_tamanho_upload("vazio.jpg", 0)
+
+    def test_registro_compacto_guarda_so_a_previa_e_arquivos_grandes_vao_para_o_disco(self):
+        texto = "Pix R$ 150,00 " * 1000
+        pequeno = funcoes.registrar_upload("pix.jpg", b"x" * 100, _extracao(texto), limite_memoria=1024, tmp_dir=self.tmp_dir)
+        grande = funcoes.registrar_upload("boleto.PDF", b"y" * 4096, _extracao(texto), limite_memoria=1024, tmp_dir=self.tmp_dir)
+
+        self.assertEqual(pequeno['bytes'], b"x" * 100)
+        self.assertIsNone(pequeno['caminho'])
+        self.assertLess(len(pequeno['previa']), len(texto))
+        self.assertTrue(pequeno['previa'].endswith(f"[... mais {len(texto) - funcoes.UPLOAD_PREVIA_CARACTERES} caracteres]"))
+        self.assertEqual(pequeno['caracteres'], len(texto))
+        self.assertNotIn('texto', pequeno)
+
+        self.assertIsNone(grande['bytes'])
+        self.assertEqual((grande['ext'], grande['tamanho']), ("pdf", 4096))
+        self.assertEqual(funcoes.bytes_upload(grande), b"y" * 4096)
+        funcoes.descartar_upload(grande)
+        self.assertFalse(os.path.exists(grande['caminho']))
+        with self.assertRaisesRegex(Exception, "expirou"):
+            funcoes.bytes_upload(grande)
+
+    def test_texto_completo_vem_do_cache_ou_e_extraido_de_novo(self):
+        registro = funcoes.registrar_upload("pix.jpg", b"jpeg", _extracao("texto completo"), tmp_dir=self.tmp_dir)
+
+        with mock.patch.object(funcoes, 'ler_cache_extracao', return_value=_extracao("texto do cache")), \
+                mock.patch.object(funcoes, 'extrair_dados_comprovante') as extrair:
+            self.assertEqual(funcoes.texto_upload(registro, {}), "texto do cache")
+        extrair.assert_not_called()
+
+        with mock.patch.object(funcoes, 'ler_cache_extracao', return_value=None), \
+                mock.patch.object(funcoes, 'extrair_dados_comprovante', return_value=_extracao("reextraído")) as extrair:
+            self.assertEqual(funcoes.texto_upload(registro, {}), "reextraído")
+        extrair.assert_called_once_with(b"jpeg", "jpg", {})
+
+    def test_texto_de_pdf_lido_com_outros_moradores_e_extraido_de_novo(self):
+        registro = funcoes.registrar_upload("boleto.pdf", b"%PDF", _extracao("texto"), tmp_dir=self.tmp_dir)
+        moradores = {'Inez': "3"}
+        em_cache = _extracao("lido com o mapeamento antigo", chave_texto=funcoes._chave_texto("pdf", {'Ana': "1"}))
+
+        with mock.patch.object(funcoes, 'ler_cache_extracao', return_value=em_cache), \
+                mock.patch.object(funcoes, 'extrair_dados_comprovante', return_value=_extracao("relido")) as extrair:
+            self.assertEqual(funcoes.texto_upload(registro, moradores), "relido")
+        extrair.assert_called_once_with(b"%PDF", "pdf", moradores)
+
+    def test_poda_apaga_so_as_copias_sem_uso(self):
+        ativo = funcoes.registrar_upload("ativo.pdf", b"a" * 4096, _extracao("x"), limite_memoria=1024, tmp_dir=self.tmp_dir)
+        abandonado = funcoes.registrar_upload("velho.pdf", b"v" * 4096, _extracao("x"), limite_memoria=1024, tmp_dir=self.tmp_dir)
+        antigo = time.time() - funcoes.UPLOAD_TMP_IDADE_MAX - 60
+        for registro in (ativo, abandonado):
+            os.utime(registro['caminho'], (antigo, antigo))
+
+        funcoes.manter_upload(ativo)  # A sessão ainda usa este registro
+        funcoes._podar_uploads_temporarios(self.tmp_dir)
+
+        self.assertEqual(funcoes.bytes_upload(ativo), b"a" * 4096)
+        with self.assertRaisesRegex(Exception, "expirou"):
+            funcoes.bytes_upload(abandonado)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from openpyxl import Workbook
+
+import funcoes
+
+
+def _planilha_fluxo(path):
+    workbook = Workbook()
+    ws = workbook.active
+    ws.title = "Fluxo de caixa 2026"
+    ws['B1'] = "Planilha Financeira do Condomínio:"
+    ws.append([])
+    ws.append([])
+    ws.append([])
+    ws.append(["Mês", "Janeiro/2026", "Fevereiro/2026", "Marco/2025", "Fevereiro/2026", "Janiero/2026"])
+    ws.append(["RECEITAS", 4400, "R$ 4.383,10", 4648.93, None, None])
+    ws.append(["Obras", 0, "a confirmar", "#REF!", None, None, 150])
+    ws.append([None, 10, None, None, None, None])
+    ws.append(["Obras", 0, 0, 0, None, None])
+    workbook.create_sheet("TaxaCondominio")["A1"] = "ignorada"
+    workbook.save(path)
+
+
+class ValidacaoPlanilhaTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "planilha.xlsx")
+        _planilha_fluxo(self.path)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_relatorio_aponta_aba_celula_e_motivo(self):
+        relatorio = funcoes.validar_planilha(self.path)
+        problemas = dict(zip(relatorio['Célula'], relatorio['Problema']))
+
+        self.assertEqual(set(relatorio['Aba']), {"Fluxo de caixa 2026"})
+        self.assertIn("Ano do mês diferente", problemas['D5'])
+        self.assertIn("Mês repetido", problemas['E5'])
+        self.assertIn("Mês não reconhecido", problemas['F5'])
+        self.assertEqual(problemas['C6'], "Número armazenado como texto")
+        self.assertIn("Valor não numérico", problemas['C7'])
+        self.assertIn("Erro de fórmula", problemas['D7'])
+        self.assertIn("fora das colunas de mês válidas", problemas['G7'])
+        self.assertIn("sem categoria", problemas['A8'])
+        self.assertEqual(problemas['A9'], "Categoria repetida (já aparece em A7)")
+        self.assertEqual(len(relatorio), 9)
+
+    def test_planilha_do_repositorio_so_tem_a_categoria_repetida_de_2024(self):
+        planilha = os.path.join(os.path.dirname(__file__), "..", "planilhas", "Contabilidade Condominio.xlsx")
+        relatorio = funcoes.validar_planilha(planilha)
+        self.assertEqual(relatorio[['Aba', 'Célula']].values.tolist(), [["Fluxo de caixa 2024", "A24"]])
+
+
+if __name__ == "__main__":
+    unittest.main()